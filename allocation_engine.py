@@ -0,0 +1,930 @@
+"""
+Allocation engine for the Portfolio Manager.
+
+Pure-Python target, tolerance and monthly-buy logic shared by the Streamlit
+app, cron jobs and offline tools. This module must not import streamlit or
+plotly so it stays cheap to import outside a Streamlit session.
+"""
+
+import math
+from bisect import bisect_right
+from datetime import datetime, date
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, List, Mapping, Optional, Tuple
+
+
+# =========================
+# Glide-Path Tables
+# =========================
+# Each lifecycle ladder is a table of phases keyed by the age at which the
+# phase starts; a phase holds until the next one starts. `glide_path` loads the
+# tables into arrays for interpolated and vectorized lookups (it imports this
+# module, so the lookups below import it on first call).
+
+STRATEGY_COLUMNS = ("acc_stocks", "acc_bonds", "acc_gold", "div_stocks", "div_bonds", "div_gold")
+STRATEGY_PHASES = (
+    (0, "Phase: 34–40y - Maximum Growth", (93.0, 4.0, 3.0, 90.0, 7.0, 3.0)),
+    (40, "Phase: 40–45y - Balanced Growth", (91.0, 5.0, 4.0, 88.0, 8.0, 4.0)),
+    (45, "Phase: 45–50y - Defensive Growth", (88.0, 7.0, 5.0, 85.0, 10.0, 5.0)),
+    (50, "Phase: 50–55y - Moderate Protection", (85.0, 9.0, 6.0, 82.0, 12.0, 6.0)),
+    (55, "Phase: 55–60y - Capital Protection", (80.0, 12.0, 8.0, 80.0, 14.0, 6.0)),
+    (60, "Phase: 60–65y - Conservative", (75.0, 15.0, 10.0, 70.0, 18.0, 12.0)),
+    (65, "Phase: 65–67y - Capital Preservation", (70.0, 20.0, 10.0, 60.0, 30.0, 10.0)),
+)
+
+# growth = SPYL / IXUA / VFEA block, EGLN = gold, YCSH = bonds / cash-like 0-1y
+LIFECYCLE_COLUMNS = ("growth", "WTEQ.DE", "VDIV.DE", "JMT.PT", "EDP.PT", "EGLN.UK", "YCSH.DE")
+LIFECYCLE_PHASES = (
+    (0, (77.0, 10.8, 4.5, 1.0, 1.0, 3.0, 2.7)),
+    (40, (74.0, 10.8, 4.5, 1.0, 1.0, 4.0, 4.7)),
+    (45, (70.0, 10.8, 4.5, 1.0, 1.0, 5.0, 7.7)),
+    (50, (66.0, 10.8, 4.5, 1.0, 1.0, 6.0, 10.7)),
+    (55, (60.0, 10.8, 4.5, 1.0, 1.0, 8.0, 14.7)),
+    (60, (54.0, 10.8, 4.5, 1.0, 1.0, 10.0, 18.7)),
+    (65, (47.0, 10.8, 4.5, 1.0, 1.0, 10.0, 25.7)),
+)
+
+KIDS_COLUMNS = ("VWCE.DE", "VAGF.DE")
+KIDS_PHASES = (
+    (0, (100.0, 0.0)),
+    (14, (95.0, 5.0)),
+    (15, (90.0, 10.0)),
+    (16, (85.0, 15.0)),
+    (17, (80.0, 20.0)),
+    (18, (70.0, 30.0)),
+)
+
+
+def phase_index(phases: Tuple[Tuple[Any, ...], ...], age: float) -> int:
+    """Index of the phase in effect at `age` (ages below the first phase use it)."""
+    return max(0, bisect_right([phase[0] for phase in phases], age) - 1)
+
+
+# --- UTILITY: Lifecycle Strategy ---
+def get_lifecycle_strategy(birth_date_str, mode: str = "step"):
+    """
+    Calculates age and returns the strategic allocation based on Lifecycle Phase.
+
+    Weights come from `glide_path.STRATEGY_GLIDE`; `mode` is step (the
+    original ladder), linear or smooth.
+    """
+    from glide_path import STRATEGY_GLIDE
+
+    try:
+        birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
+        today = date.today()
+        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+    except (ValueError, TypeError):
+        age = 34 # Default fallback
+
+    phase = STRATEGY_PHASES[int(STRATEGY_GLIDE.phase_at(age)[0])][1]
+    weights = STRATEGY_GLIDE.targets(age, mode)
+    return {
+        'age': age,
+        'phase': phase,
+        'acc': {'stocks': weights['acc_stocks'], 'bonds': weights['acc_bonds'], 'gold': weights['acc_gold']},
+        'div': {'stocks': weights['div_stocks'], 'bonds': weights['div_bonds'], 'gold': weights['div_gold']},
+    }
+
+
+def get_kids_targets(age: float, mode: str = "step") -> Dict[str, float]:
+    """
+    VWCE.DE / VAGF.DE split for a child's age: all equity up to 13, 70/30 from 18.
+
+    Weights come from `glide_path.KIDS_GLIDE`; `mode` is step, linear or smooth.
+    """
+    from glide_path import KIDS_GLIDE
+
+    return KIDS_GLIDE.targets(age, mode)
+
+
+# =========================
+# Unified Portfolio Helpers & Allocation Logic
+# =========================
+
+def clamp(value: float, minimum: float, maximum: float) -> float:
+    return max(minimum, min(maximum, value))
+
+
+def round_weights(weights: Dict[str, float], decimals: int = 2) -> Dict[str, float]:
+    return {asset: round(weight, decimals) for asset, weight in weights.items()}
+
+
+def get_lifecycle_targets(age: int) -> Dict[str, float]:
+    """
+    Defines the strategic allocation by age (see `LIFECYCLE_PHASES`).
+
+    growth = SPYL / IXUA / VFEA block
+    EGLN = gold
+    PRAB = bonds / cash-like EUR government bonds 0-1y
+    """
+
+    return dict(zip(LIFECYCLE_COLUMNS, LIFECYCLE_PHASES[phase_index(LIFECYCLE_PHASES, age)][1]))
+
+
+def spyl_level(buffett_index: float) -> int:
+    """SPYL.DE weight inside the growth block for a Buffett value, rounded to a whole percent."""
+
+    SPYL_MIN = 50.0
+    SPYL_MAX = 70.0
+
+    BUFFETT_LOW = 100.0
+    BUFFETT_HIGH = 230.0
+
+    target_spyl = SPYL_MAX - (
+        (buffett_index - BUFFETT_LOW) / (BUFFETT_HIGH - BUFFETT_LOW)
+    ) * (SPYL_MAX - SPYL_MIN)
+
+    return round(clamp(target_spyl, SPYL_MIN, SPYL_MAX))
+
+
+def growth_split_for_level(target_spyl: int) -> Dict[str, float]:
+    """Growth block split for a given SPYL.DE level (see `calculate_growth_split`)."""
+
+    if target_spyl >= 65.0:
+        target_vfea = 10.0
+    elif target_spyl >= 55.0:
+        target_vfea = 12.5
+    else:
+        target_vfea = 15.0
+
+    target_ixua = 100.0 - target_spyl - target_vfea
+
+    return {
+        "SPYL.DE": target_spyl,
+        "IXUA.DE": target_ixua,
+        "VFEA.DE": target_vfea,
+    }
+
+
+def calculate_growth_split(buffett_index: float) -> Dict[str, float]:
+    """
+    Calculates the allocation inside the growth block.
+
+    Buffett <= 100  -> SPYL 70%
+    Buffett ~165    -> SPYL 60%
+    Buffett >= 230  -> SPYL 50%
+
+    VFEA moves in stable steps:
+    - SPYL >= 65 -> VFEA 10%
+    - SPYL >= 55 -> VFEA 12.5%
+    - SPYL < 55 -> VFEA 15%
+    """
+
+    return growth_split_for_level(spyl_level(buffett_index))
+
+
+def _combine_targets(lifecycle: Dict[str, float], growth_split: Dict[str, float]) -> Tuple[Dict[str, float], float]:
+    """Final target weights from a lifecycle phase and a growth split; raises if they do not sum to 100%."""
+
+    growth_weight = lifecycle["growth"]
+
+    spyl_target = round(growth_weight * growth_split["SPYL.DE"] / 100.0, 2)
+    vfea_target = round(growth_weight * growth_split["VFEA.DE"] / 100.0, 2)
+    ixua_target = round(growth_weight - spyl_target - vfea_target, 2)
+
+    targets = {
+        "SPYL.DE": spyl_target,
+        "IXUA.DE": ixua_target,
+        "VFEA.DE": vfea_target,
+        "WTEQ.DE": lifecycle["WTEQ.DE"],
+        "VDIV.DE": lifecycle["VDIV.DE"],
+        "JMT.PT": lifecycle["JMT.PT"],
+        "EDP.PT": lifecycle["EDP.PT"],
+        "EGLN.UK": lifecycle["EGLN.UK"],
+        "YCSH.DE": lifecycle["YCSH.DE"],
+    }
+
+    total = sum(targets.values())
+
+    if abs(total - 100.0) > 0.01:
+        raise ValueError(f"Portfolio targets do not sum to 100%. Total = {total:.2f}%")
+
+    return round_weights(targets, 2), round(total, 2)
+
+
+# =========================
+# Target Table
+# =========================
+# Targets only depend on the lifecycle phase and the SPYL level, so the whole
+# target space (7 phases x 21 levels) is built and validated once at import.
+
+LIFECYCLE_AGE_BOUNDS = tuple(start for start, _ in LIFECYCLE_PHASES[1:])
+SPYL_LEVELS = tuple(range(50, 71))
+
+
+def lifecycle_band(age: float) -> int:
+    """Index of the `get_lifecycle_targets` phase for an age (0 = under 40)."""
+    return bisect_right(LIFECYCLE_AGE_BOUNDS, age)
+
+
+def _build_target_table() -> Tuple[Tuple[Dict[str, Any], ...], ...]:
+    table = []
+    for band in range(len(LIFECYCLE_AGE_BOUNDS) + 1):
+        lifecycle = get_lifecycle_targets(LIFECYCLE_AGE_BOUNDS[band - 1] if band else 0)
+        row = []
+        for level in SPYL_LEVELS:
+            growth_split = growth_split_for_level(level)
+            targets, total = _combine_targets(lifecycle, growth_split)
+            row.append({
+                "lifecycle": MappingProxyType(lifecycle),
+                "growth_split": MappingProxyType(growth_split),
+                "targets": MappingProxyType(targets),
+                "total": total,
+            })
+        table.append(tuple(row))
+    return tuple(table)
+
+
+TARGET_TABLE = _build_target_table()
+
+
+def lookup_targets(age: float, buffett_index: float) -> Mapping[str, float]:
+    """
+    O(1) read-only target weights for an (age, buffett_index) pair.
+
+    The mapping is shared by every caller; copy it with `dict()` before changing it.
+    """
+    return TARGET_TABLE[lifecycle_band(age)][spyl_level(buffett_index) - SPYL_LEVELS[0]]["targets"]
+
+
+def calculate_portfolio_targets(age: int, buffett_index: float) -> Dict[str, Any]:
+    """
+    Calculates final portfolio target weights.
+
+    Returns:
+    - lifecycle allocation
+    - growth split
+    - final portfolio target weights
+    """
+
+    entry = TARGET_TABLE[lifecycle_band(age)][spyl_level(buffett_index) - SPYL_LEVELS[0]]
+
+    return {
+        "age": age,
+        "buffett_index": buffett_index,
+        "lifecycle": dict(entry["lifecycle"]),
+        "growth_split": dict(entry["growth_split"]),
+        "targets": dict(entry["targets"]),
+        "total": entry["total"],
+    }
+
+
+TOLERANCE_PP = {
+    "SPYL.DE": 3.0,
+    "IXUA.DE": 3.0,
+    "VFEA.DE": 1.5,
+    "WTEQ.DE": 2.0,
+    "VDIV.DE": 2.0,
+    "JMT.PT": 1.0,
+    "EDP.PT": 1.0,
+    "EGLN.UK": 1.0,
+    "YCSH.DE": 0.5,
+}
+
+
+def calculate_egln_prab_transition_plan(
+    portfolio_value: float,
+    monthly_contribution: float,
+    current_egln_value: float = 0.0,
+    current_prab_value: float = 0.0,
+    months: int = 4,
+    egln_target_pct: float = 3.0,
+    prab_target_pct: float = 2.7,
+    min_order_size: float = 5.0,
+):
+    plan = []
+
+    egln_value = current_egln_value
+    prab_value = current_prab_value
+    current_portfolio_value = portfolio_value
+
+    for month in range(1, months + 1):
+        portfolio_after_contribution = current_portfolio_value + monthly_contribution
+
+        egln_target_value = portfolio_after_contribution * egln_target_pct / 100.0
+        prab_target_value = portfolio_after_contribution * prab_target_pct / 100.0
+
+        months_left = months - month + 1
+
+        egln_gap = max(0.0, egln_target_value - egln_value)
+        prab_gap = max(0.0, prab_target_value - prab_value)
+
+        egln_buy = egln_gap / months_left
+        prab_buy = prab_gap / months_left
+
+        if egln_buy < min_order_size:
+            egln_buy = 0.0
+
+        if prab_buy < min_order_size:
+            prab_buy = 0.0
+
+        # From the rounded orders, so the month never spends more than the contribution
+        remaining_for_normal_strategy = monthly_contribution - round(egln_buy, 2) - round(prab_buy, 2)
+
+        egln_value += egln_buy
+        prab_value += prab_buy
+        current_portfolio_value = portfolio_after_contribution
+
+        plan.append({
+            "month": month,
+            "portfolio_after_contribution": round(portfolio_after_contribution, 2),
+            "egln_buy": round(egln_buy, 2),
+            "prab_buy": round(prab_buy, 2),
+            "remaining_for_normal_strategy": round(remaining_for_normal_strategy, 2),
+            "egln_value_after_buy": round(egln_value, 2),
+            "prab_value_after_buy": round(prab_value, 2),
+            "egln_target_value": round(egln_target_value, 2),
+            "prab_target_value": round(prab_target_value, 2),
+        })
+
+    return plan
+
+
+def exclude_defensive_targets(targets: Mapping[str, float]) -> Dict[str, float]:
+    """Zeroes EGLN.UK/YCSH.DE and rescales the other targets back to 100%."""
+    targets = dict(targets)
+    def_sum = targets.get("EGLN.UK", 0.0) + targets.get("YCSH.DE", 0.0)
+    remaining_sum = 100.0 - def_sum
+    for asset in list(targets.keys()):
+        if asset in ("EGLN.UK", "YCSH.DE"):
+            targets[asset] = 0.0
+        elif remaining_sum > 0:
+            targets[asset] = (targets[asset] / remaining_sum) * 100.0
+    return targets
+
+
+# Euronext Lisbon orders below this amount are not worth the broker fee
+PT_MIN_ORDER = 5.0
+
+
+def min_order_for(ticker: str, min_order_size: float = 5.0) -> float:
+    """Smallest order allowed for `ticker` (`.PT` listings need at least PT_MIN_ORDER)."""
+    if ticker.upper().endswith(".PT"):
+        return max(min_order_size, PT_MIN_ORDER)
+    return min_order_size
+
+
+def allocate_orders(
+    raw_buys: Dict[str, float],
+    budget: float,
+    min_order_size: float = 5.0,
+    invest_cents: bool = True,
+    pt_minimum: bool = True,
+) -> Tuple[Dict[str, float], float]:
+    """
+    Rounds proportional buys into whole-euro orders (largest-remainder method).
+
+    Rules:
+    - Orders below `min_order_for(ticker, min_order_size)` are dropped and
+      their share is spread proportionally over the remaining orders
+      (`pt_minimum=False` applies `min_order_size` to `.PT` listings too);
+      the minimum is checked again after rescaling to a short budget.
+    - The remaining raw buys are rescaled to the whole `budget`, also when
+      they add up to less; pass their sum as `budget` to keep the rest as
+      leftover cash.
+    - Every order is floored to whole euros; the euros lost to flooring go,
+      one each, to the orders with the largest fractional remainder (ties go
+      to the earlier key).
+    - The cents left over go to the order furthest below its raw amount
+      (or stay as leftover cash when `invest_cents` is False).
+    - Every order ends within €1 of its (rescaled) raw amount.
+
+    Returns (orders in the `raw_buys` key order, leftover cash). Runs in
+    O(n log n) and is shared by every portfolio type.
+    """
+
+    orders = {ticker: 0.0 for ticker in raw_buys}
+    budget_cents = round(budget * 100)
+
+    def minimum(ticker: str) -> float:
+        return min_order_for(ticker, min_order_size) if pt_minimum else min_order_size
+
+    eligible = [ticker for ticker, amount in raw_buys.items() if amount > 0 and amount >= minimum(ticker)]
+
+    while True:
+        total_raw = sum(raw_buys[ticker] for ticker in eligible)
+        if not eligible or total_raw <= 0 or budget_cents <= 0:
+            return orders, round(budget, 2)
+
+        # Raw buys rescaled to the budget, in cents; rounded to micro-cents so that
+        # float noise (e.g. from incremental sums) cannot break remainder ties
+        scaled = [round(raw_buys[ticker] * budget_cents / total_raw, 6) for ticker in eligible]
+        # A short budget can shrink an order below its minimum: drop it and rescale
+        kept = [ticker for ticker, value in zip(eligible, scaled) if value >= 100 * minimum(ticker)]
+        if len(kept) == len(eligible):
+            break
+        eligible = kept
+
+    euros = [int(value // 100) for value in scaled]
+    remainders = [value - 100 * whole for value, whole in zip(scaled, euros)]
+
+    missing_euros = (budget_cents - 100 * sum(euros)) // 100
+    by_remainder = sorted(range(len(eligible)), key=lambda i: -remainders[i])
+    for i in by_remainder[:missing_euros]:
+        euros[i] += 1
+
+    cents = [100 * whole for whole in euros]
+    left_cents = budget_cents - sum(cents)
+    if invest_cents and left_cents > 0:
+        residuals = [value - whole for value, whole in zip(scaled, cents)]
+        cents[residuals.index(max(residuals))] += left_cents
+        left_cents = 0
+
+    for ticker, amount in zip(eligible, cents):
+        orders[ticker] = amount / 100
+
+    return orders, left_cents / 100
+
+
+def calculate_monthly_buys(
+    age: int,
+    buffett_index: float,
+    current_values: Dict[str, float],
+    monthly_contribution: float,
+    min_order_size: float = 5.0,
+    exclude_defensive: bool = False,
+) -> Dict[str, Any]:
+    """
+    Calculates how to allocate the monthly contribution.
+
+    Rules:
+    - Never sell.
+    - Only buy assets below their tolerance band.
+    - Ignore orders below min_order_size (€5 for .PT listings).
+    - Round to whole euros with `allocate_orders`; leftover cash is returned.
+    """
+
+    targets = lookup_targets(age, buffett_index)
+
+    if exclude_defensive:
+        targets = exclude_defensive_targets(targets)
+
+    all_assets = list(targets.keys())
+
+    portfolio_value = sum(current_values.get(asset, 0.0) for asset in all_assets)
+
+    if portfolio_value < 0:
+        raise ValueError("Portfolio value cannot be negative.")
+
+    if monthly_contribution <= 0:
+        raise ValueError("Monthly contribution must be positive.")
+
+    # If portfolio is empty, buy according to target weights
+    if portfolio_value == 0:
+        raw_buys = {
+            asset: monthly_contribution * targets[asset] / 100.0
+            for asset in all_assets
+        }
+
+        buys, leftover_cash = allocate_orders(raw_buys, monthly_contribution, min_order_size)
+
+        return {
+            "age": age,
+            "buffett_index": buffett_index,
+            "portfolio_value_before": 0.0,
+            "monthly_contribution": round(monthly_contribution, 2),
+            "portfolio_value_after": round(monthly_contribution, 2),
+            "portfolio_targets": dict(targets),
+            "current_weights": {asset: 0.0 for asset in all_assets},
+            "raw_buys": round_weights(raw_buys, 2),
+            "buys": round_weights(buys, 2),
+            "leftover_cash": round(leftover_cash, 2),
+        }
+
+    # Current weights before contribution
+    current_weights = {
+        asset: current_values.get(asset, 0.0) / portfolio_value * 100.0
+        for asset in all_assets
+    }
+
+    # Portfolio value after new contribution
+    new_total_value = portfolio_value + monthly_contribution
+
+    # Target value after contribution
+    target_values_after_contribution = {
+        asset: new_total_value * targets[asset] / 100.0
+        for asset in all_assets
+    }
+
+    # Value gaps to target
+    value_gaps = {
+        asset: max(
+            0.0,
+            target_values_after_contribution[asset] - current_values.get(asset, 0.0)
+        )
+        for asset in all_assets
+    }
+
+    # Percentage gaps before contribution
+    percentage_gaps = {
+        asset: max(0.0, targets[asset] - current_weights[asset])
+        for asset in all_assets
+    }
+
+    # Only eligible if below tolerance band
+    eligible_gaps = {
+        asset: value_gaps[asset]
+        for asset in all_assets
+        if percentage_gaps[asset] >= TOLERANCE_PP[asset]
+    }
+
+    total_eligible_gap = sum(eligible_gaps.values())
+
+    if total_eligible_gap > 0:
+        raw_buys = {
+            asset: monthly_contribution * eligible_gaps.get(asset, 0.0) / total_eligible_gap
+            for asset in all_assets
+        }
+    else:
+        # If nothing is materially below target, invest according to target weights
+        raw_buys = {
+            asset: monthly_contribution * targets[asset] / 100.0
+            for asset in all_assets
+        }
+
+    # Whole-euro orders closest to the proportional buys
+    buys, leftover_cash = allocate_orders(raw_buys, monthly_contribution, min_order_size)
+
+    return {
+        "age": age,
+        "buffett_index": buffett_index,
+        "portfolio_value_before": round(portfolio_value, 2),
+        "monthly_contribution": round(monthly_contribution, 2),
+        "portfolio_value_after": round(new_total_value, 2),
+        "portfolio_targets": dict(targets),
+        "current_weights": round_weights(current_weights, 2),
+        "percentage_gaps": round_weights(percentage_gaps, 2),
+        "eligible_assets": list(eligible_gaps.keys()),
+        "raw_buys": round_weights(raw_buys, 2),
+        "buys": round_weights(buys, 2),
+        "leftover_cash": round(leftover_cash, 2),
+    }
+
+GROWTH_DIVIDENDS_TICKERS = list(TOLERANCE_PP.keys())
+
+
+def age_from_birth_date(birth_date_str: str, default: int = 34, today: Optional[date] = None) -> int:
+    """Returns the investor's age in whole years, or `default` if the date cannot be parsed."""
+    try:
+        birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return default
+    today = today or date.today()
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+
+def base_investment_for_month(p_type: str, investment_month: int, investment_year: int) -> float:
+    """Base monthly contribution of a portfolio type (June and December are doubled)."""
+    if p_type == "Kids":
+        return 100.0 if investment_month in [6, 12] else 50.0
+    elif p_type == "Growth & Dividends":
+        # Exceptional override for June 2026
+        if investment_month == 6 and investment_year == 2026:
+            return 906.19
+        return 1000.0 if investment_month in [6, 12] else 500.0
+    return 500.0 # Default fallback
+
+
+def investment_calendar(today: date) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """
+    Returns ((investment_month, investment_year), (dividend_month, dividend_year)).
+
+    From day 28 onwards next month's investment is prepared with the current
+    month's dividends; before that, the current month is invested with the
+    previous month's dividends.
+    """
+
+    if today.day >= 28:
+        dividend_month, dividend_year = today.month, today.year
+    elif today.month == 1:
+        dividend_month, dividend_year = 12, today.year - 1
+    else:
+        dividend_month, dividend_year = today.month - 1, today.year
+
+    if dividend_month == 12:
+        investment = (1, dividend_year + 1)
+    else:
+        investment = (dividend_month + 1, dividend_year)
+
+    return investment, (dividend_month, dividend_year)
+
+
+def calculate_growth_dividends_buys(
+    age: int,
+    buffett_index: float,
+    current_values: Dict[str, float],
+    monthly_contribution: float,
+    min_order_size: float = 5.0,
+    transition_months: int = 4,
+) -> Dict[str, Any]:
+    """
+    Calculates the full Growth & Dividends order set for one month.
+
+    EGLN.UK and YCSH.DE are funded first from the defensive transition plan,
+    the rest of the contribution is allocated with `calculate_monthly_buys`
+    over the remaining assets. This is the order set shown by the Action Center.
+    """
+
+    targets = lookup_targets(age, buffett_index)
+
+    total_port_val = sum(current_values.get(asset, 0.0) for asset in current_values)
+
+    transition_plan = calculate_egln_prab_transition_plan(
+        portfolio_value=total_port_val,
+        monthly_contribution=monthly_contribution,
+        current_egln_value=current_values.get("EGLN.UK", 0.0),
+        current_prab_value=current_values.get("YCSH.DE", 0.0),
+        months=transition_months,
+        egln_target_pct=targets.get("EGLN.UK", 3.0),
+        prab_target_pct=targets.get("YCSH.DE", 2.7),
+        min_order_size=min_order_size,
+    )
+
+    # Only the first month of the transition plan is executed now
+    current_month_plan = transition_plan[0]
+    egln_buy = current_month_plan["egln_buy"]
+    prab_buy = current_month_plan["prab_buy"]
+
+    buys_data = calculate_monthly_buys(
+        age=age,
+        buffett_index=buffett_index,
+        current_values=current_values,
+        monthly_contribution=current_month_plan["remaining_for_normal_strategy"],
+        min_order_size=min_order_size,
+        exclude_defensive=True,
+    )
+
+    buys_data["buys"]["EGLN.UK"] = egln_buy
+    buys_data["buys"]["YCSH.DE"] = prab_buy
+
+    buys_data["raw_buys"]["EGLN.UK"] = egln_buy
+    buys_data["raw_buys"]["YCSH.DE"] = prab_buy
+
+    buys_data["portfolio_value_after"] = round(total_port_val + monthly_contribution, 2)
+    buys_data["portfolio_targets"] = dict(targets)
+
+    return buys_data
+
+
+def calculate_monthly_buys_batch(
+    scenarios: Iterable[Tuple[int, float, Dict[str, float], float]],
+    min_order_size: float = 5.0,
+    with_transition_plan: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Calculates the buy plans for many scenarios in one call.
+
+    Each scenario is an `(age, buffett_index, current_values, contribution)`
+    tuple. With `with_transition_plan` the Growth & Dividends order set is
+    returned (defensive transition first), otherwise plain `calculate_monthly_buys`.
+
+    Raises ValueError naming the first invalid scenario.
+    """
+
+    plan_fn = calculate_growth_dividends_buys if with_transition_plan else calculate_monthly_buys
+
+    plans = []
+    for idx, (age, buffett_index, current_values, contribution) in enumerate(scenarios):
+        try:
+            plans.append(plan_fn(age, buffett_index, current_values, contribution, min_order_size))
+        except ValueError as e:
+            raise ValueError(f"Scenario {idx}: {e}") from e
+
+    return plans
+
+
+# --- Standard portfolios (target_allocation / tolerance per stock) ---
+RENE_TICKER = "RENE.PT"
+
+
+def is_rene(name: Any) -> bool:
+    """True for the RENE.PT row (new editor rows may have no name yet)."""
+    return isinstance(name, str) and name.upper() == RENE_TICKER
+
+
+def standard_portfolio_options(portfolio_name: Optional[str]) -> Dict[str, bool]:
+    """
+    Dividends handling of a standard portfolio, from its name.
+
+    - rene_first: names containing 'dividends' buy RENE.PT first, in whole shares.
+    - is_dividends: names containing 'dividend' apply the dividends Step 3
+      rounding (RENE.PT kept as is, `.PT` minimum, cents invested).
+    """
+
+    name = (portfolio_name or "").lower()
+    return {"is_dividends": "dividend" in name, "rene_first": "dividends" in name}
+
+
+def rene_order(stock: Dict[str, Any], total_theoretical: float, budget: float) -> float:
+    """
+    Whole-share RENE.PT order of a dividends portfolio.
+
+    Buys the integer quantity that fits the gap to target, capped by the
+    budget; orders under €5 are dropped.
+    """
+
+    target_val = total_theoretical * (stock['target_allocation'] / 100.0)
+    gap = target_val - stock['current_value']
+    price = float(stock.get('current_price', 0.0) or 0.0)
+
+    invest_real = 0.0
+    if gap > 0 and price > 0:
+        qty = math.floor(gap / price)
+        invest_real = qty * price
+        if invest_real > budget:
+            qty = math.floor(budget / price)
+            invest_real = qty * price
+        if 0 < invest_real < 5.0:
+            invest_real = 0.0
+    return invest_real
+
+
+def standard_phase_items(
+    stocks: Iterable[Dict[str, Any]],
+    total_current: float,
+    total_theoretical: float,
+) -> List[Dict[str, Any]]:
+    """Phase A of the standard algorithm: weight, deviation, band flags and gap per stock."""
+
+    items = []
+    for stock in stocks:
+        current_weight = (stock['current_value'] / total_current * 100.0) if total_current > 0 else 0.0
+        target_weight = stock['target_allocation']
+        deviation = target_weight - current_weight
+        min_band = target_weight - stock.get('tolerance', 0.0)
+        below_min_band = current_weight < min_band
+
+        needed_band = 0.0
+        if below_min_band:
+            min_band_eur = total_theoretical * (min_band / 100.0)
+            needed_band = max(0.0, min_band_eur - stock['current_value'])
+
+        items.append({
+            'name': stock['name'],
+            'Gap': total_theoretical * (target_weight / 100.0) - stock['current_value'],
+            'deviation': deviation,
+            'below_min_band': below_min_band,
+            'below_target': deviation > 0,
+            'needed_band': needed_band,
+            'invest': 0.0,
+        })
+    return items
+
+
+def allocate_standard_phases(
+    items: List[Dict[str, Any]],
+    remaining_investment: float,
+    sum_positive_deviations: float,
+    total_needed_band: float,
+) -> float:
+    """
+    Phases B-D of the standard algorithm; fills each item's 'invest' in place.
+
+    Rules:
+    - B: stocks below their minimum band are brought up to it first
+      (proportionally to what each needs when the budget is short).
+    - C: the rest is split in proportion to the positive deviations, capped
+      by each stock's gap to target.
+    - D: what is left goes to the largest remaining gaps.
+
+    Returns the amount that could not be allocated.
+    """
+
+    # Phase B: Priority for assets below the minimum band (Emergency)
+    if total_needed_band > 0 and remaining_investment > 0:
+        if total_needed_band <= remaining_investment:
+            for item in items:
+                if item['needed_band'] > 0:
+                    item['invest'] += item['needed_band']
+                    remaining_investment -= item['needed_band']
+        else:
+            emergency_funds = remaining_investment
+            for item in items:
+                if item['needed_band'] > 0:
+                    item['invest'] += (item['needed_band'] / total_needed_band) * emergency_funds
+            remaining_investment = 0.0
+
+    # Phase C: Proportional Gap Filling
+    if remaining_investment > 0 and sum_positive_deviations > 0:
+        funds_left = remaining_investment
+        proportions = []
+        for item in items:
+            if item['below_target']:
+                prop_alloc = (item['deviation'] / sum_positive_deviations) * funds_left
+                max_inv = max(0.0, item['Gap'] - item['invest'])
+                proportions.append((item, min(prop_alloc, max_inv)))
+        for item, ideal in proportions:
+            item['invest'] += ideal
+            remaining_investment -= ideal
+
+    # Phase D: Leftover gap filling
+    if remaining_investment >= 0.01:
+        for item in sorted(items, key=lambda x: x['Gap'] - x['invest'], reverse=True):
+            if remaining_investment < 0.01:
+                break
+            needed = max(0.0, item['Gap'] - item['invest'])
+            if needed > 0:
+                alloc = min(remaining_investment, needed)
+                item['invest'] += alloc
+                remaining_investment -= alloc
+
+    return remaining_investment
+
+
+def finalize_standard_orders(
+    raw_buys: Dict[str, float],
+    monthly_investment: float,
+    is_dividends: bool,
+    targets: Optional[Mapping[str, float]] = None,
+) -> Tuple[Dict[str, float], float]:
+    """
+    Step 3: whole-euro rounding with `allocate_orders`.
+
+    Rules:
+    - Dividends portfolios keep RENE.PT as is, drop other `.PT` orders
+      below €5 and invest the whole budget, cents included.
+    - Standard portfolios spread the whole euros of the budget over the raw
+      buys by largest remainder (no `.PT` minimum); when nothing is left to
+      buy, the stocks' `targets` weigh the split instead. The cents stay.
+
+    Returns (orders in the `raw_buys` key order, leftover cash).
+    """
+
+    if not is_dividends:
+        weights = raw_buys
+        if not any(v > 0 for v in raw_buys.values()) and targets:
+            weights = {t: float(targets.get(t, 0.0)) for t in raw_buys}
+        return allocate_orders(
+            weights, monthly_investment,
+            min_order_size=0.0, invest_cents=False, pt_minimum=False,
+        )
+
+    fixed_orders = {t: v for t, v in raw_buys.items() if is_rene(t)}
+    rounded_orders, leftover = allocate_orders(
+        {t: v for t, v in raw_buys.items() if t not in fixed_orders},
+        monthly_investment - sum(fixed_orders.values()),
+        min_order_size=0.0,
+    )
+    return {t: fixed_orders.get(t, rounded_orders.get(t, 0.0)) for t in raw_buys}, leftover
+
+
+def calculate_standard_buys(
+    stocks: List[Dict[str, Any]],
+    monthly_investment: float,
+    is_dividends: bool = False,
+    rene_first: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Calculates the monthly orders of a standard (target/tolerance) portfolio.
+
+    Rules:
+    - With `rene_first` (default: `is_dividends`) RENE.PT is bought first,
+      in whole shares; see `standard_portfolio_options`.
+    - The other stocks go through phases B-D (`allocate_standard_phases`).
+    - Orders are rounded by `finalize_standard_orders`.
+
+    `stocks` are the app's stock rows (name, current_value,
+    target_allocation, tolerance, current_price).
+    """
+
+    total_current = sum(s['current_value'] for s in stocks)
+    remaining_investment = float(monthly_investment)
+    total_theoretical = total_current + remaining_investment
+
+    raw_buys = {s['name']: 0.0 for s in stocks}
+    pool = list(stocks)
+
+    if is_dividends if rene_first is None else rene_first:
+        rene_stock = next((s for s in stocks if is_rene(s['name'])), None)
+        if rene_stock:
+            invest_real = rene_order(rene_stock, total_theoretical, remaining_investment)
+            raw_buys[rene_stock['name']] = invest_real
+            remaining_investment -= invest_real
+            pool = [s for s in pool if not is_rene(s['name'])]
+
+    if remaining_investment > 0 and pool:
+        items = standard_phase_items(pool, total_current, total_theoretical)
+        sum_positive_deviations = 0.0
+        total_needed_band = 0.0
+        for item in items:
+            if item['below_target']:
+                sum_positive_deviations += item['deviation']
+            total_needed_band += item['needed_band']
+        remaining_investment = allocate_standard_phases(
+            items, remaining_investment, sum_positive_deviations, total_needed_band
+        )
+        for item in items:
+            raw_buys[item['name']] = item['invest']
+
+    targets = {s['name']: s['target_allocation'] for s in stocks}
+    buys, leftover_cash = finalize_standard_orders(raw_buys, monthly_investment, is_dividends, targets)
+
+    return {
+        "portfolio_value_before": round(total_current, 2),
+        "monthly_contribution": round(float(monthly_investment), 2),
+        "portfolio_value_after": round(total_theoretical, 2),
+        "raw_buys": raw_buys,
+        "buys": buys,
+        "leftover_cash": leftover_cash,
+    }
@@ -3,516 +3,59 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 import streamlit_authenticator as stauth
+import gspread
 import yaml
 from yaml.loader import SafeLoader
+import atexit
 import os
 from dotenv import load_dotenv
 from datetime import datetime, date
-from typing import Dict, Any
+
+from allocation_engine import (
+    TOLERANCE_PP,
+    age_from_birth_date,
+    base_investment_for_month,
+    calculate_growth_split,
+    get_kids_targets,
+    lookup_targets,
+    calculate_growth_dividends_buys,
+    investment_calendar,
+    standard_portfolio_options,
+)
+from contribution_planner import MAX_PLAN_MONTHS, plan_contributions, planned_budgets
+from hedge_funding import (
+    BOND_TICKERS,
+    DEFAULT_GOLD_SHARE_PCT,
+    DEFAULT_HEDGE_TARGET_PCT,
+    GOLD_TICKERS,
+    portfolio_hedge_inputs,
+    solve_hedge_funding,
+)
+from sensitivity import buy_surface
+from simulation import iter_simulation_bands
+from tax_rebalance import DEFAULT_DRIFT_AVERSION, DEFAULT_TAX_RATE, rebalance_with_sells
+from whole_shares import whole_share_orders
+from incremental_engine import IncrementalAllocator
+from local_sheets import LocalSheetsConnection, local_connection_from_env
+from local_store import (
+    ChangeWatcher,
+    LocalStore,
+    ReadOnlyWorksheet,
+    SheetsReplicator,
+    SnapshotRefresher,
+    load_worksheet,
+    queue_append,
+    queue_write,
+    requeue_unsynced,
+)
+from sheet_sync import ChangeTokens, DeltaSync
+from portfolio_data import PORTFOLIO_COLUMNS, PortfolioModel, SharedFrame, prepare_portfolios
+from dividend_ledger import DividendLedger
+from portfolio_state import PortfolioStates
 
 # --- PREMIUM CHART COLOR PALETTE ---
 CHART_PALETTE = ['#3B82F6', '#10B981', '#F59E0B', '#8B5CF6', '#EC4899', '#14B8A6', '#F43F5E', '#84CC16', '#6366F1', '#0EA5E9']
 
-# --- UTILITY: Lifecycle Strategy ---
-def get_lifecycle_strategy(birth_date_str):
-    """Calculates age and returns the strategic allocation based on Lifecycle Phase."""
-    try:
-        from datetime import datetime, date
-        birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
-        today = date.today()
-        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-    except (ValueError, TypeError):
-        age = 34 # Default fallback
-
-    # Table Mapping
-    if age < 40:
-        return {
-            'age': age,
-            'phase': 'Phase: 34–40y - Maximum Growth',
-            'acc': {'stocks': 93.0, 'bonds': 4.0, 'gold': 3.0},
-            'div': {'stocks': 90.0, 'bonds': 7.0, 'gold': 3.0}
-        }
-    elif age < 45:
-        return {
-            'age': age,
-            'phase': 'Phase: 40–45y - Balanced Growth',
-            'acc': {'stocks': 91.0, 'bonds': 5.0, 'gold': 4.0},
-            'div': {'stocks': 88.0, 'bonds': 8.0, 'gold': 4.0}
-        }
-    elif age < 50:
-        return {
-            'age': age,
-            'phase': 'Phase: 45–50y - Defensive Growth',
-            'acc': {'stocks': 88.0, 'bonds': 7.0, 'gold': 5.0},
-            'div': {'stocks': 85.0, 'bonds': 10.0, 'gold': 5.0}
-        }
-    elif age < 55:
-        return {
-            'age': age,
-            'phase': 'Phase: 50–55y - Moderate Protection',
-            'acc': {'stocks': 85.0, 'bonds': 9.0, 'gold': 6.0},
-            'div': {'stocks': 82.0, 'bonds': 12.0, 'gold': 6.0}
-        }
-    elif age < 60:
-        return {
-            'age': age,
-            'phase': 'Phase: 55–60y - Capital Protection',
-            'acc': {'stocks': 80.0, 'bonds': 12.0, 'gold': 8.0},
-            'div': {'stocks': 80.0, 'bonds': 14.0, 'gold': 6.0}
-        }
-    elif age < 65:
-        return {
-            'age': age,
-            'phase': 'Phase: 60–65y - Conservative',
-            'acc': {'stocks': 75.0, 'bonds': 15.0, 'gold': 10.0},
-            'div': {'stocks': 70.0, 'bonds': 18.0, 'gold': 12.0}
-        }
-    else: # 65-67+
-        return {
-            'age': age,
-            'phase': 'Phase: 65–67y - Capital Preservation',
-            'acc': {'stocks': 70.0, 'bonds': 20.0, 'gold': 10.0},
-            'div': {'stocks': 60.0, 'bonds': 30.0, 'gold': 10.0}
-        }
-
-
-# =========================
-# Unified Portfolio Helpers & Allocation Logic
-# =========================
-
-def clamp(value: float, minimum: float, maximum: float) -> float:
-    return max(minimum, min(maximum, value))
-
-
-def round_weights(weights: Dict[str, float], decimals: int = 2) -> Dict[str, float]:
-    return {asset: round(weight, decimals) for asset, weight in weights.items()}
-
-
-def get_lifecycle_targets(age: int) -> Dict[str, float]:
-    """
-    Defines the strategic allocation by age.
-
-    growth = SPYL / IXUA / VFEA block
-    EGLN = gold
-    PRAB = bonds / cash-like EUR government bonds 0-1y
-    """
-
-    if age < 40:
-        return {
-            "growth": 77.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 3.0,
-            "YCSH.DE": 2.7,
-        }
-
-    elif age < 45:
-        return {
-            "growth": 74.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 4.0,
-            "YCSH.DE": 4.7,
-        }
-
-    elif age < 50:
-        return {
-            "growth": 70.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 5.0,
-            "YCSH.DE": 7.7,
-        }
-
-    elif age < 55:
-        return {
-            "growth": 66.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 6.0,
-            "YCSH.DE": 10.7,
-        }
-
-    elif age < 60:
-        return {
-            "growth": 60.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 8.0,
-            "YCSH.DE": 14.7,
-        }
-
-    elif age < 65:
-        return {
-            "growth": 54.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 10.0,
-            "YCSH.DE": 18.7,
-        }
-
-    else:
-        return {
-            "growth": 47.0,
-            "WTEQ.DE": 10.8,
-            "VDIV.DE": 4.5,
-            "JMT.PT": 1.0,
-            "EDP.PT": 1.0,
-            "EGLN.UK": 10.0,
-            "YCSH.DE": 25.7,
-        }
-
-
-def calculate_growth_split(buffett_index: float) -> Dict[str, float]:
-    """
-    Calculates the allocation inside the growth block.
-
-    Buffett <= 100  -> SPYL 70%
-    Buffett ~165    -> SPYL 60%
-    Buffett >= 230  -> SPYL 50%
-
-    VFEA moves in stable steps:
-    - SPYL >= 65 -> VFEA 10%
-    - SPYL >= 55 -> VFEA 12.5%
-    - SPYL < 55 -> VFEA 15%
-    """
-
-    SPYL_MIN = 50.0
-    SPYL_MAX = 70.0
-
-    BUFFETT_LOW = 100.0
-    BUFFETT_HIGH = 230.0
-
-    target_spyl = SPYL_MAX - (
-        (buffett_index - BUFFETT_LOW) / (BUFFETT_HIGH - BUFFETT_LOW)
-    ) * (SPYL_MAX - SPYL_MIN)
-
-    target_spyl = round(clamp(target_spyl, SPYL_MIN, SPYL_MAX))
-
-    if target_spyl >= 65.0:
-        target_vfea = 10.0
-    elif target_spyl >= 55.0:
-        target_vfea = 12.5
-    else:
-        target_vfea = 15.0
-
-    target_ixua = 100.0 - target_spyl - target_vfea
-
-    return {
-        "SPYL.DE": target_spyl,
-        "IXUA.DE": target_ixua,
-        "VFEA.DE": target_vfea,
-    }
-
-
-def calculate_portfolio_targets(age: int, buffett_index: float) -> Dict[str, Any]:
-    """
-    Calculates final portfolio target weights.
-
-    Returns:
-    - lifecycle allocation
-    - growth split
-    - final portfolio target weights
-    """
-
-    lifecycle = get_lifecycle_targets(age)
-    growth_weight = lifecycle["growth"]
-
-    growth_split = calculate_growth_split(buffett_index)
-
-    spyl_target = round(growth_weight * growth_split["SPYL.DE"] / 100.0, 2)
-    vfea_target = round(growth_weight * growth_split["VFEA.DE"] / 100.0, 2)
-    ixua_target = round(growth_weight - spyl_target - vfea_target, 2)
-
-    targets = {
-        "SPYL.DE": spyl_target,
-        "IXUA.DE": ixua_target,
-        "VFEA.DE": vfea_target,
-        "WTEQ.DE": lifecycle["WTEQ.DE"],
-        "VDIV.DE": lifecycle["VDIV.DE"],
-        "JMT.PT": lifecycle["JMT.PT"],
-        "EDP.PT": lifecycle["EDP.PT"],
-        "EGLN.UK": lifecycle["EGLN.UK"],
-        "YCSH.DE": lifecycle["YCSH.DE"],
-    }
-
-    total = sum(targets.values())
-
-    if abs(total - 100.0) > 0.01:
-        raise ValueError(f"Portfolio targets do not sum to 100%. Total = {total:.2f}%")
-
-    return {
-        "age": age,
-        "buffett_index": buffett_index,
-        "lifecycle": lifecycle,
-        "growth_split": growth_split,
-        "targets": round_weights(targets, 2),
-        "total": round(total, 2),
-    }
-
-
-TOLERANCE_PP = {
-    "SPYL.DE": 3.0,
-    "IXUA.DE": 3.0,
-    "VFEA.DE": 1.5,
-    "WTEQ.DE": 2.0,
-    "VDIV.DE": 2.0,
-    "JMT.PT": 1.0,
-    "EDP.PT": 1.0,
-    "EGLN.UK": 1.0,
-    "YCSH.DE": 0.5,
-}
-
-
-def calculate_egln_prab_transition_plan(
-    portfolio_value: float,
-    monthly_contribution: float,
-    current_egln_value: float = 0.0,
-    current_prab_value: float = 0.0,
-    months: int = 4,
-    egln_target_pct: float = 3.0,
-    prab_target_pct: float = 2.7,
-    min_order_size: float = 5.0,
-):
-    plan = []
-
-    egln_value = current_egln_value
-    prab_value = current_prab_value
-    current_portfolio_value = portfolio_value
-
-    for month in range(1, months + 1):
-        portfolio_after_contribution = current_portfolio_value + monthly_contribution
-
-        egln_target_value = portfolio_after_contribution * egln_target_pct / 100.0
-        prab_target_value = portfolio_after_contribution * prab_target_pct / 100.0
-
-        months_left = months - month + 1
-
-        egln_gap = max(0.0, egln_target_value - egln_value)
-        prab_gap = max(0.0, prab_target_value - prab_value)
-
-        egln_buy = egln_gap / months_left
-        prab_buy = prab_gap / months_left
-
-        if egln_buy < min_order_size:
-            egln_buy = 0.0
-
-        if prab_buy < min_order_size:
-            prab_buy = 0.0
-
-        total_defensive_buy = egln_buy + prab_buy
-        remaining_for_normal_strategy = monthly_contribution - total_defensive_buy
-
-        egln_value += egln_buy
-        prab_value += prab_buy
-        current_portfolio_value = portfolio_after_contribution
-
-        plan.append({
-            "month": month,
-            "portfolio_after_contribution": round(portfolio_after_contribution, 2),
-            "egln_buy": round(egln_buy, 2),
-            "prab_buy": round(prab_buy, 2),
-            "remaining_for_normal_strategy": round(remaining_for_normal_strategy, 2),
-            "egln_value_after_buy": round(egln_value, 2),
-            "prab_value_after_buy": round(prab_value, 2),
-            "egln_target_value": round(egln_target_value, 2),
-            "prab_target_value": round(prab_target_value, 2),
-        })
-
-    return plan
-
-
-def calculate_monthly_buys(
-    age: int,
-    buffett_index: float,
-    current_values: Dict[str, float],
-    monthly_contribution: float,
-    min_order_size: float = 5.0,
-    exclude_defensive: bool = False,
-) -> Dict[str, Any]:
-    """
-    Calculates how to allocate the monthly contribution.
-
-    Rules:
-    - Never sell.
-    - Only buy assets below their tolerance band.
-    - Ignore orders below min_order_size.
-    - Leftover cash is returned.
-    """
-
-    portfolio_data = calculate_portfolio_targets(age, buffett_index)
-    targets = portfolio_data["targets"]
-
-    if exclude_defensive:
-        targets = targets.copy()
-        def_sum = targets.get("EGLN.UK", 0.0) + targets.get("YCSH.DE", 0.0)
-        remaining_sum = 100.0 - def_sum
-        for asset in list(targets.keys()):
-            if asset in ("EGLN.UK", "YCSH.DE"):
-                targets[asset] = 0.0
-            elif remaining_sum > 0:
-                targets[asset] = (targets[asset] / remaining_sum) * 100.0
-
-    all_assets = list(targets.keys())
-
-    portfolio_value = sum(current_values.get(asset, 0.0) for asset in all_assets)
-
-    if portfolio_value < 0:
-        raise ValueError("Portfolio value cannot be negative.")
-
-    if monthly_contribution <= 0:
-        raise ValueError("Monthly contribution must be positive.")
-
-    # If portfolio is empty, buy according to target weights
-    if portfolio_value == 0:
-        raw_buys = {
-            asset: monthly_contribution * targets[asset] / 100.0
-            for asset in all_assets
-        }
-
-        # Apply minimum order size and round down to integer euros
-        import math
-        rounded_buys = {}
-        total_rounded = 0.0
-        for asset, amount in raw_buys.items():
-            if amount >= min_order_size:
-                rounded_val = float(math.floor(amount))
-                rounded_buys[asset] = rounded_val
-                total_rounded += rounded_val
-            else:
-                rounded_buys[asset] = 0.0
-
-        # Redistribution of Cents ("The Dump")
-        leftover_cash = 0.0
-        if any(rounded_buys.values()):
-            dump_ticker = max(rounded_buys, key=rounded_buys.get)
-            remaining_budget = monthly_contribution - total_rounded
-            if remaining_budget > 0:
-                rounded_buys[dump_ticker] += remaining_budget
-            leftover_cash = 0.0
-        else:
-            leftover_cash = monthly_contribution
-
-        buys = rounded_buys
-
-        return {
-            "age": age,
-            "buffett_index": buffett_index,
-            "portfolio_value_before": 0.0,
-            "monthly_contribution": round(monthly_contribution, 2),
-            "portfolio_value_after": round(monthly_contribution, 2),
-            "portfolio_targets": targets,
-            "current_weights": {asset: 0.0 for asset in all_assets},
-            "raw_buys": round_weights(raw_buys, 2),
-            "buys": round_weights(buys, 2),
-            "leftover_cash": round(leftover_cash, 2),
-        }
-
-    # Current weights before contribution
-    current_weights = {
-        asset: current_values.get(asset, 0.0) / portfolio_value * 100.0
-        for asset in all_assets
-    }
-
-    # Portfolio value after new contribution
-    new_total_value = portfolio_value + monthly_contribution
-
-    # Target value after contribution
-    target_values_after_contribution = {
-        asset: new_total_value * targets[asset] / 100.0
-        for asset in all_assets
-    }
-
-    # Value gaps to target
-    value_gaps = {
-        asset: max(
-            0.0,
-            target_values_after_contribution[asset] - current_values.get(asset, 0.0)
-        )
-        for asset in all_assets
-    }
-
-    # Percentage gaps before contribution
-    percentage_gaps = {
-        asset: max(0.0, targets[asset] - current_weights[asset])
-        for asset in all_assets
-    }
-
-    # Only eligible if below tolerance band
-    eligible_gaps = {
-        asset: value_gaps[asset]
-        for asset in all_assets
-        if percentage_gaps[asset] >= TOLERANCE_PP[asset]
-    }
-
-    total_eligible_gap = sum(eligible_gaps.values())
-
-    if total_eligible_gap > 0:
-        raw_buys = {
-            asset: monthly_contribution * eligible_gaps.get(asset, 0.0) / total_eligible_gap
-            for asset in all_assets
-        }
-    else:
-        # If nothing is materially below target, invest according to target weights
-        raw_buys = {
-            asset: monthly_contribution * targets[asset] / 100.0
-            for asset in all_assets
-        }
-
-    # Apply minimum order size and round down to integer euros
-    import math
-    rounded_buys = {}
-    total_rounded = 0.0
-    for asset, amount in raw_buys.items():
-        if amount >= min_order_size:
-            rounded_val = float(math.floor(amount))
-            rounded_buys[asset] = rounded_val
-            total_rounded += rounded_val
-        else:
-            rounded_buys[asset] = 0.0
-
-    # Redistribution of Cents ("The Dump")
-    # All remaining contribution goes into the ticker with the highest investment
-    leftover_cash = 0.0
-    if any(rounded_buys.values()):
-        dump_ticker = max(rounded_buys, key=rounded_buys.get)
-        remaining_budget = monthly_contribution - total_rounded
-        if remaining_budget > 0:
-            rounded_buys[dump_ticker] += remaining_budget
-        leftover_cash = 0.0
-    else:
-        leftover_cash = monthly_contribution
-
-    buys = rounded_buys
-
-    return {
-        "age": age,
-        "buffett_index": buffett_index,
-        "portfolio_value_before": round(portfolio_value, 2),
-        "monthly_contribution": round(monthly_contribution, 2),
-        "portfolio_value_after": round(new_total_value, 2),
-        "portfolio_targets": targets,
-        "current_weights": round_weights(current_weights, 2),
-        "percentage_gaps": round_weights(percentage_gaps, 2),
-        "eligible_assets": list(eligible_gaps.keys()),
-        "raw_buys": round_weights(raw_buys, 2),
-        "buys": round_weights(buys, 2),
-        "leftover_cash": round(leftover_cash, 2),
-    }
-
-
 
 # Load environment variables
 load_dotenv(override=True)
@@ -999,6 +542,99 @@ def clear_recommendations():
     st.session_state.show_save_success = False
     st.session_state.last_calculation = None
 
+def build_standard_calculation(allocator, live_stocks, whole_shares_only=False):
+    """Builds the Action Center table of a standard portfolio from its IncrementalAllocator."""
+    result = allocator.recommendations()
+    invest_map = result["buys"]
+    remaining_investment = result["leftover_cash"]
+    current_monthly_base = allocator.monthly_investment
+    total_current_live = sum(s['current_value'] for s in live_stocks)
+
+    share_quantities = None
+    shares_optimal = True
+    if whole_shares_only:
+        share_plan = whole_share_orders(live_stocks, invest_map, current_monthly_base, min_order_size=5.0)
+        if share_plan["skipped"]:
+            st.warning(f"No current price for {', '.join(share_plan['skipped'])}: not bought in whole-share mode.")
+        invest_map = {t: share_plan["orders"].get(t, 0.0) for t in invest_map}
+        remaining_investment = share_plan["leftover_cash"]
+        share_quantities = share_plan["quantities"]
+        shares_optimal = share_plan["optimal"]
+
+    allocations = []
+    new_total_actual = float(total_current_live + current_monthly_base)
+    for stock in live_stocks:
+        ticker = stock['name']
+        final_invest = invest_map.get(ticker, 0.0)
+        target_val = new_total_actual * (stock['target_allocation'] / 100.0)
+        new_val = stock['current_value'] + final_invest
+        allocations.append({
+            "Stock": ticker,
+            "Current Value": stock['current_value'],
+            "Current %": (stock['current_value'] / total_current_live * 100) if total_current_live > 0 else 0,
+            "TER %": stock.get('expense_ratio', 0.0),
+            "Target %": stock['target_allocation'],
+            "Target Value": target_val,
+            "Investment": final_invest,
+            "New Value": new_val,
+            "New %": (new_val / new_total_actual * 100) if new_total_actual > 0 else 0
+        })
+        if share_quantities is not None:
+            allocations[-1]["Shares"] = share_quantities.get(ticker, 0)
+            # False when the search hit its time cap before proving the shares optimal
+            allocations[-1]["Optimal"] = shares_optimal
+
+    alloc_df = pd.DataFrame(allocations)
+    if not alloc_df.empty:
+        custom_order_list = ["SPYL.DE", "IXUA.DE", "VFEA.DE", "YCSH.DE", "EGLN.UK"]
+        alloc_df['order_idx'] = alloc_df['Stock'].apply(lambda x: custom_order_list.index(x) if x in custom_order_list else 99)
+        alloc_df = alloc_df.sort_values(by='order_idx').drop(columns=['order_idx'])
+
+    return {"df": alloc_df, "monthly_investment": current_monthly_base, "remaining": remaining_investment, "buys": invest_map}
+
+def refresh_live_recommendations(portfolio_name, old_stocks, new_stocks, monthly_investment):
+    """
+    Applies data editor edits to the portfolio's IncrementalAllocator and
+    refreshes the recommendations instead of clearing them. Portfolios that
+    were never calculated (or whose targets no longer sum to 100%) stay cleared.
+    """
+    allocator = st.session_state.get('allocators', {}).get(portfolio_name)
+    if allocator is None:
+        return
+
+    old_map = {s['name']: s for s in old_stocks}
+    new_map = {s['name']: s for s in new_stocks}
+    if (
+        old_map.keys() != new_map.keys()
+        or set(allocator.names()) != old_map.keys()
+        or len(new_map) != len(new_stocks)
+    ):
+        # Rows added, removed, restored or renamed: rebuild from the edited rows
+        allocator = IncrementalAllocator(
+            new_stocks, float(monthly_investment), **standard_portfolio_options(portfolio_name)
+        )
+        st.session_state.allocators[portfolio_name] = allocator
+    else:
+        for name, stock in new_map.items():
+            old = old_map[name]
+            changed = {
+                field: stock.get(field)
+                for field in ('current_value', 'target_allocation', 'tolerance', 'current_price')
+                if stock.get(field) != old.get(field)
+            }
+            if changed:
+                allocator.update(name, **changed)
+    allocator.set_monthly_investment(float(monthly_investment))
+
+    if abs(allocator.total_target - 100.0) > 0.01:
+        clear_recommendations()
+        return
+
+    live_stocks = [dict(s) for s in new_stocks]
+    whole_shares_only = st.session_state.get(f"{portfolio_name}_whole_shares", False)
+    st.session_state.last_calculation = build_standard_calculation(allocator, live_stocks, whole_shares_only)
+    st.session_state.show_recommendations = True
+
 def calculate_kids_targets(birth_date_str):
     if not birth_date_str or not isinstance(birth_date_str, str):
         return None
@@ -1006,25 +642,13 @@ def calculate_kids_targets(birth_date_str):
         birth_date = datetime.strptime(birth_date_str, "%Y-%m-%d").date()
         today = datetime.today().date()
         age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-        
-        if age <= 13:
-            return {"VWCE.DE": 100.0, "VAGF.DE": 0.0}
-        elif age == 14:
-            return {"VWCE.DE": 95.0, "VAGF.DE": 5.0}
-        elif age == 15:
-            return {"VWCE.DE": 90.0, "VAGF.DE": 10.0}
-        elif age == 16:
-            return {"VWCE.DE": 85.0, "VAGF.DE": 15.0}
-        elif age == 17:
-            return {"VWCE.DE": 80.0, "VAGF.DE": 20.0}
-        elif age >= 18:
-            return {"VWCE.DE": 70.0, "VAGF.DE": 30.0}
+        return get_kids_targets(age)
     except Exception:
         return None
-    return None
 
 def reset_portfolio_state():
     clear_recommendations()
+    st.session_state.pop('allocators', None)
     if 'portfolio_selector' in st.session_state:
         selected = st.session_state.portfolio_selector
         keys_to_clear = [k for k in st.session_state.keys() if k.startswith(f"{selected}_")]
@@ -1034,6 +658,221 @@ def reset_portfolio_state():
     if 'last_selected_portfolio' in st.session_state:
         del st.session_state.last_selected_portfolio
 
+@st.cache_resource
+def get_local_sheets_connection() -> LocalSheetsConnection:
+    """File-backed Google Sheets stand-in for offline benchmarks (`SHEETS_BACKEND=local`)."""
+    return local_connection_from_env()
+
+@st.cache_resource
+def get_local_store() -> LocalStore:
+    """One embedded store per server process, shared by every session."""
+    return LocalStore()
+
+@st.cache_resource
+def get_delta_sync(_conn) -> DeltaSync:
+    """
+    Uploads row-level deltas; remembers what each worksheet looks like on the
+    sheet and rewrites it instead when another process or a hand edit changed it.
+    """
+    return DeltaSync(
+        _conn.update,
+        lambda worksheet: get_spreadsheet(_conn).worksheet(worksheet),
+        remote_token=lambda worksheet: get_change_tokens(_conn).remote().get(worksheet),
+        remote_revision=lambda: spreadsheet_revision(_conn),
+        create=_conn.create,
+    )
+
+@st.cache_resource
+def get_change_tokens(_conn) -> ChangeTokens:
+    """Per-worksheet change tokens in the `_versions` marker worksheet."""
+    return ChangeTokens(_conn.read, get_spreadsheet(_conn).worksheet, _conn.create)
+
+@st.cache_resource
+def get_sheets_replicator(_conn) -> SheetsReplicator:
+    """Write-behind queue replicating local saves to Google Sheets."""
+    store = get_local_store()
+    upload = get_delta_sync(_conn)
+    tokens = get_change_tokens(_conn)
+
+    def on_synced(worksheet, version):
+        # Refresh the cold-start snapshot and tell other processes the sheet changed
+        if version is not None:
+            store.mark_synced(worksheet, version)
+        store.snapshot(worksheet)
+        token = tokens.publish(worksheet)
+        store.set_sync_token(worksheet, token)
+        upload.mark(worksheet, token)
+
+    replicator = SheetsReplicator(upload, upload.append, on_synced=on_synced)
+    # Saves still queued when the last process stopped
+    requeue_unsynced(store, replicator)
+    # Give pending uploads a last chance when the server shuts down
+    atexit.register(replicator.flush, 10.0)
+    return replicator
+
+@st.cache_resource
+def get_snapshot_refresher() -> SnapshotRefresher:
+    """Background re-fetch of worksheets served read-only from a snapshot."""
+    return SnapshotRefresher(get_local_store())
+
+@st.cache_resource
+def get_spreadsheet(_conn):
+    """
+    The gspread spreadsheet behind the connection, opened once with the
+    connection's service account; the local stand-in opens its own.
+    """
+    if isinstance(_conn, LocalSheetsConnection):
+        return _conn.open_spreadsheet()
+    settings = dict(st.secrets["connections"]["gsheets"])
+    spreadsheet = settings.pop("spreadsheet")
+    settings.pop("worksheet", None)
+    client = gspread.service_account_from_dict(settings)
+    return client.open_by_url(spreadsheet) if spreadsheet.startswith("http") else client.open(spreadsheet)
+
+def spreadsheet_revision(conn):
+    """The spreadsheet's last modification time (Drive modifiedTime), or None if the connection cannot tell."""
+    try:
+        return str(get_spreadsheet(conn).get_lastUpdateTime())
+    except Exception:
+        return None
+
+@st.cache_resource
+def get_change_watcher(_conn) -> ChangeWatcher:
+    """
+    Re-downloads worksheets other processes uploaded, when their change token
+    moves, and worksheets edited directly in the sheet, when its revision moves.
+    """
+    return ChangeWatcher(
+        get_local_store(),
+        get_change_tokens(_conn).remote,
+        lambda worksheet: _conn.read(worksheet=worksheet, ttl=0),
+        busy=get_sheets_replicator(_conn).pending_worksheets,
+        on_refreshed=get_delta_sync(_conn).forget,
+        interval=float(os.getenv("SHEETS_CHANGE_CHECK_SECONDS", "60")),
+        remote_revision=lambda: spreadsheet_revision(_conn),
+        reseed_interval=float(os.getenv("SHEETS_RESEED_SECONDS", "600")),
+    )
+
+def remote_token(conn, worksheet):
+    """Reads the worksheet's change token on the sheet when called (None if it has none)."""
+    return lambda: get_change_tokens(conn).remote().get(worksheet)
+
+def read_worksheet(conn, worksheet, ttl=0):
+    """
+    Reads a worksheet from the local store, seeding it from its snapshot or
+    from Google Sheets on first use. A snapshot renders at once: the sheet
+    and its change token are read afterwards, in the background.
+    """
+    store = get_local_store()
+    data = load_worksheet(
+        store, worksheet, lambda: conn.read(worksheet=worksheet, ttl=ttl), remote_token(conn, worksheet)
+    )
+    refresh_read_only(conn)
+    return data
+
+def refresh_read_only(conn):
+    """Schedules a Google Sheets re-fetch for every read-only worksheet (throttled)."""
+    store = get_local_store()
+    for worksheet in store.read_only_worksheets():
+        get_snapshot_refresher().schedule(
+            worksheet, lambda ws=worksheet: conn.read(worksheet=ws, ttl=0), remote_token(conn, worksheet)
+        )
+
+@st.cache_resource
+def get_shared_portfolios() -> SharedFrame:
+    """The prepared Portfolios frame, shared by every session of the process."""
+    return SharedFrame()
+
+@st.cache_resource
+def get_shared_portfolio_model() -> SharedFrame:
+    """The normalized Portfolios model, shared like the frame it is built from."""
+    return SharedFrame()
+
+def load_portfolios(conn):
+    """
+    Shared, read-only Portfolios frame, its `PortfolioModel` and the store
+    version they were built from; both are rebuilt once after each save.
+    Copy the frame before editing it.
+    """
+    store = get_local_store()
+    if not store.has("Portfolios"):
+        read_worksheet(conn, "Portfolios", ttl="10m")
+    version = store.version("Portfolios")
+    frame = get_shared_portfolios().get(version, lambda: prepare_portfolios(store.read("Portfolios")))
+    model = get_shared_portfolio_model().get(version, lambda: PortfolioModel.from_sheet(frame))
+    return frame, model, version
+
+@st.cache_resource
+def get_portfolio_states() -> PortfolioStates:
+    """Precomputed holdings and widget values of every portfolio, shared per data version."""
+    return PortfolioStates()
+
+@st.cache_resource
+def get_shared_dividends() -> SharedFrame:
+    """The parsed dividend ledger and rollup cube, shared by every session of the process."""
+    return SharedFrame()
+
+def load_dividends(conn) -> DividendLedger:
+    """Shared dividend ledger; rebuilt only when the Dividends worksheet changed elsewhere."""
+    store = get_local_store()
+    if not store.has("Dividends"):
+        try:
+            read_worksheet(conn, "Dividends")
+        except Exception:
+            pass  # Worksheet likely doesn't exist yet
+    return get_shared_dividends().get(store.version("Dividends"), lambda: DividendLedger(store.read("Dividends")))
+
+def update_dividends(conn, save, apply):
+    """
+    Runs `save()` (a Dividends write) and swaps in `apply(ledger)`, the shared
+    ledger with the same change, instead of re-parsing the worksheet.
+    """
+    store = get_local_store()
+    before = store.version("Dividends")
+    save()
+    after = store.version("Dividends")
+    if after == before + 1:
+        get_shared_dividends().advance(before, after, apply)
+
+def stop_read_only(exc):
+    """Shows why a save was refused and ends the run before anything reports success."""
+    st.warning(f"📴 Not saved: {exc}. Saving is disabled until the connection is back.")
+    st.stop()
+
+def save_worksheet(conn, worksheet, data):
+    """Saves locally (milliseconds) and queues the upload to Google Sheets."""
+    try:
+        queue_write(get_local_store(), get_sheets_replicator(conn), worksheet, data)
+    except ReadOnlyWorksheet as exc:
+        stop_read_only(exc)
+
+def append_worksheet(conn, worksheet, rows):
+    """Appends rows locally and queues a Google Sheets append: no full read or rewrite."""
+    try:
+        queue_append(
+            get_local_store(), get_sheets_replicator(conn), worksheet, rows,
+            lambda: conn.read(worksheet=worksheet, ttl=0), remote_token(conn, worksheet),
+        )
+    except ReadOnlyWorksheet as exc:
+        stop_read_only(exc)
+
+@st.fragment(run_every="3s")
+def sync_status(conn):
+    """Sidebar indicator for saves not yet uploaded to Google Sheets and for offline worksheets."""
+    store = get_local_store()
+    for worksheet, reason in store.read_only_worksheets().items():
+        st.caption(f"📴 {worksheet} is read-only: {reason}")
+    refresh_read_only(conn)
+    get_change_watcher(conn).maybe_check()
+    replicator = get_sheets_replicator(conn)
+    pending_sync = replicator.pending_worksheets()
+    if pending_sync:
+        st.caption(f"🔄 Pending sync to Google Sheets: {', '.join(pending_sync)}")
+        if replicator.last_error:
+            st.caption(f"⚠️ Retrying: {replicator.last_error}")
+    else:
+        st.caption("☁️ All changes synced to Google Sheets")
+
 # Get secrets
 admin_hash = os.getenv('ADMIN_PASSWORD_HASH')
 cookie_key = os.getenv('COOKIE_KEY')
@@ -1084,96 +923,48 @@ elif authentication_status:
     st.markdown("Optimization, Dividend Tracking, and Portfolio Analytics")
     # st.divider()
 
-    # Initialize GSheets connection
-    # pyrefly: ignore [missing-import]
-    from streamlit_gsheets import GSheetsConnection
-    conn = st.connection("gsheets", type=GSheetsConnection)
+    # Initialize GSheets connection (SHEETS_BACKEND=local swaps in the file-backed stand-in)
+    if os.getenv("SHEETS_BACKEND", "gsheets") == "local":
+        conn = get_local_sheets_connection()
+    else:
+        # pyrefly: ignore [missing-import]
+        from streamlit_gsheets import GSheetsConnection
+        conn = st.connection("gsheets", type=GSheetsConnection)
 
-    # Load data from Google Sheets into Session State
-    if 'master_data' not in st.session_state:
-        try:
-            # Load with a cache but then move to Session State for "instant" local updates
-            raw_data = conn.read(worksheet="Portfolios", ttl="10m") 
-            
-            if raw_data is None:
-                raw_data = pd.DataFrame()
-                
-            if not raw_data.empty and 'portfolio_name' not in raw_data.columns:
-                raw_data['portfolio_name'] = 'Default'
-            
-            required_columns = [
-                'username', 'stock_name', 'current_value', 'target_allocation', 
-                'portfolio_name', 'tolerance', 'expense_ratio', 'portfolio_monthly_invest', 
-                'portfolio_use_indicators', 'portfolio_buffett_index',
-                'stock_full_name', 'sector', 'industry', 'country', 'currency', 
-                'quantity', 'average_price', 'dividend_yield', 'portfolio_type',
-                'portfolio_birth_date', 'portfolio_uninvested_cash', 'current_price', 'investor_birth_date'
-            ]
-            
-            if raw_data.empty:
-                raw_data = pd.DataFrame(columns=required_columns)
-            else:
-                for col in required_columns:
-                    if col not in raw_data.columns:
-                        if col == 'portfolio_monthly_invest': raw_data[col] = 1000.0
-                        elif col == 'portfolio_use_indicators': raw_data[col] = False
-                        elif col == 'portfolio_buffett_index': raw_data[col] = 195.0
-                        elif col == 'portfolio_type': raw_data[col] = 'Other'
-                        elif col == 'portfolio_birth_date': raw_data[col] = ''
-                        elif col == 'portfolio_uninvested_cash': raw_data[col] = 0.0
-                        elif col == 'investor_birth_date': raw_data[col] = '1992-01-01' # Default starting point (34y approx)
-                        elif col in ['current_value', 'target_allocation', 'tolerance', 'expense_ratio', 'quantity', 'average_price', 'dividend_yield', 'current_price']: raw_data[col] = 0.0
-                        else: raw_data[col] = ''
-                        
-                raw_data = raw_data.astype({
-                    'username': 'str',
-                    'stock_name': 'str', 
-                    'current_value': 'float',
-                    'target_allocation': 'float',
-                    'expense_ratio': 'float',
-                    'portfolio_name': 'str',
-                    'current_price': 'float'
-                })
-                raw_data['portfolio_name'] = raw_data['portfolio_name'].fillna('Default')
-                raw_data['username'] = raw_data['username'].fillna('unknown') 
-                if 'portfolio_type' in raw_data.columns:
-                    raw_data['portfolio_type'] = raw_data['portfolio_type'].replace('Unified', 'Growth & Dividends')
-
-            st.session_state.master_data = raw_data
-
-            # Load Dividends Data
-            if 'dividends' not in st.session_state:
-                try:
-                    div_data = conn.read(worksheet="Dividends", ttl=0)
-                    if div_data is None or div_data.empty:
-                        div_data = pd.DataFrame(columns=['date', 'ticker', 'amount', 'portfolio_name', 'username'])
-                    else:
-                        # Drop rows where 'date' is empty, NaN, NaT, or invalid
-                        div_data = div_data.dropna(subset=['date'])
-                        div_data = div_data[div_data['date'].astype(str).str.strip() != ""]
-                        div_data = div_data[~div_data['date'].astype(str).str.strip().str.lower().isin(['nat', 'nan', 'none'])]
-                    
-                    # Ensure columns exist
-                    for col in ['date', 'ticker', 'amount', 'portfolio_name', 'username']:
-                        if col not in div_data.columns:
-                            div_data[col] = '' if col in ['date', 'ticker', 'portfolio_name', 'username'] else 0.0
-                    st.session_state.dividends = div_data
-                except Exception:
-                     # Worksheet likely doesn't exist yet
-                    st.session_state.dividends = pd.DataFrame(columns=['date', 'ticker', 'amount', 'portfolio_name', 'username'])
-
-        except Exception as e:
-            st.session_state.master_data = pd.DataFrame(columns=['username', 'stock_name', 'current_value', 'target_allocation', 'portfolio_name'])
+    # Portfolios: one parsed copy per process, rebuilt only when a save bumps its version
+    try:
+        st.session_state.master_data, portfolio_model, portfolio_version = load_portfolios(conn)
+    except Exception:
+        # Keep the last copy this session saw rather than an empty frame
+        if 'master_data' not in st.session_state:
+            st.session_state.master_data = pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+        portfolio_model = PortfolioModel.from_sheet(st.session_state.master_data)
+        portfolio_version = -1
+
+    # Build every portfolio's holdings and widget state in the background, so switching is instant
+    if portfolio_version >= 0:
+        get_portfolio_states().prefetch(portfolio_model, username, portfolio_version)
+
+    # Dividends: parsed once per process into a ledger with O(1) rollup lookups
+    try:
+        dividend_ledger = load_dividends(conn)
+    except Exception:
+        dividend_ledger = DividendLedger()
 
     data = st.session_state.master_data
+    # Save buttons are disabled while the portfolios may be older than Google Sheets
+    portfolios_read_only = bool(get_local_store().read_only("Portfolios"))
+    if portfolios_read_only:
+        st.warning(f"📴 Offline mode: portfolios are read-only, {get_local_store().read_only('Portfolios')}. Saving is disabled until the connection is back.")
 
     with st.sidebar:
         # 1. Logout & Welcome
         authenticator.logout('Logout', 'main')
         st.write(f'Welcome *{name}*')
+        sync_status(conn)
         
         # 1. Global Total Invested
-        user_all_data = data[data['username'] == username] if not data.empty else pd.DataFrame()
+        user_all_data = portfolio_model.to_sheet(username) if not data.empty else pd.DataFrame()
         
         global_total = 0.0
         merged_global = pd.DataFrame()
@@ -1187,8 +978,8 @@ elif authentication_status:
             # Separate Gold, Bonds, Growth, and Dividends based on user asset categories
             growth_tickers = {"SPYL.DE", "IXUA.DE", "VFEA.DE"}
             dividend_tickers = {"WTEQ.DE", "VDIV.DE", "EDP.PT", "JMT.PT"}
-            gold_tickers = {"EGLN.UK", "EGNL.UK"}
-            bond_tickers = {"YCSH.DE", "PRAB.DE", "IBTE.UK"}
+            gold_tickers = GOLD_TICKERS
+            bond_tickers = BOND_TICKERS
 
             def assign_global_label(row):
                 ticker = str(row['stock_name']).upper().strip()
@@ -1241,7 +1032,7 @@ elif authentication_status:
 
     # Determine existing portfolios
     if not user_all_data.empty:
-        existing_portfolios = sorted(user_all_data['portfolio_name'].unique().tolist())
+        existing_portfolios = portfolio_model.portfolio_names(username)
     else:
         existing_portfolios = []
     portfolio_options = ["🌍 Global Overview"] + existing_portfolios
@@ -1278,10 +1069,8 @@ elif authentication_status:
                     if "dividend" in name_lower:
                         return f"💸 {p_name}"
 
-                    if user_all_data.empty: return p_name
-                    p_rows = user_all_data[user_all_data['portfolio_name'] == p_name]
-                    if p_rows.empty: return p_name
-                    p_type = p_rows['portfolio_type'].iloc[0]
+                    p_type = portfolio_model.portfolio_type(username, p_name)
+                    if p_type is None: return p_name
                     
                     if p_type == "Stocks": return f"📈 {p_name}"
                     elif p_type == "Kids": return f"🧸 {p_name}"
@@ -1307,7 +1096,7 @@ elif authentication_status:
             with st.expander("➕ Create New Portfolio"):
                 new_portfolio_input = st.text_input("Name", placeholder="e.g., Accumulation", key="new_p_name")
                 new_portfolio_type = st.selectbox("Type", options=["Stocks", "Kids", "Growth & Dividends"], index=2, key="new_p_type")
-                if st.button("Create"):
+                if st.button("Create", disabled=portfolios_read_only):
                     if new_portfolio_input and new_portfolio_input not in existing_portfolios:
                         # Create a placeholder row to persist the portfolio name
                         new_row = pd.DataFrame([{
@@ -1321,7 +1110,7 @@ elif authentication_status:
                         }])
                         updated_data = pd.concat([data, new_row], ignore_index=True)
                         st.session_state.master_data = updated_data
-                        conn.update(worksheet="Portfolios", data=updated_data)
+                        save_worksheet(conn, "Portfolios", updated_data)
                         
                         st.session_state.new_portfolio_created = new_portfolio_input
                         st.session_state.has_unsaved_changes = False # Just synced
@@ -1338,14 +1127,14 @@ elif authentication_status:
             if selected_portfolio and selected_portfolio != "🌍 Global Overview":
                 with st.expander(f"⚙️ Portfolio Settings"):
                     # Get current type for default
-                    current_type = user_all_data[user_all_data['portfolio_name'] == selected_portfolio]['portfolio_type'].iloc[0] if not user_all_data[user_all_data['portfolio_name'] == selected_portfolio].empty else "Growth & Dividends"
+                    current_type = portfolio_model.portfolio_type(username, selected_portfolio, "Growth & Dividends")
                     type_options = ["Stocks", "Kids", "Growth & Dividends"]
                     type_index = type_options.index(current_type) if current_type in type_options else 2
 
                     new_name_input = st.text_input("Rename Portfolio", value=selected_portfolio, placeholder="e.g., accumulation 2026")
                     new_type_input = st.selectbox("Portfolio Type", options=type_options, index=type_index)
                     
-                    if st.button("Save Settings"):
+                    if st.button("Save Settings", disabled=portfolios_read_only):
                         # Check if name changed and if new name already exists
                         name_changed = new_name_input != selected_portfolio
                         type_changed = new_type_input != current_type
@@ -1369,7 +1158,7 @@ elif authentication_status:
                                 updated_data.loc[mask, 'portfolio_type'] = new_type_input
                                 
                             st.session_state.master_data = updated_data
-                            conn.update(worksheet="Portfolios", data=updated_data)
+                            save_worksheet(conn, "Portfolios", updated_data)
                             st.session_state.has_unsaved_changes = False # Just synced
                             reset_portfolio_state()
                             
@@ -1383,12 +1172,12 @@ elif authentication_status:
             if selected_portfolio and selected_portfolio != "🌍 Global Overview":
                 with st.expander(f"⚠️ Delete '{selected_portfolio}'"):
                     st.warning("This action cannot be undone.")
-                    if st.button("Confirm Delete", type="primary", key="delete_portfolio_btn"):
+                    if st.button("Confirm Delete", type="primary", key="delete_portfolio_btn", disabled=portfolios_read_only):
                         # Remove all rows belonging to this portfolio
                         mask_to_delete = (data['username'] == username) & (data['portfolio_name'] == selected_portfolio)
                         updated_data = data[~mask_to_delete]
                         st.session_state.master_data = updated_data
-                        conn.update(worksheet="Portfolios", data=updated_data)
+                        save_worksheet(conn, "Portfolios", updated_data)
                         st.session_state.has_unsaved_changes = False # Just synced
                         reset_portfolio_state()
                         st.toast(f"Deleted portfolio: {selected_portfolio}")
@@ -1397,13 +1186,9 @@ elif authentication_status:
     # --- Sync Data Logic (Source of Truth) ---
     # Load current stocks from Master data (Persistent state)
     # This list reflects the state AT THE START of the run.
-    p_type = "Growth & Dividends"
-    if selected_portfolio:
-        p_rows = user_all_data[user_all_data['portfolio_name'] == selected_portfolio]
-        if not p_rows.empty:
-            p_type = p_rows['portfolio_type'].iloc[0]
+    p_type = portfolio_model.portfolio_type(username, selected_portfolio, "Growth & Dividends") if selected_portfolio else "Growth & Dividends"
 
-    user_portfolio_df = user_all_data[user_all_data['portfolio_name'] == selected_portfolio] if selected_portfolio else pd.DataFrame()
+    user_portfolio_df = portfolio_model.to_sheet(username, selected_portfolio) if selected_portfolio else pd.DataFrame()
     user_portfolio_df = user_portfolio_df[user_portfolio_df['stock_name'] != "__PLACEHOLDER__"] if not user_portfolio_df.empty else pd.DataFrame()
     
     # 2. Main Page Header & State Management Logic (Sync with DB) for consistent UI
@@ -1412,117 +1197,13 @@ elif authentication_status:
     
     # Initialize session state for stocks ONLY if portfolio changes or it's first run
     if st.session_state.get('last_selected_portfolio') != selected_portfolio:
-        current_stocks = []
-        if p_type == "Growth & Dividends":
-            # Map tickers and aggregate duplicate holdings (e.g. from historical merges)
-            ticker_map = {
-                "WTEQ.DE": "WTEQ.DE",
-                "VDIV.DE": "VDIV.DE",
-                "JMT.PT": "JMT.PT",
-                "EDP.PT": "EDP.PT",
-                "EGNL.UK": "EGLN.UK",
-                "EGLN.UK": "EGLN.UK",
-                "IBTE.UK": "YCSH.DE",
-                "PRAB.DE": "YCSH.DE"
-            }
-            aggregated_holdings = {}
-            for _, row in user_portfolio_df.iterrows():
-                raw_name = str(row['stock_name'])
-                mapped_name = ticker_map.get(raw_name, raw_name)
-                
-                if mapped_name not in aggregated_holdings:
-                    aggregated_holdings[mapped_name] = {
-                        "name": mapped_name,
-                        "current_value": 0.0,
-                        "target_allocation": 0.0,
-                        "tolerance": TOLERANCE_PP.get(mapped_name, 2.0),
-                        "expense_ratio": float(row.get('expense_ratio', 0.0)),
-                        "full_name": row.get('stock_full_name', mapped_name),
-                        "sector": row.get('sector', ''),
-                        "industry": row.get('industry', ''),
-                        "country": row.get('country', ''),
-                        "currency": row.get('currency', 'EUR'),
-                        "quantity": 0.0,
-                        "average_price": float(row.get('average_price', 0.0)),
-                        "current_price": float(row.get('current_price', 0.0)),
-                        "dividend_yield": float(row.get('dividend_yield', 0.0))
-                    }
-                
-                rec = aggregated_holdings[mapped_name]
-                rec["current_value"] += float(row['current_value'])
-                rec["quantity"] += float(row.get('quantity', 0.0))
-                if rec["expense_ratio"] == 0.0 and float(row.get('expense_ratio', 0.0)) > 0.0:
-                    rec["expense_ratio"] = float(row.get('expense_ratio', 0.0))
-                if rec["current_price"] == 0.0 and float(row.get('current_price', 0.0)) > 0.0:
-                    rec["current_price"] = float(row.get('current_price', 0.0))
-
-            current_stocks = list(aggregated_holdings.values())
-            
-            # Ensure all 9 target assets are present in the list
-            required_tickers = ["SPYL.DE", "IXUA.DE", "VFEA.DE", "WTEQ.DE", "VDIV.DE", "JMT.PT", "EDP.PT", "EGLN.UK", "YCSH.DE"]
-            existing_tickers = [s["name"] for s in current_stocks]
-            for ticker in required_tickers:
-                if ticker not in existing_tickers:
-                    current_stocks.append({
-                        "name": ticker,
-                        "current_value": 0.0,
-                        "target_allocation": 0.0,
-                        "tolerance": TOLERANCE_PP.get(ticker, 2.0),
-                        "expense_ratio": 0.0,
-                        "full_name": ticker,
-                        "sector": "",
-                        "industry": "",
-                        "country": "",
-                        "currency": "EUR",
-                        "quantity": 0.0,
-                        "average_price": 0.0,
-                        "current_price": 0.0,
-                        "dividend_yield": 0.0
-                    })
-        else:
-            for _, row in user_portfolio_df.iterrows():
-                current_stocks.append({
-                    "name": row['stock_name'],
-                    "current_value": row['current_value'],
-                    "target_allocation": row['target_allocation'],
-                    "tolerance": row.get('tolerance', 0.0),
-                    "expense_ratio": row.get('expense_ratio', 0.0),
-                    "full_name": row.get('stock_full_name', ''),
-                    "sector": row.get('sector', ''),
-                    "industry": row.get('industry', ''),
-                    "country": row.get('country', ''),
-                    "currency": row.get('currency', ''),
-                    "quantity": float(row.get('quantity', 0.0)),
-                    "average_price": float(row.get('average_price', 0.0)),
-                    "current_price": float(row.get('current_price', 0.0)),
-                    "dividend_yield": float(row.get('dividend_yield', 0.0))
-                })
-        st.session_state.stocks = current_stocks
+        portfolio_state = get_portfolio_states().get(portfolio_model, username, selected_portfolio, portfolio_version)
+        st.session_state.stocks = portfolio_state["stocks"]
         st.session_state.last_selected_portfolio = selected_portfolio
 
-        # Pre-populate session state keys for widgets if they don't exist
+        # Pre-populate session state keys for widgets (portfolio settings and per-stock inputs)
         if selected_portfolio:
-            # Load portfolio-level config from the first row of user_portfolio_df
-            if not user_portfolio_df.empty:
-                first_row = user_portfolio_df.iloc[0]
-                # Note: We use fixed keys for portfolio-level settings
-                st.session_state[f"{selected_portfolio}_monthly_invest"] = float(first_row.get('portfolio_monthly_invest', 1000.0))
-                st.session_state[f"{selected_portfolio}_use_indicators"] = bool(first_row.get('portfolio_use_indicators', False))
-                st.session_state[f"{selected_portfolio}_buffett_index"] = float(first_row.get('portfolio_buffett_index', 195.0))
-                st.session_state[f"{selected_portfolio}_birth_date"] = first_row.get('portfolio_birth_date', '')
-                try:
-                    st.session_state[f"{selected_portfolio}_uninvested_cash"] = float(first_row.get('portfolio_uninvested_cash', 0.0))
-                except (ValueError, TypeError):
-                    st.session_state[f"{selected_portfolio}_uninvested_cash"] = 0.0
-                
-                st.session_state[f"{selected_portfolio}_investor_birth_date"] = first_row.get('investor_birth_date', '1992-01-01')
-                
-            for idx, stock in enumerate(st.session_state.stocks):
-                key_prefix = f"{selected_portfolio}_{idx}"
-                st.session_state[f"{key_prefix}_name"] = stock['name']
-                st.session_state[f"{key_prefix}_value"] = float(stock['current_value'])
-                st.session_state[f"{key_prefix}_target"] = float(stock['target_allocation'])
-                st.session_state[f"{key_prefix}_tolerance"] = float(stock.get('tolerance', 0.0))
+            st.session_state.update(portfolio_state["widgets"])
 
     # --- Dynamic Overrides (Run every rerun to catch Birth Date changes) ---
     if selected_portfolio and 'stocks' in st.session_state:
@@ -1539,18 +1220,12 @@ elif authentication_status:
         # 3. Growth & Dividends Targets and Tolerances Overrides
         if p_type == "Growth & Dividends":
             birth_date_str = st.session_state.get(f"{selected_portfolio}_investor_birth_date", "1992-01-01")
-            try:
-                birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
-                today = date.today()
-                age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-            except Exception:
-                age = 34
+            age = age_from_birth_date(birth_date_str)
             
             buffett_index = float(st.session_state.get(f"{selected_portfolio}_buffett_index", 195.0))
             
             try:
-                targets_data = calculate_portfolio_targets(age, buffett_index)
-                unified_targets = targets_data["targets"]
+                unified_targets = lookup_targets(age, buffett_index)
             except Exception as e:
                 st.error(f"Error calculating Growth & Dividends Targets: {e}")
                 unified_targets = {}
@@ -1653,53 +1328,17 @@ elif authentication_status:
                     # - If current day is >= 28, use the current month's dividends
                     # - Otherwise, use the previous month's dividends
                     applicable_month_divs = 0.0
-                    now = datetime.now()
-                    
-                    if now.day >= 28:
-                        target_month = now.month
-                        target_year = now.year
-                    else:
-                        if now.month == 1:
-                            target_month, target_year = 12, now.year - 1
-                        else:
-                            target_month, target_year = now.month - 1, now.year
+                    # Investment month and year (from day 28 onwards, prepare next month's investment)
+                    (investment_month, investment_year), (target_month, target_year) = investment_calendar(datetime.now().date())
                     
                     applicable_month_name = date(target_year, target_month, 1).strftime('%B')
 
                     if p_type == "Growth & Dividends":
-                        div_df = st.session_state.dividends
-                        if not div_df.empty:
-                            div_df['date'] = pd.to_datetime(div_df['date'], errors='coerce')
-                            div_df['amount'] = pd.to_numeric(div_df['amount'], errors='coerce').fillna(0.0)
-                            
-                            mask = (div_df['username'] == username) & \
-                                   (div_df['portfolio_name'] == selected_portfolio) & \
-                                   (div_df['date'].dt.month == target_month) & \
-                                   (div_df['date'].dt.year == target_year)
-                            
-                            applicable_month_divs = div_df[mask]['amount'].sum()
+                        applicable_month_divs = dividend_ledger.total(username, selected_portfolio, year=target_year, month=target_month)
 
-                    # Determine investment month and year (from day 28 onwards, prepare next month's investment)
-                    if now.day >= 28:
-                        if now.month == 12:
-                            investment_month, investment_year = 1, now.year + 1
-                        else:
-                            investment_month, investment_year = now.month + 1, now.year
-                    else:
-                        investment_month, investment_year = now.month, now.year
-                    
                     investment_month_name = date(investment_year, investment_month, 1).strftime('%B')
 
-                    if p_type == "Kids":
-                        base_investment = 100.0 if investment_month in [6, 12] else 50.0
-                    elif p_type == "Growth & Dividends":
-                        # Exceptional override for next month (June 2026)
-                        if investment_month == 6 and investment_year == 2026:
-                            base_investment = 906.19
-                        else:
-                            base_investment = 1000.0 if investment_month in [6, 12] else 500.0
-                    else:
-                        base_investment = 500.0 # Default fallback
+                    base_investment = base_investment_for_month(p_type, investment_month, investment_year)
                         
                     st.markdown(f"**💳 Base Investment ({investment_month_name}):** €{base_investment:,.2f}")
 
@@ -1709,9 +1348,93 @@ elif authentication_status:
                         # Show Breakdown in Sidebar
                         st.markdown(f"**📅 Dividends ({applicable_month_name}):** €{applicable_month_divs:,.2f}")
                         st.markdown(f"**💰 Total Monthly Investment:** :green[€{monthly_investment:,.2f}]")
-                    else:
+                    elif p_type == "Kids":
                         monthly_investment = base_investment
-                    
+                    else:
+                        monthly_investment, diversion, received = base_investment, 0.0, 0.0
+                        # The opt-in is a portfolio setting, so every portfolio's choice counts, not only the one on screen
+                        saved_joint_hedge = bool(portfolio_model.settings(username, selected_portfolio).get('portfolio_joint_hedge', False))
+                        joint_hedge = st.checkbox(
+                            "🛡️ Fund Gold & Bonds jointly",
+                            value=saved_joint_hedge,
+                            key=f"{selected_portfolio}_joint_hedge",
+                            disabled=portfolios_read_only,
+                            help="Let this portfolio divert part of its budget (7% Accumulation, 10% Dividends) "
+                                 "when the global Gold & Bonds weight is below your target.",
+                        )
+                        if joint_hedge != saved_joint_hedge:
+                            data = data.copy()
+                            mask = (data['username'] == username) & (data['portfolio_name'] == selected_portfolio)
+                            data.loc[mask, 'portfolio_joint_hedge'] = joint_hedge
+                            save_worksheet(conn, "Portfolios", data)
+                            st.session_state.master_data = data
+                            st.rerun()
+                        # Gold & Bonds diversions of the portfolios that opted in are solved at once
+                        donors = [
+                            p for p in portfolio_model.portfolio_names(username)
+                            if portfolio_model.settings(username, p).get('portfolio_joint_hedge', False)
+                        ]
+                        if donors:
+                            with st.expander("🛡️ Gold & Bonds Funding"):
+                                hedge_target_pct = st.number_input(
+                                    "Gold & Bonds target (%)", key="hedge_target_pct",
+                                    value=st.session_state.get("hedge_target_pct", DEFAULT_HEDGE_TARGET_PCT),
+                                    min_value=0.0, max_value=100.0, step=0.5,
+                                )
+                                gold_share_pct = st.number_input(
+                                    "Gold share of the hedge (%)", key="hedge_gold_share_pct",
+                                    value=st.session_state.get("hedge_gold_share_pct", DEFAULT_GOLD_SHARE_PCT),
+                                    min_value=0.0, max_value=100.0, step=5.0,
+                                )
+                                hedge_funding = solve_hedge_funding(
+                                    portfolio_hedge_inputs(data, username, investment_month, investment_year, donors=donors),
+                                    target_pct=hedge_target_pct,
+                                    gold_share=gold_share_pct / 100.0,
+                                )
+                                funding_rows = hedge_funding["portfolios"].set_index('portfolio_name')
+                                if selected_portfolio in funding_rows.index:
+                                    monthly_investment = float(funding_rows.at[selected_portfolio, 'budget_after'])
+                                    diversion = float(funding_rows.at[selected_portfolio, 'diversion'])
+                                    received = float(funding_rows.at[selected_portfolio, 'received'])
+
+                                if hedge_funding["on_target"]:
+                                    st.caption(
+                                        f"Gold & Bonds at {hedge_funding['hedge_weight_before']:.2f}% "
+                                        f"(target {hedge_funding['target_pct']:.1f}%): diversions cancelled."
+                                    )
+                                elif not hedge_funding["has_receiver"]:
+                                    st.caption(
+                                        f"Gold & Bonds at {hedge_funding['hedge_weight_before']:.2f}% "
+                                        f"(target {hedge_funding['target_pct']:.1f}%): no Gold & Bonds portfolio "
+                                        f"to receive diversions, budgets left unchanged."
+                                    )
+                                else:
+                                    st.caption(
+                                        f"Gold & Bonds at {hedge_funding['hedge_weight_before']:.2f}% → "
+                                        f"{hedge_funding['hedge_weight_after']:.2f}% "
+                                        f"(target {hedge_funding['target_pct']:.1f}%). "
+                                        f"Gold €{hedge_funding['gold_buy']:,.2f} · Bonds €{hedge_funding['bond_buy']:,.2f}"
+                                    )
+                                st.dataframe(
+                                    hedge_funding["portfolios"][['portfolio_name', 'monthly_budget', 'diversion', 'received', 'budget_after']]
+                                    .rename(columns={
+                                        'portfolio_name': 'Portfolio',
+                                        'monthly_budget': 'Budget (€)',
+                                        'diversion': 'Diverted (€)',
+                                        'received': 'Received (€)',
+                                        'budget_after': 'Invest (€)',
+                                    }),
+                                    hide_index=True,
+                                    width="stretch",
+                                )
+
+                        if diversion > 0:
+                            st.markdown(f"**🛡️ Gold & Bonds Diversion:** -€{diversion:,.2f}")
+                        if received > 0:
+                            st.markdown(f"**🛡️ Diversions Received:** €{received:,.2f}")
+                        if diversion > 0 or received > 0:
+                            st.markdown(f"**💰 Total Monthly Investment:** :green[€{monthly_investment:,.2f}]")
+
                     if p_type == "Growth & Dividends":
                         st.markdown("### Market Indicators")
                         buffett_index_key = f"{selected_portfolio}_buffett_index"
@@ -1852,7 +1575,7 @@ elif authentication_status:
         if p_type == "Stocks":
             tab_list = ["📈 Portfolio Details", "💰 Dividend Tracker", "🪙 Uninvested Cash"]
         elif p_type == "Growth & Dividends":
-            tab_list = ["📊 Manage Portfolio", "💰 Dividend Tracker", "🪙 Uninvested Cash"]
+            tab_list = ["📊 Manage Portfolio", "💰 Dividend Tracker", "🪙 Uninvested Cash", "🔮 Simulation"]
         else: # Kids
             tab_list = ["📊 Manage Portfolio", "🪙 Uninvested Cash"]
             
@@ -1964,6 +1687,10 @@ elif authentication_status:
                                     updated_list.append(updated_row)
                             
                             st.session_state.stocks = updated_list
+
+                            # Standard portfolios: refresh recommendations from the edit instead of clearing them
+                            if p_type != "Growth & Dividends":
+                                refresh_live_recommendations(selected_portfolio, old_stocks, updated_list, monthly_investment)
                             
                             # Aggressive sync: Rerun ensures Dashboard KPIs and other blocks see the new state immediately
                             st.rerun()
@@ -1973,7 +1700,10 @@ elif authentication_status:
                             if st.button("↩️ Undo Delete"):
                                 if st.session_state.undo_buffer:
                                     # Restore deleted items
+                                    before_undo = list(st.session_state.stocks)
                                     st.session_state.stocks.extend(st.session_state.undo_buffer)
+                                    if p_type != "Growth & Dividends":
+                                        refresh_live_recommendations(selected_portfolio, before_undo, st.session_state.stocks, monthly_investment)
                                     st.session_state.undo_buffer = []
                                     st.session_state.show_undo = False
                                     
@@ -1988,7 +1718,7 @@ elif authentication_status:
                         st.markdown("<br>", unsafe_allow_html=True)
                         
                         # Save Logic
-                        if st.button("💾 Save All Changes", width="stretch"):
+                        if st.button("💾 Save All Changes", width="stretch", disabled=portfolios_read_only):
                             any_content_changes = False
                             
                             # 1. Update Portfolio-Level Config (Broadcast)
@@ -2001,13 +1731,14 @@ elif authentication_status:
                             except:
                                 portfolio_uninvested_cash = 0.0
                             portfolio_type = p_type
+                            portfolio_joint_hedge = bool(portfolio_model.settings(username, selected_portfolio).get('portfolio_joint_hedge', False))
                             portfolio_investor_birth = st.session_state.get(f"{selected_portfolio}_investor_birth_date", '1992-01-01')
         
                             mask = (data['username'] == username) & (data['portfolio_name'] == selected_portfolio)
                             
                             # Check for Config Changes
                             if not user_portfolio_df.empty:
-                                fr = user_portfolio_df.iloc[0]
+                                fr = portfolio_model.settings(username, selected_portfolio)
                                 try:
                                     fr_cash = float(fr.get('portfolio_uninvested_cash', 0.0))
                                 except:
@@ -2019,6 +1750,7 @@ elif authentication_status:
                                     portfolio_investor_birth != fr.get('investor_birth_date', '1992-01-01') or
                                     abs(portfolio_buffett - fr.get('portfolio_buffett_index', 195.0)) > 0.1):
                                     any_content_changes = True
+                                    data = data.copy()
                                     data.loc[mask, 'portfolio_monthly_invest'] = portfolio_invest
                                     data.loc[mask, 'portfolio_use_indicators'] = portfolio_use_ind
                                     data.loc[mask, 'portfolio_buffett_index'] = portfolio_buffett
@@ -2051,6 +1783,7 @@ elif authentication_status:
                                         "portfolio_buffett_index": portfolio_buffett,
                                         "portfolio_birth_date": portfolio_birth_date,
                                         "portfolio_uninvested_cash": portfolio_uninvested_cash,
+                                        "portfolio_joint_hedge": portfolio_joint_hedge,
                                         "investor_birth_date": portfolio_investor_birth,
                                         "portfolio_type": portfolio_type,
                                         "stock_full_name": row.get('full_name', ''),
@@ -2074,6 +1807,7 @@ elif authentication_status:
                                      "portfolio_monthly_invest": portfolio_invest,
                                     "portfolio_use_indicators": portfolio_use_ind,
                                     "portfolio_buffett_index": portfolio_buffett,
+                                    "portfolio_joint_hedge": portfolio_joint_hedge,
                                     "portfolio_type": portfolio_type,
                                     "stock_full_name": '',
                                     "sector": '',
@@ -2087,7 +1821,7 @@ elif authentication_status:
                             
                             updated_data = pd.concat([data, pd.DataFrame(new_rows)], ignore_index=True)
                             st.session_state.master_data = updated_data
-                            conn.update(worksheet="Portfolios", data=updated_data)
+                            save_worksheet(conn, "Portfolios", updated_data)
                             
                             st.session_state.has_unsaved_changes = False
                             st.session_state.show_save_success = True
@@ -2099,6 +1833,11 @@ elif authentication_status:
                 with col_side:
                     with st.container(border=True):
                         st.subheader("🎯 Action Center")
+                        whole_shares_only = st.checkbox(
+                            "🧩 Whole shares only",
+                            key=f"{selected_portfolio}_whole_shares",
+                            help="For brokers without fractional shares: orders are whole shares at each holding's current price.",
+                        )
                         if st.button("🧮 Calculate Allocation", width="stretch"):
                             if p_type == "Growth & Dividends":
                                 import copy
@@ -2110,63 +1849,22 @@ elif authentication_status:
                                 
                                 # Extract investor's age
                                 birth_date_str = st.session_state.get(f"{selected_portfolio}_investor_birth_date", "1992-01-01")
-                                try:
-                                    birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
-                                    today = date.today()
-                                    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-                                except Exception:
-                                    age = 34
+                                age = age_from_birth_date(birth_date_str)
                                     
                                 # Extract Buffett Index
                                 buffett_index = float(st.session_state.get(f"{selected_portfolio}_buffett_index", 195.0))
                                 
                                 # Execute monthly buys logic with defensive transition plan
                                 try:
-                                    # Get dynamic target weights for EGLN.UK and YCSH.DE
-                                    targets_data = calculate_portfolio_targets(age, buffett_index)
-                                    targets = targets_data["targets"]
-                                    egln_tgt = targets.get("EGLN.UK", 3.0)
-                                    prab_tgt = targets.get("YCSH.DE", 2.7)
-                                    
-                                    total_port_val = sum(current_values.get(asset, 0.0) for asset in current_values)
-                                    
-                                    transition_plan = calculate_egln_prab_transition_plan(
-                                        portfolio_value=total_port_val,
-                                        monthly_contribution=current_monthly_base,
-                                        current_egln_value=current_values.get("EGLN.UK", 0.0),
-                                        current_prab_value=current_values.get("YCSH.DE", 0.0),
-                                        months=4,
-                                        egln_target_pct=egln_tgt,
-                                        prab_target_pct=prab_tgt,
-                                        min_order_size=5.0
-                                    )
-                                    
-                                    # Extract first month's purchases
-                                    current_month_plan = transition_plan[0]
-                                    egln_buy = current_month_plan["egln_buy"]
-                                    prab_buy = current_month_plan["prab_buy"]
-                                    remaining_contrib = current_month_plan["remaining_for_normal_strategy"]
-                                    
-                                    # Allocate the rest of the monthly contribution using normal rebalancing on remaining assets
-                                    buys_data = calculate_monthly_buys(
+                                    buys_data = calculate_growth_dividends_buys(
                                         age=age,
                                         buffett_index=buffett_index,
                                         current_values=current_values,
-                                        monthly_contribution=remaining_contrib,
+                                        monthly_contribution=current_monthly_base,
                                         min_order_size=5.0,
-                                        exclude_defensive=True
+                                        transition_months=4,
                                     )
                                     
-                                    # Integrate transition buys back into the final results
-                                    buys_data["buys"]["EGLN.UK"] = egln_buy
-                                    buys_data["buys"]["YCSH.DE"] = prab_buy
-                                    
-                                    buys_data["raw_buys"]["EGLN.UK"] = egln_buy
-                                    buys_data["raw_buys"]["YCSH.DE"] = prab_buy
-                                    
-                                    buys_data["portfolio_value_after"] = round(total_port_val + current_monthly_base, 2)
-                                    buys_data["portfolio_targets"] = targets
-                                    
                                 except Exception as e:
                                     st.error(f"Error calculating Growth & Dividends buys: {e}")
                                     st.stop()
@@ -2175,6 +1873,13 @@ elif authentication_status:
                                 current_weights = buys_data["current_weights"]
                                 buys_map = buys_data["buys"]
                                 leftover_cash = buys_data["leftover_cash"]
+
+                                if whole_shares_only:
+                                    share_plan = whole_share_orders(live_stocks, buys_map, current_monthly_base, min_order_size=5.0)
+                                    if share_plan["skipped"]:
+                                        st.warning(f"No current price for {', '.join(share_plan['skipped'])}: not bought in whole-share mode.")
+                                    buys_map = share_plan["orders"]
+                                    leftover_cash = share_plan["leftover_cash"]
                                 
                                 portfolio_value_before = buys_data["portfolio_value_before"]
                                 portfolio_value_after = buys_data["portfolio_value_after"]
@@ -2198,20 +1903,15 @@ elif authentication_status:
                                         "New Value": new_val,
                                         "New %": (new_val / portfolio_value_after * 100) if portfolio_value_after > 0 else 0
                                     })
+                                    if whole_shares_only:
+                                        allocations[-1]["Shares"] = share_plan["quantities"].get(ticker, 0)
+                                        allocations[-1]["Optimal"] = share_plan["optimal"]
                                 
                                 invest_map = buys_map
                                 total_current_live = portfolio_value_before
                                 current_monthly_base = current_monthly_base
                                 remaining_investment = leftover_cash
                                 
-                                if 'vault_alloc_by_portfolio' not in st.session_state:
-                                    st.session_state.vault_alloc_by_portfolio = {}
-                                st.session_state.vault_alloc_by_portfolio[selected_portfolio] = {
-                                    "type": p_type,
-                                    "EGLN.UK": buys_map.get("EGLN.UK", 0.0),
-                                    "YCSH.DE": buys_map.get("YCSH.DE", 0.0),
-                                }
-                                
                                 import pandas as pd
                                 alloc_df = pd.DataFrame(allocations)
                                 if not alloc_df.empty:
@@ -2226,241 +1926,24 @@ elif authentication_status:
                                 }
                                 st.session_state.show_recommendations = True
                             else:
-                                import copy
-                                live_stocks = copy.deepcopy(st.session_state.stocks)
-                                
-                                total_current_global = sum(s['current_value'] for s in live_stocks)
+                                live_stocks = [dict(s) for s in st.session_state.stocks]
                                 core_target_live = sum(s['target_allocation'] for s in live_stocks)
             
                                 # The Core stocks must strictly sum to 100%
                                 if abs(core_target_live - 100.0) > 0.01:
                                     st.error(f"As suas ações base somam {core_target_live:.1f}%. Ajuste para que somem exatamente 100%.")
                                 else:
-                                    import math
-                                    
-                                    # Current local Monthly Investment (from Sidebar or Auto)
-                                    current_monthly_base = float(monthly_investment) 
-                                    
-                                    global_theoretical = total_current_global + current_monthly_base
-                                    remaining_investment = float(current_monthly_base)
-                                    
-                                    # Initial map for all stocks
-                                    final_investments = {s['name']: 0.0 for s in live_stocks}
-                                    stocks_to_process = [s for s in live_stocks]
-                                    
-
-                                    # Formally set Rebased Totals so Core targets (which sum to 100%) distribute flawlessly
-                                    total_current_live = sum(s['current_value'] for s in stocks_to_process)
-                                    total_theoretical = total_current_live + remaining_investment
-                                    
-                                    # --- STEP 1: Special Handling for RENE.PT...
-                                    if selected_portfolio and "dividends" in selected_portfolio.lower():
-                                        rene_stock = next((s for s in live_stocks if s['name'].upper() == "RENE.PT"), None)
-                                        if rene_stock:
-                                            target_val = total_theoretical * (rene_stock['target_allocation'] / 100.0)
-                                            gap = target_val - rene_stock['current_value']
-                                            price = rene_stock.get('current_price', 0.0)
-                                            
-                                            invest_real = 0.0
-                                            if gap > 0 and price > 0:
-                                                # Determine integer quantity based on Gap
-                                                qty = math.floor(gap / price)
-                                                invest_real = qty * price
-                                                
-                                                # Cap by available monthly investment
-                                                if invest_real > remaining_investment:
-                                                    qty = math.floor(remaining_investment / price)
-                                                    invest_real = qty * price
-                                                
-                                                # MinBuy check (5€)
-                                                if invest_real < 5.0 and invest_real > 0:
-                                                    invest_real = 0.0
-                                            
-                                            final_investments[rene_stock['name']] = invest_real
-                                            remaining_investment -= invest_real
-                                            # Remove RENE from the common pool for the next phases
-                                            stocks_to_process = [s for s in stocks_to_process if s['name'].upper() != "RENE.PT"]
-     
-                                    # --- STEP 2: Standard Rebalancing Algorithm for Remaining Stocks ---
-                                    if remaining_investment > 0 and stocks_to_process:
-                                        # Phase A: Calculate Gaps and identify deviations
-                                        stock_data_p = []
-                                        sum_positive_deviations = 0.0
-                                        
-                                        for stock in stocks_to_process:
-                                            current_weight = (stock['current_value'] / total_current_live * 100.0) if total_current_live > 0 else 0.0
-                                            target_weight = stock['target_allocation']
-                                            deviation = target_weight - current_weight
-                                            
-                                            min_band = target_weight - stock.get('tolerance', 0.0)
-                                            below_min_band = current_weight < min_band
-                                            below_target = deviation > 0
-                                            
-                                            if below_target:
-                                                # Note: We don't cap by max_band here as requested for Dividends redistribution logic
-                                                sum_positive_deviations += deviation
-                                                
-                                            target_val = total_theoretical * (target_weight / 100.0)
-                                            gap = target_val - stock['current_value']
-                                            
-                                            stock_data_p.append({
-                                                'name': stock['name'],
-                                                'Gap': gap,
-                                                'stock': stock,
-                                                'deviation': deviation,
-                                                'below_min_band': below_min_band,
-                                                'below_target': below_target,
-                                                'invest': 0.0
-                                            })
-                                        
-                                        # Phase B: Priority for assets below the minimum band (Emergency)
-                                        total_needed_band = 0.0
-                                        for item in stock_data_p:
-                                            if item['below_min_band']:
-                                                min_band_eur = total_theoretical * ((item['stock']['target_allocation'] - item['stock'].get('tolerance', 0.0)) / 100.0)
-                                                needed = max(0.0, min_band_eur - item['stock']['current_value'])
-                                                item['needed_band'] = needed
-                                                total_needed_band += needed
-                                            else:
-                                                item['needed_band'] = 0.0
-                                                
-                                        if total_needed_band > 0 and remaining_investment > 0:
-                                            if total_needed_band <= remaining_investment:
-                                                for item in stock_data_p:
-                                                    if item['needed_band'] > 0:
-                                                        alloc = item['needed_band']
-                                                        item['invest'] += alloc
-                                                        remaining_investment -= alloc
-                                            else:
-                                                # Proportional distribution of emergency funds
-                                                emergency_funds = remaining_investment
-                                                for item in stock_data_p:
-                                                    if item['needed_band'] > 0:
-                                                        prop_alloc = (item['needed_band'] / total_needed_band) * emergency_funds
-                                                        item['invest'] += prop_alloc
-                                                remaining_investment = 0.0
-                                        
-                                        # Phase C: Proportional Gap Filling
-                                        if remaining_investment > 0 and sum_positive_deviations > 0:
-                                            funds_left = remaining_investment
-                                            proportions = []
-                                            for item in stock_data_p:
-                                                if item['below_target']:
-                                                    prop_alloc = (item['deviation'] / sum_positive_deviations) * funds_left
-                                                    max_inv = max(0.0, item['Gap'] - item['invest'])
-                                                    ideal_invest = min(prop_alloc, max_inv)
-                                                    proportions.append({'item': item, 'ideal': ideal_invest})
-                                            
-                                            for p in proportions:
-                                                p['item']['invest'] += p['ideal']
-                                                remaining_investment -= p['ideal']
-                                                
-                                        # Phase D: Leftover gap filling
-                                        if remaining_investment >= 0.01:
-                                            sorted_gaps = sorted(stock_data_p, key=lambda x: x['Gap'] - x['invest'], reverse=True)
-                                            for g in sorted_gaps:
-                                                if remaining_investment < 0.01: break
-                                                needed = max(0.0, g['Gap'] - g['invest'])
-                                                if needed > 0:
-                                                    alloc = min(remaining_investment, needed)
-                                                    g['invest'] += alloc
-                                                    remaining_investment -= alloc
-                                                    
-                                        # Update final investments from the processing pool
-                                        for item in stock_data_p:
-                                            final_investments[item['name']] = item['invest']
-     
-                                    # --- STEP 3: Post-Processing Rule Enforcement ---
-                                    is_dividends_p = "dividend" in selected_portfolio.lower()
-                                    if is_dividends_p:
-                                        # 1. Enforce Integer/Floor and MinBuy of 5€
-                                        total_after_round = 0.0
-                                        for ticker, invest in final_investments.items():
-                                            if ticker.upper() == "RENE.PT":
-                                                # RENE is already processed/múltiplo do preço
-                                                total_after_round += invest
-                                                continue
-                                                
-                                            # Others: Round down to integer euros
-                                            rounded_invest = float(math.floor(invest))
-                                            
-                                            # MinBuy enforcement for PT stocks
-                                            if ticker.upper().endswith(".PT") and rounded_invest < 5.0 and rounded_invest > 0:
-                                                rounded_invest = 0.0
-                                                
-                                            final_investments[ticker] = rounded_invest
-                                            total_after_round += rounded_invest
-                                            
-                                        # 2. Redistribution of Cents ("The Dump")
-                                        # All remaining budget (including cents from RENE and floors) goes to the largest investment
-                                        final_remaining = current_monthly_base - total_after_round
-                                        if final_remaining > 0:
-                                            dump_ticker = max(final_investments, key=final_investments.get)
-                                            final_investments[dump_ticker] += final_remaining
-                                            remaining_investment = 0.0
-                                        else:
-                                            remaining_investment = final_remaining
-                                    else:
-                                        # Standard Portfolios (Non-Dividends)
-                                        # Just apply floor to all (as per previous standard logic)
-                                        total_after_round = 0.0
-                                        for ticker, invest in final_investments.items():
-                                            rounded = float(math.floor(invest))
-                                            final_investments[ticker] = rounded
-                                            total_after_round += rounded
-                                        
-                                        # For standard, we usually just keep the remaining in the wallet or dump it 
-                                        # to the largest gap if small. Let's keep it consistent.
-                                        final_remaining = current_monthly_base - total_after_round
-                                        if final_remaining >= 1.0:
-                                            # Use standard "largest gap" redistribution for whole euros
-                                            sorted_gaps = sorted(final_investments.keys(), key=lambda x: next((s['target_allocation'] for s in live_stocks if s['name']==x), 0), reverse=True)
-                                            if sorted_gaps:
-                                                final_investments[sorted_gaps[0]] += float(math.floor(final_remaining))
-                                    invest_map = final_investments
-
-                                    # --- END EXISTING LOGIC ---
-                                
-                                # --- COMMON DISPLAY LOGIC ---
-                                allocations = []
-                                new_total_actual = float(total_current_live + current_monthly_base)
-                                new_total_theoretical = total_current_live + current_monthly_base # Ensure defined
-                                
-                                for stock in live_stocks:
-                                    ticker = stock['name']
-                                    final_invest = invest_map.get(ticker, 0.0)
-                                    target_val = new_total_theoretical * (stock['target_allocation'] / 100.0)
-                                    new_val = stock['current_value'] + final_invest
-                                    
-                                    allocations.append({
-                                        "Stock": ticker, 
-                                        "Current Value": stock['current_value'], 
-                                        "Current %": (stock['current_value'] / total_current_live * 100) if total_current_live > 0 else 0, 
-                                        "TER %": stock.get('expense_ratio', 0.0),
-                                        "Target %": stock['target_allocation'], 
-                                        "Target Value": target_val,
-                                        "Investment": final_invest, 
-                                        "New Value": new_val, 
-                                        "New %": (new_val / new_total_actual * 100) if new_total_actual > 0 else 0
-                                    })
-                                
-                                alloc_df = pd.DataFrame(allocations)
-                                if not alloc_df.empty:
-                                    custom_order_list = ["SPYL.DE", "IXUA.DE", "VFEA.DE", "YCSH.DE", "EGLN.UK"]
-                                    alloc_df['order_idx'] = alloc_df['Stock'].apply(lambda x: custom_order_list.index(x) if x in custom_order_list else 99)
-                                    alloc_df = alloc_df.sort_values(by='order_idx').drop(columns=['order_idx'])
+                                    # Kept per portfolio so later edits refresh the recommendations live
+                                    allocator = IncrementalAllocator(
+                                        live_stocks, float(monthly_investment),
+                                        **standard_portfolio_options(selected_portfolio),
+                                    )
+                                    if 'allocators' not in st.session_state:
+                                        st.session_state.allocators = {}
+                                    st.session_state.allocators[selected_portfolio] = allocator
 
-                                st.session_state.last_calculation = {"df": alloc_df, "monthly_investment": current_monthly_base, "remaining": remaining_investment}
-                                st.session_state.show_recommendations = True
-                                
-                                # Persist vault allocations per portfolio so the Hedges tab can aggregate them
-                                if 'vault_alloc_by_portfolio' not in st.session_state:
-                                    st.session_state.vault_alloc_by_portfolio = {}
-                                st.session_state.vault_alloc_by_portfolio[selected_portfolio] = {
-                                    "type": p_type,
-                                    "EGNL.UK": final_investments.get("EGNL.UK", 0.0),
-                                    "IBTE.UK": final_investments.get("IBTE.UK", 0.0),
-                                }
+                                    st.session_state.last_calculation = build_standard_calculation(allocator, live_stocks, whole_shares_only)
+                                    st.session_state.show_recommendations = True
                         
                         if st.session_state.show_recommendations:
                             # st.divider()
@@ -2468,6 +1951,150 @@ elif authentication_status:
                             if calc['remaining'] > 0.01:
                                 st.warning(f"Note: €{calc['remaining']:.2f} could not be allocated.")
                             st.success("Allocation Calculated!")
+
+                        if p_type == "Growth & Dividends":
+                            with st.expander("📅 Multi-Month Plan"):
+                                plan_months = st.slider("Months to plan", 6, MAX_PLAN_MONTHS, 12, key=f"{selected_portfolio}_plan_months")
+                                # Expected monthly dividends from each holding's yield
+                                expected_divs = sum(
+                                    float(s.get('current_value', 0.0) or 0.0) * float(s.get('dividend_yield', 0.0) or 0.0)
+                                    for s in st.session_state.stocks
+                                ) / 100.0 / 12.0
+                                st.caption(f"Base schedule plus ~€{expected_divs:,.2f}/month in expected dividends.")
+                                if st.button("🗓️ Build Plan", width="stretch"):
+                                    (plan_month, plan_year), _ = investment_calendar(datetime.now().date())
+                                    plan_start = date(plan_year, plan_month, 1)
+                                    try:
+                                        plan = plan_contributions(
+                                            birth_date=st.session_state.get(f"{selected_portfolio}_investor_birth_date", "1992-01-01"),
+                                            buffett_index=float(st.session_state.get(f"{selected_portfolio}_buffett_index", 195.0)),
+                                            current_values={s['name']: s['current_value'] for s in st.session_state.stocks},
+                                            budgets=planned_budgets(plan_months, plan_start, float(monthly_investment), expected_divs),
+                                            start=plan_start,
+                                        )
+                                    except ValueError as e:
+                                        st.error(f"Error building the plan: {e}")
+                                    else:
+                                        plan_df = pd.DataFrame([
+                                            {"Month": m["month"].strftime("%b %Y"), "Budget": m["budget"], **m["buys"], "Drift (pp)": m["drift_outside_band_pp"]}
+                                            for m in plan["schedule"]
+                                        ])
+                                        st.dataframe(plan_df.style.format(precision=2), width="stretch", hide_index=True)
+                                        st.caption(f"Cumulative drift outside the tolerance bands: {plan['total_drift_outside_band_pp']:.2f} pp")
+
+                            with st.expander("🌡️ Sensitivity"):
+                                st.caption("This month's buy plan for every Buffett value and age, from your current holdings.")
+                                sens_levels = [round(float(monthly_investment) * f, 2) for f in (0.5, 1.0, 2.0)]
+                                sens_surface = buy_surface(
+                                    {s['name']: s['current_value'] for s in st.session_state.stocks},
+                                    sens_levels,
+                                )
+                                sens_col1, sens_col2 = st.columns(2)
+                                with sens_col1:
+                                    sens_metric = st.selectbox(
+                                        "Show",
+                                        options=sens_surface["assets"] + ["Leftover Cash"],
+                                        key=f"{selected_portfolio}_sens_metric",
+                                    )
+                                with sens_col2:
+                                    sens_level = st.radio(
+                                        "Contribution",
+                                        options=list(range(len(sens_levels))),
+                                        index=1,
+                                        format_func=lambda i: f"€{sens_levels[i]:,.0f}",
+                                        horizontal=True,
+                                        key=f"{selected_portfolio}_sens_level",
+                                    )
+
+                                if sens_metric == "Leftover Cash":
+                                    sens_z = sens_surface["leftover_cash"][sens_level]
+                                else:
+                                    sens_z = sens_surface["buys"][sens_level, :, :, sens_surface["assets"].index(sens_metric)]
+
+                                fig_sens = go.Figure(go.Heatmap(
+                                    z=sens_z,
+                                    x=sens_surface["buffett"],
+                                    y=sens_surface["ages"],
+                                    colorscale="Viridis",
+                                    colorbar=dict(title="€"),
+                                    hovertemplate="Buffett %{x:.0f}%<br>Age %{y}<br>€%{z:,.2f}<extra></extra>",
+                                ))
+                                fig_sens.add_trace(go.Scatter(
+                                    x=[float(st.session_state.get(f"{selected_portfolio}_buffett_index", 195.0))],
+                                    y=[age_from_birth_date(st.session_state.get(f"{selected_portfolio}_investor_birth_date", "1992-01-01"))],
+                                    mode="markers",
+                                    marker=dict(color="#F43F5E", size=12, symbol="x"),
+                                    name="Today",
+                                    hoverinfo="skip",
+                                ))
+                                fig_sens.update_layout(
+                                    paper_bgcolor='rgba(0,0,0,0)',
+                                    plot_bgcolor='rgba(0,0,0,0)',
+                                    xaxis_title="Buffett Indicator (%)",
+                                    yaxis_title="Age",
+                                    margin=dict(l=20, r=20, t=20, b=20),
+                                    height=380,
+                                    showlegend=False,
+                                )
+                                st.plotly_chart(fig_sens, width="stretch")
+                                st.caption("Blank cells: the EGLN/YCSH transition alone would use up the contribution.")
+
+                        with st.expander("⚖️ Full Rebalance (may sell)"):
+                            st.caption("Sells overweight positions only when the drift removed is worth the estimated tax on the realized gain (cost basis from quantity × average price).")
+                            reb_col1, reb_col2 = st.columns(2)
+                            with reb_col1:
+                                reb_tax_rate = st.number_input(
+                                    "Capital Gains Tax (%)", min_value=0.0, max_value=100.0,
+                                    value=DEFAULT_TAX_RATE * 100.0, step=0.5, key=f"{selected_portfolio}_reb_tax",
+                                )
+                            with reb_col2:
+                                reb_aversion = st.slider(
+                                    "Drift Aversion", min_value=0.5, max_value=50.0, value=DEFAULT_DRIFT_AVERSION,
+                                    step=0.5, key=f"{selected_portfolio}_reb_aversion",
+                                    help="Higher values accept more tax to get closer to target.",
+                                )
+                            reb_with_cash = st.checkbox(
+                                f"Include this month's contribution (€{float(monthly_investment):,.2f})",
+                                value=True, key=f"{selected_portfolio}_reb_cash",
+                            )
+                            if st.button("⚖️ Compute Rebalance", width="stretch"):
+                                reb_stocks = st.session_state.stocks
+                                if p_type == "Growth & Dividends":
+                                    reb_targets = lookup_targets(
+                                        age_from_birth_date(st.session_state.get(f"{selected_portfolio}_investor_birth_date", "1992-01-01")),
+                                        float(st.session_state.get(f"{selected_portfolio}_buffett_index", 195.0)),
+                                    )
+                                    reb_tolerances = TOLERANCE_PP
+                                else:
+                                    reb_targets = {s['name']: s['target_allocation'] for s in reb_stocks}
+                                    reb_tolerances = {s['name']: s.get('tolerance', 0.0) for s in reb_stocks}
+                                try:
+                                    rebalance = rebalance_with_sells(
+                                        reb_stocks, reb_targets, reb_tolerances,
+                                        cash=float(monthly_investment) if reb_with_cash else 0.0,
+                                        tax_rate=reb_tax_rate / 100.0,
+                                        drift_aversion=reb_aversion,
+                                    )
+                                except ValueError as e:
+                                    st.error(f"Error computing the rebalance: {e}")
+                                else:
+                                    reb_df = pd.DataFrame(rebalance["trades"])
+                                    if not reb_df.empty:
+                                        reb_df = reb_df[['name', 'current_value', 'trade', 'value_after', 'target_allocation', 'weight_after', 'estimated_tax']].rename(columns={
+                                            'name': 'Stock',
+                                            'current_value': 'Current (€)',
+                                            'trade': 'Buy / Sell (€)',
+                                            'value_after': 'After (€)',
+                                            'target_allocation': 'Target (%)',
+                                            'weight_after': 'Weight After (%)',
+                                            'estimated_tax': 'Est. Tax (€)',
+                                        })
+                                        st.dataframe(reb_df.style.format(precision=2), width="stretch", hide_index=True)
+                                    st.caption(
+                                        f"Bought €{rebalance['total_bought']:,.2f} · Sold €{rebalance['total_sold']:,.2f} · "
+                                        f"Est. tax €{rebalance['estimated_tax']:,.2f} · Drift outside bands "
+                                        f"{rebalance['drift_before_pp']:.2f} → {rebalance['drift_after_pp']:.2f} pp"
+                                    )
         
                 # --- Bottom Row: Results & Visualization ---
                 if st.session_state.show_recommendations:
@@ -2520,7 +2147,7 @@ elif authentication_status:
                         # Use st.dataframe for responsive horizontal scrolling
                         st.dataframe(styled_df, use_container_width=True, hide_index=True)
                         
-                        if st.button("💾 Log to History", width="stretch"):
+                        if st.button("💾 Log to History", width="stretch", disabled=portfolios_read_only or bool(get_local_store().read_only("InvestmentLog"))):
                             with st.spinner("Logging..."):
                                 try:
                                     log_rows = df.copy()
@@ -2529,10 +2156,7 @@ elif authentication_status:
                                     log_rows['portfolio_name'] = selected_portfolio
                                     cols_to_log = ['timestamp', 'username', 'portfolio_name', 'Stock', 'Current Value', 'Current %', 'Target %', 'Target Value', 'Investment', 'New Value', 'New %']
                                     log_df = log_rows[cols_to_log]
-                                    try: existing_history = conn.read(worksheet="InvestmentLog", ttl=0)
-                                    except: existing_history = pd.DataFrame()
-                                    new_history = pd.concat([existing_history, log_df], ignore_index=True) if existing_history is not None and not existing_history.empty else log_df
-                                    conn.update(worksheet="InvestmentLog", data=new_history)
+                                    append_worksheet(conn, "InvestmentLog", log_df)
 
                                     # --- APPLY NEW VALUES TO PORTFOLIO ---
                                     master_data = st.session_state.master_data.copy()
@@ -2549,7 +2173,7 @@ elif authentication_status:
                                             master_data.loc[mask, 'current_value'] = new_val
                                     
                                     # Push updated Portfolio data back to GSheets
-                                    conn.update(worksheet="Portfolios", data=master_data)
+                                    save_worksheet(conn, "Portfolios", master_data)
                                     st.session_state.master_data = master_data
                                     
                                     st.session_state.show_log_success = True
@@ -2565,6 +2189,11 @@ elif authentication_status:
                             st.success("Logged & Portfolio Updated!")
                             st.balloons()
                             st.session_state.show_log_success = False
+
+                        recent_log = get_local_store().tail("InvestmentLog", 20, username=username, portfolio_name=selected_portfolio)
+                        if not recent_log.empty:
+                            with st.expander("🕘 Recent History"):
+                                st.dataframe(recent_log.drop(columns=['username', 'portfolio_name']), width="stretch", hide_index=True)
         
                     # Charts Row
                     with st.container(border=True):
@@ -2628,13 +2257,7 @@ elif authentication_status:
                     }
 
                     # Calculate total dividends received per ticker
-                    df_divs = st.session_state.dividends
-                    dividend_map = {}
-                    if not df_divs.empty:
-                        df_divs['amount'] = pd.to_numeric(df_divs['amount'], errors='coerce').fillna(0.0)
-                        mask = (df_divs['username'] == username) & (df_divs['portfolio_name'] == selected_portfolio)
-                        my_divs = df_divs[mask]
-                        dividend_map = my_divs.groupby('ticker')['amount'].sum().to_dict()
+                    dividend_map = dividend_ledger.ticker_totals(username, selected_portfolio)
 
                     details_df = pd.DataFrame(st.session_state.stocks)
                     if details_df.empty:
@@ -2838,7 +2461,10 @@ elif authentication_status:
                     if st.session_state.get('show_undo'):
                         if st.button("↩️ Undo Delete", key="undo_details_btn", width="stretch"):
                             if st.session_state.undo_buffer:
+                                before_undo = list(st.session_state.stocks)
                                 st.session_state.stocks.extend(st.session_state.undo_buffer)
+                                if p_type != "Growth & Dividends":
+                                    refresh_live_recommendations(selected_portfolio, before_undo, st.session_state.stocks, monthly_investment)
                                 st.session_state.undo_buffer = []
                                 st.session_state.show_undo = False
                                 st.session_state.editor_key += 1
@@ -2846,7 +2472,7 @@ elif authentication_status:
                                 st.rerun()
                 
                 with s_col:
-                    if st.button("💾 Save All Changes", key="save_details_btn", width="stretch"):
+                    if st.button("💾 Save All Changes", key="save_details_btn", width="stretch", disabled=portfolios_read_only):
                         # Determine current portfolio config
                         portfolio_invest = st.session_state.get(f"{selected_portfolio}_monthly_invest", 1000.0)
                         portfolio_use_ind = st.session_state.get(f"{selected_portfolio}_use_indicators", False)
@@ -2857,6 +2483,7 @@ elif authentication_status:
                         except:
                             portfolio_uninvested_cash = 0.0
                         portfolio_type = p_type
+                        portfolio_joint_hedge = bool(portfolio_model.settings(username, selected_portfolio).get('portfolio_joint_hedge', False))
                         
                         mask = (data['username'] == username) & (data['portfolio_name'] == selected_portfolio)
                         data = data[~mask]
@@ -2877,6 +2504,7 @@ elif authentication_status:
                                     "portfolio_use_indicators": portfolio_use_ind,
                                     "portfolio_buffett_index": portfolio_buffett,
                                     "portfolio_uninvested_cash": portfolio_uninvested_cash,
+                                    "portfolio_joint_hedge": portfolio_joint_hedge,
                                     "portfolio_type": portfolio_type,
                                     "stock_full_name": s.get('full_name', ''),
                                     "sector": s.get('sector', ''),
@@ -2901,13 +2529,14 @@ elif authentication_status:
                                 "portfolio_buffett_index": portfolio_buffett,
                                 "portfolio_birth_date": portfolio_birth_date,
                                 "portfolio_uninvested_cash": portfolio_uninvested_cash,
+                                "portfolio_joint_hedge": portfolio_joint_hedge,
                                 "portfolio_type": portfolio_type,
                                 "stock_full_name": '', "sector": '', "industry": '', "country": '', "currency": '', "quantity": 0.0, "average_price": 0.0, "dividend_yield": 0.0
                             })
                         
                         updated_data = pd.concat([data, pd.DataFrame(new_rows)], ignore_index=True)
                         st.session_state.master_data = updated_data
-                        conn.update(worksheet="Portfolios", data=updated_data)
+                        save_worksheet(conn, "Portfolios", updated_data)
                         
                         st.session_state.editor_key += 1
                         st.session_state.has_unsaved_changes = False
@@ -3027,15 +2656,16 @@ elif authentication_status:
                 
                 with btn_col:
                     st.markdown("<div style='margin-top: 28px;'></div>", unsafe_allow_html=True)
-                    if st.button("💾 Save", width=150):
+                    if st.button("💾 Save", width=150, disabled=portfolios_read_only):
                         st.session_state[f"{selected_portfolio}_uninvested_cash"] = new_uninvested
                         
                         # Apply to dataframe and save
+                        data = data.copy()
                         mask = (data['username'] == username) & (data['portfolio_name'] == selected_portfolio)
                         data.loc[mask, 'portfolio_uninvested_cash'] = new_uninvested
                         
                         try:
-                            conn.update(worksheet="Portfolios", data=data)
+                            save_worksheet(conn, "Portfolios", data)
                             st.session_state.master_data = data
                             st.session_state.show_cash_success = True
                             st.rerun()
@@ -3073,7 +2703,7 @@ elif authentication_status:
                         
                         with r_col4:
                             st.markdown("<div style='margin-top: 28px;'></div>", unsafe_allow_html=True)
-                            add_clicked = st.button("Add Record", width="stretch")
+                            add_clicked = st.button("Add Record", width="stretch", disabled=bool(get_local_store().read_only("Dividends")))
                         
                         if add_clicked:
                             if div_ticker and div_amount > 0:
@@ -3084,17 +2714,13 @@ elif authentication_status:
                                     "portfolio_name": selected_portfolio,
                                     "username": username
                                 }
-                                # Fetch freshest data from Google Sheets first to avoid overwriting edits from other sessions
-                                fresh_divs = conn.read(worksheet="Dividends", ttl=0)
-                                if fresh_divs is None or fresh_divs.empty:
-                                    fresh_divs = pd.DataFrame(columns=['date', 'ticker', 'amount', 'portfolio_name', 'username'])
-                                
+                                # Append only: other sessions' records are never read back or overwritten
                                 new_row_df = pd.DataFrame([new_div])
-                                updated_divs = pd.concat([fresh_divs, new_row_df], ignore_index=True)
-                                
-                                st.session_state.dividends = updated_divs
-                                conn.update(worksheet="Dividends", data=updated_divs)
-                                conn.reset() # Invalidate GSheetsConnection cache to ensure live data load
+                                update_dividends(
+                                    conn,
+                                    lambda: append_worksheet(conn, "Dividends", new_row_df),
+                                    lambda ledger: ledger.add(new_row_df),
+                                )
                                 st.success("Dividend Recorded!")
                                 st.rerun()
                             else:
@@ -3103,12 +2729,8 @@ elif authentication_status:
                 if True: # Monthly Dividends section
                     with st.container(border=True):
                         st.markdown("### 📈 Monthly Dividends")
-                        df_divs = st.session_state.dividends
-                        if not df_divs.empty:
-                            df_divs['amount'] = pd.to_numeric(df_divs['amount'], errors='coerce').fillna(0.0)
-                            df_divs['date'] = pd.to_datetime(df_divs['date'], errors='coerce')
-                            mask = (df_divs['username'] == username) & (df_divs['portfolio_name'] == selected_portfolio)
-                            my_divs = df_divs[mask].copy()
+                        if len(dividend_ledger):
+                            my_divs = dividend_ledger.entries(username, selected_portfolio)
                             if not my_divs.empty:
                                 # Filter for Current and Previous Year only
                                 current_year = datetime.now().year
@@ -3117,8 +2739,6 @@ elif authentication_status:
                                 if my_divs.empty:
                                     st.info(f"No dividends found for {current_year-1} or {current_year}.")
                                 else:
-                                    my_divs['Year'] = my_divs['date'].dt.year.astype(str)
-                                    
                                     # Ticker Filter
                                     available_tickers = sorted(my_divs['ticker'].unique().tolist())
                                     filter_ticker = st.selectbox("🔍 Filter by Ticker", options=["All Data"] + available_tickers)
@@ -3129,12 +2749,10 @@ elif authentication_status:
                                             st.warning(f"No data for {filter_ticker} in the selected period.")
                                             st.stop()
                                 
-                                    # Calculate Yearly Totals
-                                    current_year_str = str(current_year)
-                                    prev_year_str = str(current_year - 1)
-                                    
-                                    total_current_year = my_divs[my_divs['Year'] == current_year_str]['amount'].sum()
-                                    total_prev_year = my_divs[my_divs['Year'] == prev_year_str]['amount'].sum()
+                                    # Yearly Totals (rollup lookups)
+                                    ticker_key = None if filter_ticker == "All Data" else filter_ticker
+                                    total_current_year = dividend_ledger.total(username, selected_portfolio, ticker_key, current_year)
+                                    total_prev_year = dividend_ledger.total(username, selected_portfolio, ticker_key, current_year - 1)
                                     
                                     # Display Totals Side-by-Side
                                     metric_col1, metric_col2 = st.columns(2)
@@ -3143,21 +2761,8 @@ elif authentication_status:
                                     with metric_col2:
                                         st.markdown(f"<div style='margin-bottom: 15px;'><span style='font-size: 1.1rem; font-weight: 600; color: #E5E7EB;'>💰 Total Dividends ({current_year-1})</span><br><span style='font-size: 2rem; font-weight: 700;'>€{total_prev_year:,.2f}</span></div>", unsafe_allow_html=True)
                                     
-                                    my_divs['MonthNum'] = my_divs['date'].dt.month
-                                    
-                                    # Aggregated stats (grouped by Year and MonthNum to be 100% locale-independent)
-                                    actual_stats = my_divs.groupby(['Year', 'MonthNum'])['amount'].sum().reset_index()
-                                    
-                                    # Create a template for all 12 months for BOTH years to ensure a full X-axis
-                                    template_rows = []
-                                    for yr in [str(current_year), str(current_year-1)]:
-                                        for m_num in range(1, 13):
-                                            template_rows.append({'Year': yr, 'MonthNum': m_num})
-                                    
-                                    template_df = pd.DataFrame(template_rows)
-                                    
-                                    # Merge actual data into template
-                                    monthly_stats = pd.merge(template_df, actual_stats, on=['Year', 'MonthNum'], how='left').fillna(0.0)
+                                    # All 12 months of BOTH years to ensure a full X-axis (locale-independent MonthNum)
+                                    monthly_stats = dividend_ledger.monthly(username, selected_portfolio, [current_year, current_year - 1], ticker_key)
                                     
                                     # Map MonthNum to English 3-letter month abbreviations for plotting
                                     month_map = {
@@ -3208,9 +2813,9 @@ elif authentication_status:
                                             key=f"div_history_editor_{st.session_state.get('editor_key', 0)}"
                                         )
                                         
-                                        if st.button("💾 Save History Changes", width="stretch", key="save_div_hist"):
-                                            # Fetch freshest data from Google Sheets first to avoid overwriting edits from other sessions
-                                            fresh_divs = conn.read(worksheet="Dividends", ttl=0)
+                                        if st.button("💾 Save History Changes", width="stretch", key="save_div_hist", disabled=bool(get_local_store().read_only("Dividends"))):
+                                            # Fetch freshest data from the shared local store first to avoid overwriting edits from other sessions
+                                            fresh_divs = read_worksheet(conn, "Dividends")
                                             if fresh_divs is None or fresh_divs.empty:
                                                 fresh_divs = pd.DataFrame(columns=['date', 'ticker', 'amount', 'portfolio_name', 'username'])
                                             
@@ -3234,15 +2839,17 @@ elif authentication_status:
                                                             "username": username
                                                         })
                                             
+                                            new_df = pd.DataFrame(new_records, columns=['date', 'ticker', 'amount', 'portfolio_name', 'username'])
                                             if new_records:
-                                                new_df = pd.DataFrame(new_records)
                                                 curr_divs = pd.concat([other_dividends, new_df], ignore_index=True)
                                             else:
                                                 curr_divs = other_dividends.reset_index(drop=True)
                                                 
-                                            st.session_state.dividends = curr_divs
-                                            conn.update(worksheet="Dividends", data=curr_divs)
-                                            conn.reset() # Invalidate GSheetsConnection cache to ensure live data load
+                                            update_dividends(
+                                                conn,
+                                                lambda: save_worksheet(conn, "Dividends", curr_divs),
+                                                lambda ledger: ledger.replace_portfolio(username, selected_portfolio, new_df),
+                                            )
                                             st.success("History updated!")
                                             st.rerun()
                             else:
@@ -3250,6 +2857,74 @@ elif authentication_status:
                         else:
                             st.info("No dividends recorded yet.")
 
+        if "🔮 Simulation" in tab_map:
+            with tab_map["🔮 Simulation"]:
+                st.session_state.footer_msg = "<b>Long-Term View:</b> Stress-test your contribution plan across thousands of market paths."
+                st.subheader("🔮 Accumulation Simulation")
+                st.write("Projects this portfolio forward month by month with the same buy rules as the Action Center, following your lifecycle phases.")
+
+                sim_col1, sim_col2, sim_col3 = st.columns(3)
+                with sim_col1:
+                    sim_years = st.slider("Horizon (years)", min_value=10, max_value=40, value=25, key=f"{selected_portfolio}_sim_years")
+                with sim_col2:
+                    sim_paths = st.select_slider("Simulated Paths", options=[1000, 2500, 5000, 10000], value=2500, key=f"{selected_portfolio}_sim_paths")
+                with sim_col3:
+                    sim_divs = st.number_input("Expected Monthly Dividends (€)", min_value=0.0, value=0.0, step=10.0, key=f"{selected_portfolio}_sim_divs")
+                sim_glide = st.radio(
+                    "Phase Transitions",
+                    options=["step", "linear", "smooth"],
+                    format_func={"step": "Step (on birthdays)", "linear": "Linear glide", "smooth": "Smooth glide"}.get,
+                    horizontal=True,
+                    key=f"{selected_portfolio}_sim_glide",
+                    help="Step jumps to the next lifecycle phase on the birthday it starts; the glides move the targets month by month over the five years before it.",
+                )
+
+                if st.button("▶️ Run Simulation", width="stretch"):
+                    sim_birth_date = st.session_state.get(f"{selected_portfolio}_investor_birth_date", "1992-01-01")
+                    sim_buffett = float(st.session_state.get(f"{selected_portfolio}_buffett_index", 195.0))
+                    sim_values = {s['name']: float(s['current_value']) for s in st.session_state.stocks}
+
+                    sim_progress = st.progress(0.0, text="Simulating...")
+                    sim_chart = st.empty()
+                    years_axis = [(m + 1) / 12.0 for m in range(sim_years * 12)]
+
+                    try:
+                        for update in iter_simulation_bands(
+                            n_paths=sim_paths,
+                            years=sim_years,
+                            birth_date=sim_birth_date,
+                            buffett_index=sim_buffett,
+                            current_values=sim_values,
+                            extra_monthly_contribution=sim_divs,
+                            glide=sim_glide,
+                        ):
+                            wealth = update["bands"]["wealth"]
+                            fig_sim = go.Figure()
+                            fig_sim.add_trace(go.Scatter(x=years_axis, y=wealth["P95"], line=dict(width=0), name="P95", hoverinfo="skip"))
+                            fig_sim.add_trace(go.Scatter(x=years_axis, y=wealth["P5"], line=dict(width=0), fill="tonexty", fillcolor="rgba(16, 185, 129, 0.25)", name="P5 – P95"))
+                            fig_sim.add_trace(go.Scatter(x=years_axis, y=wealth["P50"], line=dict(color="#10B981", width=3), name="Median"))
+                            fig_sim.update_layout(
+                                paper_bgcolor='rgba(0,0,0,0)',
+                                plot_bgcolor='rgba(0,0,0,0)',
+                                margin=dict(t=20, b=40, l=10, r=10),
+                                xaxis=dict(title="Years"),
+                                yaxis=dict(title="Wealth (€)"),
+                                showlegend=False,
+                                height=420
+                            )
+                            sim_chart.plotly_chart(fig_sim, width="stretch")
+                            sim_progress.progress(update["completed_paths"] / update["total_paths"], text=f"{update['completed_paths']:,} / {update['total_paths']:,} paths")
+                    except Exception as e:
+                        st.error(f"Simulation failed: {e}")
+                        st.stop()
+
+                    bands = update["bands"]
+                    kpi_sim = st.columns(4)
+                    with kpi_sim[0]: render_kpi_card("Total Contributed", f"€{update['total_contributed']:,.0f}")
+                    with kpi_sim[1]: render_kpi_card("Median Final Wealth", f"€{bands['wealth']['P50'][-1]:,.0f}")
+                    with kpi_sim[2]: render_kpi_card("P5 – P95 Wealth", f"€{bands['wealth']['P5'][-1]:,.0f} – €{bands['wealth']['P95'][-1]:,.0f}")
+                    with kpi_sim[3]: render_kpi_card("Median Final Drift", f"{bands['drift']['P50'][-1]:.1f} pp")
+
     else:
         # Welcome Screen
         with st.container(border=True):
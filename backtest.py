@@ -0,0 +1,255 @@
+"""
+Historical backtest of the Growth & Dividends contribution rules.
+
+Replays the app's contribution calendar month by month over a local price
+history: June/December doubled base investments, dividends from the previous
+month reinvested (the day >= 28 rule), Buffett-driven growth split and the
+never-sell tolerance bands; lifecycle targets step on birthdays or glide
+month by month (`glide_path`). State is kept as (parameter sets x 9 assets)
+arrays, so many parameter sets are replayed together in one pass.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from allocation_engine import age_from_birth_date, base_investment_for_month
+from glide_path import ages_on
+from vectorized_engine import ASSETS, TOLERANCE_ARRAY, calculate_growth_dividends_buys_vectorized
+
+DIVIDEND_PREFIX = "div:"
+
+
+def load_price_history(path: str) -> Dict[str, Any]:
+    """
+    Loads a monthly price history from CSV or Parquet.
+
+    Expected columns: `date`, one price column per ticker in `ASSETS`,
+    optionally `buffett_index` and per-share cash dividends as `div:<ticker>`.
+    Gaps are forward-filled; a ticker without any earlier price raises
+    ValueError (splice a proxy series in for periods before its launch).
+    """
+
+    if str(path).endswith(".parquet"):
+        raw = pd.read_parquet(path)
+    else:
+        raw = pd.read_csv(path)
+
+    return prepare_price_history(raw)
+
+
+def prepare_price_history(raw: pd.DataFrame) -> Dict[str, Any]:
+    """Converts a price-history DataFrame into the arrays used by `run_backtest`."""
+
+    missing = [col for col in ['date'] + ASSETS if col not in raw.columns]
+    if missing:
+        raise ValueError(f"Price history is missing columns: {missing}")
+
+    df = raw.copy()
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df = df.dropna(subset=['date']).sort_values('date')
+    # One row per calendar month (last observation wins)
+    df = df.groupby(df['date'].dt.to_period('M')).last()
+
+    prices = df[ASSETS].apply(pd.to_numeric, errors='coerce').ffill()
+    if prices.isna().any().any():
+        first_gap = prices.columns[prices.isna().any()].tolist()
+        raise ValueError(f"No starting price for: {first_gap}")
+    if (prices <= 0).any().any():
+        raise ValueError("Prices must be positive.")
+
+    div_cols = [f"{DIVIDEND_PREFIX}{asset}" for asset in ASSETS]
+    dividends = np.zeros(prices.shape)
+    for col_idx, col in enumerate(div_cols):
+        if col in df.columns:
+            dividends[:, col_idx] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).to_numpy()
+
+    buffett = None
+    if 'buffett_index' in df.columns:
+        buffett = pd.to_numeric(df['buffett_index'], errors='coerce').ffill().bfill().to_numpy()
+
+    return {
+        "dates": [period.to_timestamp().date() for period in df.index],
+        "prices": prices.to_numpy(dtype=float),
+        "dividends": dividends,
+        "buffett_index": buffett,
+    }
+
+
+def run_backtest(
+    history: Dict[str, Any],
+    param_sets: Sequence[Dict[str, Any]],
+    min_order_size: float = 5.0,
+    transition_months: int = 4,
+    glide: str = "step",
+) -> List[Dict[str, Any]]:
+    """
+    Replays every parameter set over the price history in one vectorized pass.
+
+    `glide` selects stepped or interpolated lifecycle targets (`targets_array`);
+    interpolated targets follow the investor's age in months.
+
+    Parameter set keys (all optional):
+    - birth_date: investor birth date 'YYYY-MM-DD' (default '1992-01-01')
+    - initial_values: {ticker: value in €} held at the first month
+    - extra_monthly: € added to every month's base investment
+    - buffett_index: constant Buffett value when the history has none (195.0)
+
+    Returns one report per parameter set with final holdings, drift against
+    TOLERANCE_PP, turnover and the monthly portfolio value series.
+    """
+
+    dates = history["dates"]
+    prices = history["prices"]
+    dividends = history["dividends"]
+    n_months = len(dates)
+    n_sets = len(param_sets)
+
+    if n_months == 0 or n_sets == 0:
+        return []
+
+    base = np.array([base_investment_for_month("Growth & Dividends", d.month, d.year) for d in dates])
+    extra = np.array([float(p.get("extra_monthly", 0.0)) for p in param_sets])
+    if glide == "step":
+        ages = np.array([
+            [age_from_birth_date(p.get("birth_date", "1992-01-01"), today=d) for d in dates]
+            for p in param_sets
+        ])
+    else:
+        ages = np.array([ages_on(p.get("birth_date", "1992-01-01"), dates) for p in param_sets])
+
+    if history.get("buffett_index") is not None:
+        buffett = np.tile(history["buffett_index"], (n_sets, 1))
+    else:
+        buffett = np.tile(
+            np.array([float(p.get("buffett_index", 195.0)) for p in param_sets])[:, None], (1, n_months)
+        )
+
+    initial = np.array([[float(p.get("initial_values", {}).get(a, 0.0)) for a in ASSETS] for p in param_sets])
+    units = initial / prices[0]
+    cash = np.zeros(n_sets)
+    dividend_cash = np.zeros(n_sets)
+
+    total_contributed = np.zeros(n_sets)
+    total_dividends = np.zeros(n_sets)
+    total_bought = np.zeros(n_sets)
+    months_outside_band = np.zeros((n_sets, len(ASSETS)), dtype=int)
+    max_drift = np.zeros(n_sets)
+    value_series = np.empty((n_sets, n_months))
+
+    for t in range(n_months):
+        values = units * prices[t]
+        contribution = base[t] + extra
+        budget = contribution + dividend_cash + cash
+
+        plan = calculate_growth_dividends_buys_vectorized(
+            ages[:, t], buffett[:, t], values, budget,
+            min_order_size=min_order_size, transition_months=transition_months, cap_defensive=True, glide=glide,
+        )
+        buys = plan["buys"]
+        units = units + buys / prices[t]
+        cash = np.round(np.maximum(budget - buys.sum(axis=1), 0.0), 2) + 0.0
+
+        total_contributed += contribution
+        total_dividends += dividend_cash
+        total_bought += buys.sum(axis=1)
+
+        # Drift after this month's buys
+        values = units * prices[t]
+        portfolio_value = values.sum(axis=1)
+        weights = values / np.where(portfolio_value > 0, portfolio_value, 1.0)[:, None] * 100.0
+        deviation = np.abs(weights - plan["portfolio_targets"])
+        months_outside_band += deviation > TOLERANCE_ARRAY
+        max_drift = np.maximum(max_drift, deviation.max(axis=1))
+        value_series[:, t] = portfolio_value + cash
+
+        # Dividends paid this month fund next month's investment
+        dividend_cash = (units * dividends[t]).sum(axis=1)
+
+    # The last month's dividends have no next month to fund: they stay as cash
+    cash = cash + dividend_cash
+    total_dividends += dividend_cash
+    value_series[:, -1] += dividend_cash
+
+    final_values = units * prices[-1]
+    years = max(n_months / 12.0, 1.0 / 12.0)
+    average_value = value_series.mean(axis=1)
+
+    reports = []
+    for i, params in enumerate(param_sets):
+        reports.append({
+            "params": dict(params),
+            "start": dates[0],
+            "end": dates[-1],
+            "months": n_months,
+            "holdings_units": dict(zip(ASSETS, units[i].round(6).tolist())),
+            "holdings_values": dict(zip(ASSETS, final_values[i].round(2).tolist())),
+            "final_value": round(float(final_values[i].sum() + cash[i]), 2),
+            "cash": round(float(cash[i]), 2),
+            "total_contributed": round(float(total_contributed[i]), 2),
+            "total_dividends": round(float(total_dividends[i]), 2),
+            "months_outside_band": dict(zip(ASSETS, months_outside_band[i].tolist())),
+            "max_drift_pp": round(float(max_drift[i]), 2),
+            "turnover": round(float(total_bought[i] / average_value[i] / years), 4) if average_value[i] > 0 else 0.0,
+            "value_series": value_series[i],
+        })
+
+    return reports
+
+
+def _run_group(args) -> List[Dict[str, Any]]:
+    return run_backtest(**args)
+
+
+def run_backtests(
+    history: Dict[str, Any],
+    param_sets: Sequence[Dict[str, Any]],
+    chunk_size: int = 256,
+    max_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Runs many parameter sets across a process pool.
+
+    Parameter sets are grouped by `min_order_size`, `transition_months` and
+    `glide` (which are scalars in the vectorized engine), chunked, and each chunk is
+    replayed by `run_backtest` in a worker. Reports keep the input order.
+    """
+
+    groups: Dict[tuple, List[int]] = {}
+    for idx, params in enumerate(param_sets):
+        key = (
+            float(params.get("min_order_size", 5.0)),
+            int(params.get("transition_months", 4)),
+            str(params.get("glide", "step")),
+        )
+        groups.setdefault(key, []).append(idx)
+
+    jobs = []
+    for (min_order_size, transition_months, glide), indices in groups.items():
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            jobs.append((chunk, {
+                "history": history,
+                "param_sets": [param_sets[i] for i in chunk],
+                "min_order_size": min_order_size,
+                "transition_months": transition_months,
+                "glide": glide,
+            }))
+
+    reports: List[Optional[Dict[str, Any]]] = [None] * len(param_sets)
+
+    if max_workers == 1 or len(jobs) == 1:
+        for chunk, job in jobs:
+            for i, report in zip(chunk, _run_group(job)):
+                reports[i] = report
+        return reports
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(_run_group, [job for _, job in jobs])
+        for (chunk, _), chunk_reports in zip(jobs, results):
+            for i, report in zip(chunk, chunk_reports):
+                reports[i] = report
+
+    return reports
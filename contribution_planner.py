@@ -0,0 +1,245 @@
+"""
+Multi-month contribution planner for Growth & Dividends portfolios.
+
+Plans the next 6-24 months of purchases for all nine assets from the known
+future budgets (the 500/1000 schedule plus expected dividends). Each month's
+budget is split in fixed steps (at least €1 and `min_order_size`), every step
+going to the asset whose purchase lowers the drift cost the most; the split
+is then rounded to orders by `allocate_orders`, which tops it up to the
+month's budget and carries the cents not invested to the next month.
+
+The first pass scores every month on its own. Refinement passes score each
+step over the next `lookahead` months, assuming those months buy what the
+previous pass planned, and the pass with the lowest total drift is kept.
+This is a heuristic: it usually lowers the drift outside TOLERANCE_PP but
+is not guaranteed to find the minimum. Lifecycle phase changes inside the
+horizon are seen ahead of time. Prices are held constant: the plan moves
+money, not markets.
+"""
+
+from datetime import date
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from allocation_engine import (
+    GROWTH_DIVIDENDS_TICKERS,
+    TOLERANCE_PP,
+    age_from_birth_date,
+    allocate_orders,
+    base_investment_for_month,
+    lookup_targets,
+)
+
+ASSETS = GROWTH_DIVIDENDS_TICKERS
+MAX_PLAN_MONTHS = 24
+
+# Weight of the squared in-band deviation (pp^2) next to the drift outside the
+# band (pp): keeps steering towards target once every asset is inside its band
+INSIDE_BAND_WEIGHT = 1e-3
+
+# Upper bound on greedy steps per month (the step grows for large budgets)
+MAX_STEPS_PER_MONTH = 200
+
+
+def add_months(start: date, months: int) -> date:
+    """First day of the month `months` after `start`."""
+    month_index = start.month - 1 + months
+    return date(start.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def planned_budgets(
+    months: int,
+    start: Optional[date] = None,
+    first_month_budget: Optional[float] = None,
+    expected_dividends: float = 0.0,
+    extra_monthly: float = 0.0,
+) -> List[float]:
+    """
+    Growth & Dividends budgets for `months` consecutive months from `start`.
+
+    Every month is its base investment plus `expected_dividends` and
+    `extra_monthly`; `first_month_budget` replaces the first month when the
+    actual amount (with this month's real dividends) is already known.
+    """
+
+    start = start or date.today()
+    budgets = []
+    for m in range(months):
+        month = add_months(start, m)
+        budgets.append(
+            base_investment_for_month("Growth & Dividends", month.month, month.year)
+            + expected_dividends + extra_monthly
+        )
+    if first_month_budget is not None and budgets:
+        budgets[0] = float(first_month_budget)
+    return budgets
+
+
+def _drift_cost(values: np.ndarray, centers: np.ndarray, bands: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    """
+    Drift outside the band plus the weighted in-band deviation, per (month, asset), in pp
+    (0 for an empty portfolio).
+    """
+    positive = totals > 0
+    safe_totals = np.where(positive, totals, 1.0)
+    deviation_pp = (values - centers) / safe_totals * 100.0
+    outside_pp = np.maximum(0.0, np.abs(values - centers) - bands) / safe_totals * 100.0
+    return np.where(positive, outside_pp + INSIDE_BAND_WEIGHT * deviation_pp ** 2, 0.0)
+
+
+def _greedy_schedule(
+    holdings: np.ndarray,
+    budgets: np.ndarray,
+    weights: np.ndarray,
+    tolerance: np.ndarray,
+    min_order_size: float,
+    lookahead: int,
+    future_plan: Optional[np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One forward pass: splits every month's budget greedily, scoring each step
+    over the current month and, when `future_plan` is given, over the next
+    `lookahead` months with those months buying what `future_plan` says.
+    Returns the (months x 9) rounded buys and the cash left each month.
+    """
+
+    months = len(budgets)
+    buys_out = np.zeros((months, len(ASSETS)))
+    leftover_out = np.zeros(months)
+    carry = 0.0
+
+    for t in range(months):
+        budget = budgets[t] + carry
+        if future_plan is None:
+            window_end = t + 1
+        else:
+            window_end = min(months, t + lookahead)
+
+        # Portfolio path over the window with the later months' planned buys
+        if future_plan is None:
+            later = np.zeros((1, len(ASSETS)))
+        else:
+            later = np.cumsum(future_plan[t:window_end], axis=0) - future_plan[t]
+        base_values = holdings + later
+        totals = (holdings.sum() + budget + later.sum(axis=1))[:, None]
+        centers = totals * weights[t:window_end]
+        bands = totals * tolerance
+
+        step = max(1.0, min_order_size, budget / MAX_STEPS_PER_MONTH)
+        n_steps = int(budget // step)
+
+        added = np.zeros(len(ASSETS))
+        cost_next = _drift_cost(base_values + step, centers, bands, totals).sum(axis=0)
+        gains = _drift_cost(base_values, centers, bands, totals).sum(axis=0) - cost_next
+
+        for _ in range(n_steps):
+            a = int(np.argmax(gains))
+            added[a] += step
+            cost_now_a = cost_next[a]
+            cost_next[a] = _drift_cost(base_values[:, a] + added[a] + step, centers[:, a], bands[:, a], totals[:, 0]).sum()
+            gains[a] = cost_now_a - cost_next[a]
+
+        orders, carry = allocate_orders(dict(zip(ASSETS, added.tolist())), budget, min_order_size)
+        buys_out[t] = [orders[asset] for asset in ASSETS]
+        leftover_out[t] = carry
+        holdings = holdings + buys_out[t]
+
+    return buys_out, leftover_out
+
+
+def _schedule_drift(holdings: np.ndarray, buys: np.ndarray, weights: np.ndarray, tolerance: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Drift outside the bands after each month's buys (pp) and the plan's total cost."""
+    values = holdings + np.cumsum(buys, axis=0)
+    totals = values.sum(axis=1, keepdims=True)
+    totals = np.where(totals > 0, totals, 1.0)
+    outside = np.maximum(0.0, np.abs(values - totals * weights) - totals * tolerance) / totals * 100.0
+    cost = _drift_cost(values, totals * weights, totals * tolerance, totals).sum()
+    return outside.sum(axis=1), float(cost)
+
+
+def plan_contributions(
+    birth_date: str,
+    buffett_index: float,
+    current_values: Dict[str, float],
+    budgets: Sequence[float],
+    start: Optional[date] = None,
+    min_order_size: float = 5.0,
+    lookahead: Optional[int] = None,
+    refinements: int = 3,
+) -> Dict[str, Any]:
+    """
+    Plans one purchase order set per month for `len(budgets)` months.
+
+    Rules:
+    - Never sell; each month's budget (plus cash carried over) is invested.
+    - Keep the cumulative drift outside TOLERANCE_PP over the horizon low
+      (greedy steps with lookahead, not an exact minimum).
+    - Targets follow the investor's age month by month (Buffett index fixed).
+    - Orders are rounded with `allocate_orders` (min_order_size, whole euros).
+
+    The first pass plans each month on its own. Every refinement re-plans
+    month by month looking `lookahead` months ahead (default: the whole
+    horizon), assuming the later months buy what the previous pass planned;
+    the plan with the lowest cumulative drift is kept.
+
+    Returns the month-by-month schedule with buys, post-trade weights and
+    drift outside the bands, plus the total drift over the horizon.
+    """
+
+    months = len(budgets)
+    if not 1 <= months <= MAX_PLAN_MONTHS:
+        raise ValueError(f"Plan horizon must be between 1 and {MAX_PLAN_MONTHS} months.")
+
+    budgets = np.asarray(budgets, dtype=float)
+    if (budgets < 0).any():
+        raise ValueError("Monthly budgets cannot be negative.")
+
+    holdings = np.array([float(current_values.get(asset, 0.0)) for asset in ASSETS])
+    if (holdings < 0).any():
+        raise ValueError("Portfolio value cannot be negative.")
+
+    start = start or date.today()
+    lookahead = months if lookahead is None else max(1, int(lookahead))
+
+    dates = [add_months(start, m) for m in range(months)]
+    ages = [age_from_birth_date(birth_date, today=d) for d in dates]
+    weights = np.array([[lookup_targets(age, buffett_index)[asset] for asset in ASSETS] for age in ages]) / 100.0
+    tolerance = np.array([TOLERANCE_PP[asset] for asset in ASSETS]) / 100.0
+
+    best = _greedy_schedule(holdings, budgets, weights, tolerance, min_order_size, lookahead, None)
+    best_cost = _schedule_drift(holdings, best[0], weights, tolerance)[1]
+    plan = best[0]
+    for _ in range(refinements):
+        candidate = _greedy_schedule(holdings, budgets, weights, tolerance, min_order_size, lookahead, plan)
+        cost = _schedule_drift(holdings, candidate[0], weights, tolerance)[1]
+        if cost < best_cost - 1e-9:
+            best, best_cost = candidate, cost
+        plan = candidate[0]
+
+    buys, leftover = best
+    drift, _ = _schedule_drift(holdings, buys, weights, tolerance)
+    values = holdings + np.cumsum(buys, axis=0)
+
+    schedule = []
+    for t in range(months):
+        value = values[t].sum()
+        weights_after = values[t] / value * 100.0 if value > 0 else np.zeros(len(ASSETS))
+        schedule.append({
+            "month": dates[t],
+            "age": ages[t],
+            "budget": round(float(buys[t].sum() + leftover[t]), 2),
+            "buys": dict(zip(ASSETS, buys[t].tolist())),
+            "leftover_cash": float(leftover[t]),
+            "portfolio_value_after": round(float(value), 2),
+            "portfolio_targets": dict(zip(ASSETS, (weights[t] * 100.0).tolist())),
+            "weights_after": dict(zip(ASSETS, np.round(weights_after, 2).tolist())),
+            "drift_outside_band_pp": round(float(drift[t]), 2),
+        })
+
+    return {
+        "months": months,
+        "total_budget": round(float(budgets.sum()), 2),
+        "total_drift_outside_band_pp": round(float(drift.sum()), 2),
+        "schedule": schedule,
+    }
@@ -0,0 +1,188 @@
+"""
+Typed dividend ledger with a pre-aggregated rollup cube.
+
+The Dividends worksheet is parsed once (dates as datetime64, amounts as
+floats) and every record is added to a cube keyed by
+(username, portfolio_name, ticker, year, month), where ticker, year and
+month may be None for "all". Each record lands in the 6 rollup cells it
+belongs to, so a month's total, a year's total or a ticker's lifetime total
+is a single dictionary lookup instead of a re-parse and a boolean mask
+over the whole sheet.
+
+Records and cells are kept per portfolio. A ledger never changes once built:
+recording a dividend (`add`) or editing a portfolio's history
+(`replace_portfolio`) returns a new ledger that shares every other
+portfolio's records and cells with the old one and copies only the affected
+portfolio's, so the cost scales with that portfolio rather than the whole
+ledger, and sessions still reading the old one need no lock.
+"""
+
+from itertools import product
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+DIVIDEND_COLUMNS = ['date', 'ticker', 'amount', 'portfolio_name', 'username']
+
+PortfolioKey = Tuple[str, str]
+
+# (ticker, year, month) within a portfolio
+CellKey = Tuple[Optional[str], Optional[int], Optional[int]]
+
+_INVALID_DATES = ['nat', 'nan', 'none']
+
+
+def parse_dividends(raw: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Dividends worksheet rows as a typed ledger.
+
+    Rules:
+    - Rows with an empty or 'NaT'/'nan'/'None' date are dropped; other
+      unparseable dates become NaT and only count towards all-time totals.
+    - Amounts are floats (invalid ones 0.0), names are strings.
+    """
+
+    if raw is None or raw.empty:
+        return pd.DataFrame({
+            'date': pd.Series(dtype='datetime64[ns]'),
+            'ticker': pd.Series(dtype='object'),
+            'amount': pd.Series(dtype='float'),
+            'portfolio_name': pd.Series(dtype='object'),
+            'username': pd.Series(dtype='object'),
+        })
+
+    ledger = raw.copy()
+    for col in DIVIDEND_COLUMNS:
+        if col not in ledger.columns:
+            ledger[col] = 0.0 if col == 'amount' else ''
+    ledger = ledger.dropna(subset=['date'])
+    text = ledger['date'].astype(str).str.strip()
+    ledger = ledger[(text != "") & ~text.str.lower().isin(_INVALID_DATES)].copy()
+
+    ledger['date'] = pd.to_datetime(ledger['date'], errors='coerce')
+    ledger['amount'] = pd.to_numeric(ledger['amount'], errors='coerce').fillna(0.0).astype(float)
+    for col in ('ticker', 'portfolio_name', 'username'):
+        ledger[col] = ledger[col].astype(str)
+    return ledger.reset_index(drop=True)
+
+
+class DividendLedger:
+    """
+    Parsed dividend records plus their rollup cube.
+
+    `total(username, portfolio, ticker=None, year=None, month=None)` is the
+    O(1) lookup behind every dividend figure in the UI; `entries` returns
+    the underlying records of one portfolio.
+    """
+
+    def __init__(self, raw: Optional[pd.DataFrame] = None):
+        parsed = parse_dividends(raw)
+        self._records: Dict[PortfolioKey, pd.DataFrame] = {}
+        self._cells: Dict[PortfolioKey, Dict[CellKey, float]] = {}
+        self._tickers: Dict[PortfolioKey, Set[str]] = {}
+        self._ledger: Optional[pd.DataFrame] = parsed
+        self._add(parsed)
+
+    def _derive(self, portfolios: Iterable[PortfolioKey]) -> "DividendLedger":
+        """A ledger sharing this one's portfolios, with copies of `portfolios` to be changed before it is shared."""
+        derived = DividendLedger.__new__(DividendLedger)
+        derived._records = dict(self._records)
+        derived._cells = dict(self._cells)
+        derived._tickers = dict(self._tickers)
+        derived._ledger = None
+        for key in set(portfolios):
+            derived._cells[key] = dict(self._cells.get(key, {}))
+            derived._tickers[key] = set(self._tickers.get(key, ()))
+        return derived
+
+    @staticmethod
+    def _portfolios(ledger: pd.DataFrame) -> Dict[PortfolioKey, pd.DataFrame]:
+        return {
+            (user, portfolio): rows
+            for (user, portfolio), rows in ledger.groupby(['username', 'portfolio_name'], sort=False)
+        }
+
+    def _add(self, ledger: pd.DataFrame) -> None:
+        """Adds records to their portfolios' records and cells (which must not be shared yet)."""
+        for key, rows in self._portfolios(ledger).items():
+            earlier = self._records.get(key)
+            rows = rows if earlier is None else pd.concat([earlier, rows])
+            self._records[key] = rows.reset_index(drop=True)
+
+        years = ledger['date'].dt.year
+        months = ledger['date'].dt.month
+        # Pre-sum by full key so the Python loop runs once per distinct cell
+        sums = (
+            ledger.assign(year=years, month=months)
+            .groupby(['username', 'portfolio_name', 'ticker', 'year', 'month'], dropna=False, sort=False)['amount']
+            .sum()
+        )
+        for (user, portfolio, ticker, year, month), amount in sums.items():
+            year = None if pd.isna(year) else int(year)
+            month = None if pd.isna(month) else int(month)
+            cells = self._cells.setdefault((user, portfolio), {})
+            self._tickers.setdefault((user, portfolio), set()).add(ticker)
+            # Month totals only exist within a year; undated records only count all-time
+            periods = [(year, month), (year, None), (None, None)] if year is not None else [(None, None)]
+            for t, (y, m) in product((ticker, None), periods):
+                cells[(t, y, m)] = cells.get((t, y, m), 0.0) + float(amount)
+
+    @property
+    def ledger(self) -> pd.DataFrame:
+        """All records, grouped by portfolio (built on first use)."""
+        if self._ledger is None:
+            frames = [rows for rows in self._records.values() if not rows.empty]
+            self._ledger = pd.concat(frames, ignore_index=True) if frames else parse_dividends(None)
+        return self._ledger
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._records.values())
+
+    def total(
+        self,
+        username: str,
+        portfolio_name: str,
+        ticker: Optional[str] = None,
+        year: Optional[int] = None,
+        month: Optional[int] = None,
+    ) -> float:
+        """Dividends of a portfolio, optionally for one ticker, year and month of that year."""
+        return round(self._cells.get((username, portfolio_name), {}).get((ticker, year, month), 0.0), 2)
+
+    def ticker_totals(self, username: str, portfolio_name: str) -> Dict[str, float]:
+        """All-time dividends per ticker of a portfolio."""
+        return {
+            ticker: self.total(username, portfolio_name, ticker)
+            for ticker in sorted(self._tickers.get((username, portfolio_name), ()))
+        }
+
+    def monthly(self, username: str, portfolio_name: str, years: List[int], ticker: Optional[str] = None) -> pd.DataFrame:
+        """Year x month totals (all 12 months of each year) as Year / MonthNum / amount rows."""
+        rows = [
+            {'Year': str(year), 'MonthNum': month, 'amount': self.total(username, portfolio_name, ticker, year, month)}
+            for year in years for month in range(1, 13)
+        ]
+        return pd.DataFrame(rows, columns=['Year', 'MonthNum', 'amount'])
+
+    def entries(self, username: str, portfolio_name: str) -> pd.DataFrame:
+        """The portfolio's records (typed copy)."""
+        rows = self._records.get((username, portfolio_name))
+        return rows.copy() if rows is not None else parse_dividends(None)
+
+    def add(self, rows: pd.DataFrame) -> "DividendLedger":
+        """A new ledger with newly recorded dividends added."""
+        parsed = parse_dividends(rows)
+        updated = self._derive(self._portfolios(parsed))
+        updated._add(parsed)
+        return updated
+
+    def replace_portfolio(self, username: str, portfolio_name: str, rows: pd.DataFrame) -> "DividendLedger":
+        """A new ledger with all records of one portfolio replaced (history edits); other portfolios keep their cells."""
+        parsed = parse_dividends(rows)
+        key = (username, portfolio_name)
+        updated = self._derive(self._portfolios(parsed))
+        updated._records.pop(key, None)
+        updated._cells[key] = {}
+        updated._tickers[key] = set()
+        updated._add(parsed)
+        return updated
@@ -0,0 +1,129 @@
+"""
+Interpolated glide paths for the lifecycle ladders.
+
+Loads the phase tables of `allocation_engine` (Growth & Dividends lifecycle,
+Accumulation/Dividends strategy, Kids) into arrays and answers target lookups
+for many ages or dates at once. Besides the original step ladder, weights can
+glide into each phase month by month, linearly or along a smoothstep curve,
+over the `transition_years` before the phase starts, so a phase boundary no
+longer moves the whole target in a single month.
+
+Phase lookups are a binary search (`np.searchsorted`) over the phase start
+ages; ages are fractional years, dates resolve to whole months of age.
+"""
+
+from datetime import date, datetime
+from typing import Dict, Any, Sequence, Union
+
+import numpy as np
+
+from allocation_engine import (
+    KIDS_COLUMNS,
+    KIDS_PHASES,
+    LIFECYCLE_COLUMNS,
+    LIFECYCLE_PHASES,
+    STRATEGY_COLUMNS,
+    STRATEGY_PHASES,
+)
+
+GLIDE_MODES = ("step", "linear", "smooth")
+
+DateLike = Union[str, date, datetime, np.datetime64]
+
+
+def ages_on(birth_date: DateLike, dates) -> np.ndarray:
+    """
+    Age in years, counted in whole months, on each of `dates`.
+
+    Matches `age_from_birth_date` on the whole-year part: a month of age is
+    only complete once the day of birth has been reached.
+    """
+
+    birth = np.datetime64(birth_date, "D")
+    days = np.atleast_1d(np.asarray(dates, dtype="datetime64[D]"))
+    months = days.astype("datetime64[M]").astype(int) - birth.astype("datetime64[M]").astype(int)
+    day = (days - days.astype("datetime64[M]")).astype(int)
+    birth_day = int((birth - birth.astype("datetime64[M]")).astype(int))
+    months = months - (day < birth_day)
+    return months / 12.0
+
+
+class GlidePath:
+    """
+    One lifecycle ladder as arrays.
+
+    `phases` is a sequence of (start_age, weights) rows as in the
+    `allocation_engine` tables; `transition_years` is how long before each
+    phase start the weights begin gliding into it (capped at the length of
+    the previous phase).
+    """
+
+    def __init__(self, phases: Sequence[Sequence[Any]], columns: Sequence[str], transition_years: float = 5.0):
+        self.columns = tuple(columns)
+        self.starts = np.array([float(phase[0]) for phase in phases])
+        self.weights = np.array([phase[-1] for phase in phases], dtype=float)
+        if len(self.starts) > 1 and (np.diff(self.starts) <= 0).any():
+            raise ValueError("Phase start ages must be strictly increasing.")
+
+        # Ramp into phase i+1 over [starts[i+1] - ramp[i], starts[i+1]]
+        gaps = np.diff(self.starts)
+        self.ramps = np.minimum(float(transition_years), gaps) if len(gaps) else np.zeros(0)
+        self._next = np.vstack([self.weights[1:], self.weights[-1:]])
+        self._ramp_end = np.append(self.starts[1:], np.inf)
+        self._ramp_len = np.append(self.ramps, 1.0)
+
+    def phase_at(self, ages) -> np.ndarray:
+        """Index of the phase in effect at each age (ages below the first phase use it)."""
+        ages = np.atleast_1d(np.asarray(ages, dtype=float))
+        return np.maximum(np.searchsorted(self.starts, ages, side="right") - 1, 0)
+
+    def weights_at(self, ages, mode: str = "step") -> np.ndarray:
+        """(N x columns) weights for each age in years; `mode` is step, linear or smooth."""
+        if mode not in GLIDE_MODES:
+            raise ValueError(f"Unknown glide mode '{mode}'. Use one of {GLIDE_MODES}.")
+
+        ages = np.atleast_1d(np.asarray(ages, dtype=float))
+        phase = self.phase_at(ages)
+        current = self.weights[phase]
+        if mode == "step":
+            return current
+
+        progress = np.clip((ages - (self._ramp_end[phase] - self._ramp_len[phase])) / self._ramp_len[phase], 0.0, 1.0)
+        if mode == "smooth":
+            progress = progress * progress * (3.0 - 2.0 * progress)
+        return current + progress[:, None] * (self._next[phase] - current)
+
+    def weights_on(self, birth_date: DateLike, dates, mode: str = "step") -> np.ndarray:
+        """(N x columns) weights on each of `dates` for an investor born on `birth_date`."""
+        return self.weights_at(ages_on(birth_date, dates), mode)
+
+    def targets(self, age: float, mode: str = "step", decimals: int = 2) -> Dict[str, float]:
+        """Weights for a single age as a `{column: weight}` dict."""
+        row = np.round(self.weights_at(age, mode)[0], decimals)
+        return dict(zip(self.columns, row.tolist()))
+
+    def monthly_table(self, max_age: int = 100, mode: str = "step") -> np.ndarray:
+        """Weights for every month of age from 0 to `max_age` years, indexed by months of age."""
+        return self.weights_at(np.arange(max_age * 12 + 1) / 12.0, mode)
+
+
+LIFECYCLE_GLIDE = GlidePath(LIFECYCLE_PHASES, LIFECYCLE_COLUMNS, transition_years=5.0)
+STRATEGY_GLIDE = GlidePath(STRATEGY_PHASES, STRATEGY_COLUMNS, transition_years=5.0)
+KIDS_GLIDE = GlidePath(KIDS_PHASES, KIDS_COLUMNS, transition_years=1.0)
+
+
+def lifecycle_weights(ages, mode: str = "step") -> np.ndarray:
+    """
+    (N x 7) Growth & Dividends lifecycle weights (`LIFECYCLE_COLUMNS`).
+
+    Interpolated rows are rounded to 2 decimals with the growth block taking
+    the rounding remainder, so every row still sums to exactly 100%.
+    """
+
+    weights = LIFECYCLE_GLIDE.weights_at(ages, mode)
+    if mode == "step":
+        return weights
+    weights = np.round(weights, 2)
+    weights[:, 0] = np.round(100.0 - weights[:, 1:].sum(axis=1), 2)
+    return weights
+
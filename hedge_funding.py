@@ -0,0 +1,181 @@
+"""
+Cross-portfolio Gold & Bonds funding.
+
+Accumulation portfolios may divert up to 7% and Dividends portfolios up to
+10% of their monthly budget to the Gold & Bonds hedge. Instead of each
+portfolio deciding on its own when its Calculate button is pressed, the
+diversions of the portfolios that opted in are solved together here from the
+global hedge weight: nothing is diverted while Gold & Bonds is on target,
+otherwise the global shortfall is spread over the donors in proportion to
+their caps (the least-squares split of the shortfall relative to each cap).
+
+Joint funding is opt-in per portfolio, and the hedge target and its gold
+share are the user's settings: without donors every budget stays the base
+investment of the month.
+"""
+
+from typing import Dict, Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from allocation_engine import base_investment_for_month
+
+GOLD_TICKERS = {"EGLN.UK", "EGNL.UK"}
+BOND_TICKERS = {"YCSH.DE", "PRAB.DE", "IBTE.UK"}
+HEDGE_TICKERS = GOLD_TICKERS | BOND_TICKERS
+
+# Share of a portfolio's monthly budget that may fund the hedge, by name keyword
+DIVERSION_CAPS = {"accumulation": 0.07, "dividend": 0.10}
+
+# Starting values of the sidebar settings (% of all non-Kids portfolios)
+DEFAULT_HEDGE_TARGET_PCT = 10.0
+DEFAULT_GOLD_SHARE_PCT = 50.0
+HEDGE_TOLERANCE_PP = 1.0
+
+
+def diversion_cap(portfolio_name: str, portfolio_type: str, opted_in: bool = True) -> float:
+    """Largest share of the monthly budget this portfolio may divert (0 unless it opted in)."""
+    if portfolio_type != "Stocks" or not opted_in:
+        return 0.0
+    name = portfolio_name.lower()
+    for keyword, cap in DIVERSION_CAPS.items():
+        if keyword in name:
+            return cap
+    return 0.0
+
+
+def portfolio_hedge_inputs(
+    master_data: pd.DataFrame,
+    username: str,
+    investment_month: int,
+    investment_year: int,
+    budgets: Optional[Dict[str, float]] = None,
+    donors: Iterable[str] = (),
+) -> pd.DataFrame:
+    """
+    One row per non-Kids portfolio of `username` from the Portfolios sheet.
+
+    Columns: portfolio_name, portfolio_type, total_value, gold_value,
+    bond_value, monthly_budget, diversion_cap, is_hedge_portfolio (a
+    portfolio holding only Gold & Bonds tickers receives the diversions).
+    `budgets` overrides the base investment of the month per portfolio;
+    only the portfolios named in `donors` get a diversion cap.
+    """
+
+    columns = ['portfolio_name', 'portfolio_type', 'total_value', 'gold_value', 'bond_value',
+               'monthly_budget', 'diversion_cap', 'is_hedge_portfolio']
+    if master_data.empty:
+        return pd.DataFrame(columns=columns)
+
+    rows = master_data[
+        (master_data['username'] == username)
+        & (master_data['stock_name'] != '__PLACEHOLDER__')
+        & (master_data['portfolio_type'].astype(str).str.strip().str.upper() != "KIDS")
+    ].copy()
+    if rows.empty:
+        return pd.DataFrame(columns=columns)
+
+    ticker = rows['stock_name'].astype(str).str.upper().str.strip()
+    value = pd.to_numeric(rows['current_value'], errors='coerce').fillna(0.0)
+    rows['total_value'] = value
+    rows['gold_value'] = value.where(ticker.isin(GOLD_TICKERS), 0.0)
+    rows['bond_value'] = value.where(ticker.isin(BOND_TICKERS), 0.0)
+    rows['non_hedge'] = ~ticker.isin(HEDGE_TICKERS)
+
+    portfolios = rows.groupby('portfolio_name', sort=False).agg(
+        portfolio_type=('portfolio_type', 'first'),
+        total_value=('total_value', 'sum'),
+        gold_value=('gold_value', 'sum'),
+        bond_value=('bond_value', 'sum'),
+        non_hedge=('non_hedge', 'sum'),
+    ).reset_index()
+    portfolios['portfolio_type'] = portfolios['portfolio_type'].astype(str).str.strip()
+
+    budgets = budgets or {}
+    portfolios['monthly_budget'] = [
+        float(budgets.get(name, base_investment_for_month(p_type, investment_month, investment_year)))
+        for name, p_type in zip(portfolios['portfolio_name'], portfolios['portfolio_type'])
+    ]
+    donors = set(donors)
+    portfolios['diversion_cap'] = [
+        diversion_cap(str(name), p_type, opted_in=name in donors)
+        for name, p_type in zip(portfolios['portfolio_name'], portfolios['portfolio_type'])
+    ]
+    portfolios['is_hedge_portfolio'] = (portfolios['non_hedge'] == 0) & (portfolios['portfolio_type'] != "Growth & Dividends")
+    return portfolios[columns]
+
+
+def solve_hedge_funding(
+    portfolios: pd.DataFrame,
+    target_pct: float,
+    gold_share: float,
+    tolerance_pp: float = HEDGE_TOLERANCE_PP,
+) -> Dict[str, Any]:
+    """
+    Solves this month's Gold & Bonds diversions for all portfolios at once.
+
+    Rules:
+    - The hedge weight counts Gold & Bonds held in every portfolio against
+      all non-Kids holdings plus this month's budgets.
+    - Within `tolerance_pp` of `target_pct` (or above) nothing is diverted.
+    - Otherwise donors give min(shortfall, total capacity) in proportion to
+      their capacity (`diversion_cap` x `monthly_budget`).
+    - The diverted cash is split between gold and bonds by their own gaps
+      to `gold_share` (0-1) of the target, and credited to the hedge portfolios.
+    - Without a hedge portfolio to receive it nothing is diverted, so no
+      donor budget shrinks for a purchase that would never be ordered.
+
+    Returns the per-portfolio table (with `diversion`, `received` and
+    `budget_after`) and the global figures.
+    """
+
+    result = portfolios.copy()
+    n = len(result)
+    values = result['total_value'].to_numpy(dtype=float) if n else np.zeros(0)
+    gold = result['gold_value'].to_numpy(dtype=float) if n else np.zeros(0)
+    bonds = result['bond_value'].to_numpy(dtype=float) if n else np.zeros(0)
+    budgets = result['monthly_budget'].to_numpy(dtype=float) if n else np.zeros(0)
+    capacity = budgets * (result['diversion_cap'].to_numpy(dtype=float) if n else np.zeros(0))
+    receivers = result['is_hedge_portfolio'].to_numpy(dtype=bool) if n else np.zeros(0, dtype=bool)
+
+    total_after = values.sum() + budgets.sum()
+    hedge_value = gold.sum() + bonds.sum()
+    weight = hedge_value / total_after * 100.0 if total_after > 0 else 0.0
+    shortfall = max(0.0, total_after * target_pct / 100.0 - hedge_value)
+    on_target = weight >= target_pct - tolerance_pp
+
+    total_capacity = capacity.sum()
+    can_divert = not on_target and total_capacity > 0 and receivers.any()
+    diverted = min(shortfall, total_capacity) if can_divert else 0.0
+    diversion = capacity * (diverted / total_capacity) if total_capacity > 0 else np.zeros(n)
+
+    gold_gap = max(0.0, total_after * target_pct * gold_share / 100.0 - gold.sum())
+    bond_gap = max(0.0, total_after * target_pct * (1.0 - gold_share) / 100.0 - bonds.sum())
+    gold_fraction = gold_gap / (gold_gap + bond_gap) if gold_gap + bond_gap > 0 else gold_share
+
+    # Hedge portfolios receive the diverted cash in proportion to their size
+    receiver_weights = np.where(receivers, np.maximum(values, 0.0), 0.0)
+    if receivers.any() and receiver_weights.sum() <= 0:
+        receiver_weights = receivers.astype(float)
+    received = (
+        diverted * receiver_weights / receiver_weights.sum()
+        if receiver_weights.sum() > 0 else np.zeros(n)
+    )
+
+    result['diversion'] = np.round(diversion, 2)
+    result['received'] = np.round(received, 2)
+    result['budget_after'] = np.round(budgets - diversion + received, 2)
+
+    return {
+        "portfolios": result,
+        "hedge_weight_before": round(weight, 2),
+        "hedge_weight_after": round((hedge_value + received.sum()) / total_after * 100.0, 2) if total_after > 0 else 0.0,
+        "target_pct": target_pct,
+        "on_target": bool(on_target),
+        "has_receiver": bool(receivers.any()),
+        "shortfall": round(shortfall, 2),
+        "diverted": round(diverted, 2),
+        "gold_buy": round(received.sum() * gold_fraction, 2),
+        "bond_buy": round(received.sum() * (1.0 - gold_fraction), 2),
+    }
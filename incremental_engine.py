@@ -0,0 +1,291 @@
+"""
+Incremental allocation engine for standard (target/tolerance) portfolios.
+
+Keeps the aggregates of the standard algorithm (total value, positive
+deviation sum, minimum-band needs) and its eligible sets up to date as single
+holdings are edited, so the Action Center can refresh recommendations while
+the user types instead of rebuilding the allocator on Calculate.
+
+Whether a stock is below target or below its minimum band only depends on
+one ratio per stock compared with the portfolio total:
+    below target    <=>  100 * value / target           < total
+    below min band  <=>  100 * value / (target - tol)   < total
+Each ratio lives in a `_ThresholdIndex` (keys in sorted slots with Fenwick
+prefix sums), so the sums over either set are a binary search plus a prefix
+query. An edit that keeps a stock's ratio between its neighbours is an
+O(log n) point update; one that reorders the ratios (or adds or removes a
+stock) re-sorts the index on the next query, in O(n log n).
+
+Only `summary` benefits from this. Every item of the per-stock phases
+depends on the portfolio total, so one edit changes all of them:
+`recommendations` rebuilds the phase items and rounds the full order set on
+every call, in O(n log n) like `calculate_standard_buys`.
+"""
+
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple
+
+from allocation_engine import (
+    allocate_standard_phases,
+    finalize_standard_orders,
+    is_rene,
+    rene_order,
+    standard_phase_items,
+)
+
+_NEVER = float("inf")
+
+
+def _number(value: Any) -> float:
+    """Editor cells can be None, NaN or strings; anything unusable counts as 0."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if number == number else 0.0
+
+
+class _Fenwick:
+    """Prefix sums over a fixed number of slots with O(log n) point updates."""
+
+    def __init__(self, values: List[float]):
+        self._tree = [0.0] + list(values)
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def add(self, slot: int, delta: float) -> None:
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, count: int) -> float:
+        total = 0.0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+
+class _ThresholdIndex:
+    """Items keyed by a ratio, with sums of two values over all keys below a threshold."""
+
+    def __init__(self):
+        self._items: Dict[str, Tuple[float, float, float]] = {}
+        self._dirty = True
+
+    def set(self, name: str, key: float, a: float, b: float) -> None:
+        old = self._items.get(name)
+        self._items[name] = (key, a, b)
+        if self._dirty:
+            return
+        if old is None:
+            self._dirty = True
+            return
+
+        slot = self._slots[name]
+        if (slot > 0 and self._keys[slot - 1] > key) or (slot + 1 < len(self._keys) and self._keys[slot + 1] < key):
+            self._dirty = True
+            return
+
+        self._keys[slot] = key
+        self._sum_a.add(slot, a - old[1])
+        self._sum_b.add(slot, b - old[2])
+
+    def remove(self, name: str) -> None:
+        if self._items.pop(name, None) is not None:
+            self._dirty = True
+
+    def _rebuild(self) -> None:
+        self._order = sorted(self._items, key=lambda n: self._items[n][0])
+        self._slots = {name: slot for slot, name in enumerate(self._order)}
+        self._keys = [self._items[n][0] for n in self._order]
+        self._sum_a = _Fenwick([self._items[n][1] for n in self._order])
+        self._sum_b = _Fenwick([self._items[n][2] for n in self._order])
+        self._dirty = False
+
+    def _count_below(self, threshold: float) -> int:
+        if self._dirty:
+            self._rebuild()
+        return bisect_left(self._keys, threshold)
+
+    def sums_below(self, threshold: float) -> Tuple[float, float]:
+        count = self._count_below(threshold)
+        return self._sum_a.prefix(count), self._sum_b.prefix(count)
+
+    def names_below(self, threshold: float) -> List[str]:
+        return self._order[:self._count_below(threshold)]
+
+
+class IncrementalAllocator:
+    """
+    Live version of `calculate_standard_buys` for one portfolio.
+
+    `update`, `add`, `remove` and `set_monthly_investment` keep the
+    aggregates current; `summary` answers from them in O(log n) between
+    re-sorts and `recommendations` recomputes the full order set.
+    """
+
+    def __init__(
+        self,
+        stocks: List[Dict[str, Any]],
+        monthly_investment: float,
+        is_dividends: bool = False,
+        rene_first: Optional[bool] = None,
+    ):
+        self.monthly_investment = float(monthly_investment)
+        self.is_dividends = is_dividends
+        self.rene_first = is_dividends if rene_first is None else rene_first
+        self._stocks: Dict[str, Dict[str, Any]] = {}
+        self._total_current = 0.0
+        self._total_target = 0.0
+        self._below_target = _ThresholdIndex()
+        self._below_band = _ThresholdIndex()
+        self._rene_name: Optional[str] = None
+        for stock in stocks:
+            self.add(stock)
+
+    # --- Edits ---
+    def _is_rene(self, name: Any) -> bool:
+        return self.rene_first and is_rene(name)
+
+    def _index(self, name: str) -> None:
+        stock = self._stocks[name]
+        if self._is_rene(name):
+            return
+        value = stock['current_value']
+        target = stock['target_allocation']
+        band = target - stock.get('tolerance', 0.0)
+        self._below_target.set(name, 100.0 * value / target if target > 0 else _NEVER, target, value)
+        self._below_band.set(name, 100.0 * value / band if band > 0 else _NEVER, band, value)
+
+    def add(self, stock: Dict[str, Any]) -> None:
+        name = stock['name']
+        if name in self._stocks:
+            self.remove(name)
+        self._stocks[name] = {
+            'name': name,
+            'current_value': _number(stock.get('current_value')),
+            'target_allocation': _number(stock.get('target_allocation')),
+            'tolerance': _number(stock.get('tolerance')),
+            'current_price': _number(stock.get('current_price')),
+        }
+        self._total_current += self._stocks[name]['current_value']
+        self._total_target += self._stocks[name]['target_allocation']
+        if self._is_rene(name):
+            self._rene_name = name
+        self._index(name)
+
+    def remove(self, name: str) -> None:
+        stock = self._stocks.pop(name, None)
+        if stock is None:
+            return
+        self._total_current -= stock['current_value']
+        self._total_target -= stock['target_allocation']
+        self._below_target.remove(name)
+        self._below_band.remove(name)
+        if name == self._rene_name:
+            self._rene_name = None
+
+    def update(
+        self,
+        name: str,
+        current_value: Optional[float] = None,
+        target_allocation: Optional[float] = None,
+        tolerance: Optional[float] = None,
+        current_price: Optional[float] = None,
+    ) -> None:
+        """Changes one holding; O(log n) unless its ratio overtakes a neighbour's."""
+        stock = self._stocks[name]
+        if current_value is not None:
+            self._total_current += _number(current_value) - stock['current_value']
+            stock['current_value'] = _number(current_value)
+        if target_allocation is not None:
+            self._total_target += _number(target_allocation) - stock['target_allocation']
+            stock['target_allocation'] = _number(target_allocation)
+        if tolerance is not None:
+            stock['tolerance'] = _number(tolerance)
+        if current_price is not None:
+            stock['current_price'] = _number(current_price)
+        self._index(name)
+
+    def set_monthly_investment(self, amount: float) -> None:
+        self.monthly_investment = float(amount)
+
+    def names(self) -> List[str]:
+        """The holdings the allocator currently tracks."""
+        return list(self._stocks)
+
+    # --- Queries ---
+    @property
+    def total_target(self) -> float:
+        return self._total_target
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals, positive deviation sum, minimum-band needs and eligible counts."""
+        total = self._total_current
+        total_theoretical = total + self.monthly_investment
+
+        if total > 0:
+            target_sum, value_sum = self._below_target.sums_below(total)
+            band_sum, band_value_sum = self._below_band.sums_below(total)
+            sum_positive_deviations = target_sum - 100.0 * value_sum / total
+            below_target = self._below_target.names_below(total)
+            below_band = self._below_band.names_below(total)
+        else:
+            # Empty portfolio: every stock with a positive target (band) qualifies
+            pool = [s for n, s in self._stocks.items() if not self._is_rene(n)]
+            below_target = [s['name'] for s in pool if s['target_allocation'] > 0]
+            below_band = [s['name'] for s in pool if s['target_allocation'] - s['tolerance'] > 0]
+            sum_positive_deviations = sum(self._stocks[n]['target_allocation'] for n in below_target)
+            band_sum = sum(self._stocks[n]['target_allocation'] - self._stocks[n]['tolerance'] for n in below_band)
+            band_value_sum = 0.0
+
+        return {
+            "portfolio_value_before": total,
+            "portfolio_value_after": total_theoretical,
+            "total_target": self._total_target,
+            "sum_positive_deviations": sum_positive_deviations,
+            "total_needed_band": max(0.0, total_theoretical * band_sum / 100.0 - band_value_sum),
+            "below_target": below_target,
+            "below_min_band": below_band,
+        }
+
+    def recommendations(self) -> Dict[str, Any]:
+        """The current order set, as `calculate_standard_buys` would return it; O(n log n) per call."""
+        total_current = self._total_current
+        remaining_investment = self.monthly_investment
+        total_theoretical = total_current + remaining_investment
+
+        raw_buys = {name: 0.0 for name in self._stocks}
+        pool = list(self._stocks.values())
+
+        if self._rene_name is not None:
+            rene = self._stocks[self._rene_name]
+            invest_real = rene_order(rene, total_theoretical, remaining_investment)
+            raw_buys[rene['name']] = invest_real
+            remaining_investment -= invest_real
+            pool = [s for s in pool if not self._is_rene(s['name'])]
+
+        if remaining_investment > 0 and pool:
+            summary = self.summary()
+            items = standard_phase_items(pool, total_current, total_theoretical)
+            remaining_investment = allocate_standard_phases(
+                items, remaining_investment, summary["sum_positive_deviations"], summary["total_needed_band"]
+            )
+            for item in items:
+                raw_buys[item['name']] = item['invest']
+
+        targets = {name: s['target_allocation'] for name, s in self._stocks.items()}
+        buys, leftover_cash = finalize_standard_orders(raw_buys, self.monthly_investment, self.is_dividends, targets)
+
+        return {
+            "portfolio_value_before": round(total_current, 2),
+            "monthly_contribution": round(self.monthly_investment, 2),
+            "portfolio_value_after": round(total_theoretical, 2),
+            "raw_buys": raw_buys,
+            "buys": buys,
+            "leftover_cash": leftover_cash,
+        }
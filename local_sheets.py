@@ -0,0 +1,275 @@
+"""
+Local stand-in for the Google Sheets connection.
+
+`LocalSheetsConnection` offers the part of `GSheetsConnection` the app uses:
+`read(worksheet=, ttl=)`, `update(worksheet=, data=)`,
+`create(worksheet=, data=)` and `reset()`, plus
+`open_spreadsheet()` standing in for the gspread spreadsheet: its
+`worksheet(title)` handles support the `batch_update`, `delete_rows` and
+`append_rows` calls of the row-level delta sync, and
+`get_lastUpdateTime()` gives the spreadsheet's revision. Each worksheet is a
+CSV file in `directory`, so reads go through the same text-to-type inference
+as a real sheet.
+
+Every API call can be slowed down by `latency` seconds (plus up to `jitter`)
+and fail with `QuotaExceeded` with probability `error_rate`, which makes it
+possible to benchmark the save and load paths, and their retries, under a
+realistic API on an offline machine. Set `SHEETS_BACKEND=local` to use it in
+the app.
+"""
+
+import csv
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+DEFAULT_SHEETS_DIR = os.getenv("LOCAL_SHEETS_DIR", os.path.join("data", "sheets"))
+
+_A1_CELL = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+class QuotaExceeded(Exception):
+    """Injected failure shaped like the Sheets API's HTTP 429 error."""
+
+    status_code = 429
+
+    def __init__(self, call: str):
+        super().__init__(f"[429]: Quota exceeded for quota metric 'Requests' ({call}, injected).")
+
+
+def _column_index(letters: str) -> int:
+    """A1 column letters to a 1-based index."""
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def _a1_range(a1: str) -> Dict[str, int]:
+    """'B5:D6' (or 'B5') to 1-based first/last row and column."""
+    cells = a1.split("!")[-1].split(":")
+    parsed = []
+    for cell in cells:
+        match = _A1_CELL.match(cell.upper())
+        if match is None:
+            raise ValueError(f"Unsupported range '{a1}'.")
+        parsed.append((int(match.group(2)), _column_index(match.group(1))))
+    (first_row, first_col), (last_row, last_col) = parsed[0], parsed[-1]
+    return {"first_row": first_row, "first_col": first_col, "last_row": last_row, "last_col": last_col}
+
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+def _frame_grid(data: pd.DataFrame) -> List[List[str]]:
+    """A frame as sheet cells: header row, then one row per record."""
+    grid = [[str(c) for c in data.columns]]
+    grid += [[_cell_text(v) for v in row] for row in data.itertuples(index=False, name=None)]
+    return grid
+
+
+class LocalWorksheet:
+    """One worksheet as a grid of strings (row 1 is the header), saved on every change."""
+
+    def __init__(self, connection: "LocalSheetsConnection", title: str):
+        self._conn = connection
+        self.title = title
+
+    def get_all_values(self) -> List[List[str]]:
+        self._conn._call("get_all_values")
+        return [list(row) for row in self._conn._grid(self.title)]
+
+    def batch_update(self, data: Sequence[Dict[str, Any]], value_input_option: str = "RAW") -> None:
+        self._conn._call("batch_update")
+        with self._conn._lock:
+            grid = self._conn._grid(self.title)
+            for update in data:
+                bounds = _a1_range(update["range"])
+                for r, values in enumerate(update["values"]):
+                    row = bounds["first_row"] - 1 + r
+                    while len(grid) <= row:
+                        grid.append([])
+                    for c, value in enumerate(values):
+                        col = bounds["first_col"] - 1 + c
+                        if len(grid[row]) <= col:
+                            grid[row].extend([""] * (col + 1 - len(grid[row])))
+                        grid[row][col] = _cell_text(value)
+            self._conn._save(self.title, grid)
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> None:
+        """Deletes sheet rows `start_index`..`end_index` (1-based, inclusive)."""
+        self._conn._call("delete_rows")
+        end_index = start_index if end_index is None else end_index
+        with self._conn._lock:
+            grid = self._conn._grid(self.title)
+            del grid[start_index - 1:end_index]
+            self._conn._save(self.title, grid)
+
+    def append_rows(self, values: Sequence[Sequence[Any]], value_input_option: str = "RAW") -> None:
+        self._conn._call("append_rows")
+        with self._conn._lock:
+            grid = self._conn._grid(self.title)
+            grid.extend([[_cell_text(v) for v in row] for row in values])
+            self._conn._save(self.title, grid)
+
+
+class LocalSpreadsheet:
+    """The connection's directory as a gspread-style spreadsheet."""
+
+    def __init__(self, connection: "LocalSheetsConnection"):
+        self._conn = connection
+
+    def worksheet(self, title: str) -> LocalWorksheet:
+        """The worksheet called `title`; FileNotFoundError if there is none (gspread: `WorksheetNotFound`)."""
+        self._conn._call("worksheet")
+        self._conn._grid(title)
+        return LocalWorksheet(self._conn, title)
+
+    def get_lastUpdateTime(self) -> str:
+        """Latest change of any worksheet file, like the Drive `modifiedTime` of a spreadsheet."""
+        self._conn._call("get_lastUpdateTime")
+        stamps = [
+            entry.stat().st_mtime_ns for entry in os.scandir(self._conn.directory)
+            if entry.name.endswith(".csv")
+        ]
+        return str(max(stamps, default=0))
+
+
+class LocalSheetsConnection:
+    """
+    File-backed drop-in for `st.connection("gsheets", type=GSheetsConnection)`.
+
+    `calls` counts API calls by method; `errors` counts injected failures.
+    Pass `seed` for a reproducible failure sequence.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_SHEETS_DIR,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        # worksheet -> (file mtime, cells)
+        self._grids: Dict[str, Tuple[int, List[List[str]]]] = {}
+        self.calls: Counter = Counter()
+        self.errors = 0
+
+    def _call(self, name: str) -> None:
+        """Counts an API call, then applies the injected latency and failures."""
+        with self._lock:
+            self.calls[name] += 1
+            delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise QuotaExceeded(name)
+
+    def _path(self, worksheet: str) -> str:
+        return os.path.join(self.directory, f"{worksheet}.csv")
+
+    def _grid(self, worksheet: str) -> List[List[str]]:
+        """The worksheet's cells, re-read when another connection changed the file."""
+        with self._lock:
+            path = self._path(worksheet)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Worksheet '{worksheet}' not found in {self.directory}.")
+            stamp = os.stat(path).st_mtime_ns
+            cached = self._grids.get(worksheet)
+            if cached is None or cached[0] != stamp:
+                with open(path, newline="", encoding="utf-8") as f:
+                    cached = (stamp, [row for row in csv.reader(f)])
+                self._grids[worksheet] = cached
+            return cached[1]
+
+    def _save(self, worksheet: str, grid: List[List[str]]) -> None:
+        with self._lock:
+            path = self._path(worksheet)
+            partial = f"{path}.tmp"
+            with open(partial, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(grid)
+            os.replace(partial, path)
+            self._grids[worksheet] = (os.stat(path).st_mtime_ns, grid)
+
+    def read(self, worksheet: Optional[str] = None, ttl: Any = None, **kwargs: Any) -> pd.DataFrame:
+        """The worksheet as a DataFrame, with types inferred from the cell text."""
+        self._call("read")
+        worksheet = worksheet or "Sheet1"
+        with self._lock:
+            self._grid(worksheet)
+            path = self._path(worksheet)
+            if os.path.getsize(path) == 0:
+                return pd.DataFrame()
+            return pd.read_csv(path)
+
+    def update(self, worksheet: Optional[str] = None, data: Optional[pd.DataFrame] = None, **kwargs: Any) -> pd.DataFrame:
+        """
+        Replaces the whole worksheet with `data` (header + rows). Like the real
+        connection it does not add worksheets: FileNotFoundError if there is none.
+        """
+        self._call("update")
+        worksheet = worksheet or "Sheet1"
+        data = pd.DataFrame() if data is None else data
+        with self._lock:
+            self._grid(worksheet)
+            self._save(worksheet, _frame_grid(data))
+        return data
+
+    def create(self, worksheet: Optional[str] = None, data: Optional[pd.DataFrame] = None, **kwargs: Any) -> pd.DataFrame:
+        """Adds a worksheet holding `data`; FileExistsError if it already exists."""
+        self._call("create")
+        worksheet = worksheet or "Sheet1"
+        data = pd.DataFrame() if data is None else data
+        with self._lock:
+            if os.path.exists(self._path(worksheet)):
+                raise FileExistsError(f"Worksheet '{worksheet}' already exists in {self.directory}.")
+            self._save(worksheet, _frame_grid(data))
+        return data
+
+    def open_spreadsheet(self) -> LocalSpreadsheet:
+        """The spreadsheet handle, like gspread's `open_by_url`."""
+        return LocalSpreadsheet(self)
+
+    def reset(self) -> None:
+        """Drops the in-memory copies; the next access re-reads the files."""
+        with self._lock:
+            self._grids.clear()
+
+
+def local_connection_from_env() -> LocalSheetsConnection:
+    """
+    A connection configured by environment variables: `LOCAL_SHEETS_DIR`,
+    `LOCAL_SHEETS_LATENCY` and `LOCAL_SHEETS_JITTER` (seconds per call) and
+    `LOCAL_SHEETS_ERROR_RATE` (0-1).
+    """
+
+    return LocalSheetsConnection(
+        directory=DEFAULT_SHEETS_DIR,
+        latency=float(os.getenv("LOCAL_SHEETS_LATENCY", "0") or 0),
+        jitter=float(os.getenv("LOCAL_SHEETS_JITTER", "0") or 0),
+        error_rate=float(os.getenv("LOCAL_SHEETS_ERROR_RATE", "0") or 0),
+    )
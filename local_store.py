@@ -0,0 +1,833 @@
+"""
+Local embedded store for the app's worksheets.
+
+DuckDB holds one table per worksheet (Portfolios, Dividends, InvestmentLog)
+and is the source of truth while the app runs: a save is a local transaction
+that takes milliseconds. Google Sheets becomes a replica kept up to date by
+`SheetsReplicator`, a write-behind queue that uploads saved worksheets from
+a background thread, so a slow or rate-limited Sheets API never blocks the UI. On a fresh disk
+the store is seeded from Sheets the first time each worksheet is read.
+
+Each worksheet is also kept as a typed Parquet snapshot, rewritten after
+every upload Sheets accepted. When the store has lost a worksheet, the cold
+start restores it from the memory-mapped snapshot and renders at once, while
+`SnapshotRefresher` fetches the sheet in the background. Until that fetch
+succeeds, the worksheet is read-only: the snapshot may be older than the
+sheet, and saving it would overwrite newer rows. A worksheet whose first
+fetch fails with nothing local to fall back on is read-only too, rather than
+an empty frame a save could push over the whole sheet; one that does not
+exist on the sheet yet simply starts empty and writable.
+
+Each worksheet's version counter is paired with the version last uploaded
+(`synced_version`), so saves still queued when the process stopped are not
+lost: `requeue_unsynced` queues them again at the next start, and until they
+are uploaded `ChangeWatcher` leaves them alone.
+
+`ChangeWatcher` keeps the store in step with uploads from other processes:
+it compares the worksheets' change tokens on the sheet (one small read,
+see `sheet_sync.ChangeTokens`) with the tokens the store last synced, and
+downloads only the worksheets whose token differs. Edits made directly in
+the sheet move no token, so it also re-downloads the worksheets every few
+minutes while the spreadsheet's revision says something changed.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
+from sheet_sync import cell_value, worksheet_missing
+
+DEFAULT_DB_PATH = os.getenv("PORTFOLIO_DB_PATH", os.path.join("data", "portfolio.duckdb"))
+
+DEFAULT_SNAPSHOT_DIR = os.getenv("PORTFOLIO_SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+
+WORKSHEETS = ("Portfolios", "Dividends", "InvestmentLog")
+
+
+def _table(worksheet: str) -> str:
+    if worksheet not in WORKSHEETS:
+        raise ValueError(f"Unknown worksheet '{worksheet}'.")
+    return f'"{worksheet}"'
+
+
+_INTEGER_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT")
+
+
+def _widened_type(stored: str, incoming: str) -> Optional[str]:
+    """
+    Type a stored column must be widened to before values of type `incoming`
+    are inserted into it without loss (None if they already fit): integers
+    widen to BIGINT, other numbers to DOUBLE, anything else to VARCHAR.
+    """
+
+    if stored == incoming or stored == "VARCHAR":
+        return None
+    numbers = _INTEGER_TYPES + ("FLOAT", "DOUBLE")
+    if stored in numbers and incoming in numbers:
+        if stored == "DOUBLE" or (stored == "BIGINT" and incoming in _INTEGER_TYPES):
+            return None
+        return "BIGINT" if stored in _INTEGER_TYPES and incoming in _INTEGER_TYPES else "DOUBLE"
+    return "VARCHAR"
+
+
+class ReadOnlyWorksheet(RuntimeError):
+    """A save was refused because the worksheet may be older than Google Sheets."""
+
+
+class LocalStore:
+    """
+    DuckDB-backed worksheet tables with a version counter per worksheet.
+
+    One instance is shared by every session of the process; a lock
+    serializes access to the single DuckDB connection. `snapshot_dir` holds
+    the Parquet snapshots (None disables them).
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, snapshot_dir: Optional[str] = DEFAULT_SNAPSHOT_DIR):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self._con = duckdb.connect(path)
+        self._lock = threading.RLock()
+        # worksheet -> why saves are refused
+        self._read_only: Dict[str, str] = {}
+        with self._lock:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS _sheet_versions ("
+                "worksheet VARCHAR PRIMARY KEY, version BIGINT, updated_at TIMESTAMP)"
+            )
+            # Change token of the sheet the local copy matches (see ChangeWatcher)
+            self._con.execute("ALTER TABLE _sheet_versions ADD COLUMN IF NOT EXISTS token VARCHAR")
+            # Last version uploaded to the sheet; stores from before the column count as synced
+            self._con.execute("ALTER TABLE _sheet_versions ADD COLUMN IF NOT EXISTS synced_version BIGINT")
+            self._con.execute("UPDATE _sheet_versions SET synced_version = version WHERE synced_version IS NULL")
+
+    @contextmanager
+    def transaction(self) -> Iterator["LocalStore"]:
+        """
+        Holds the store lock across several calls, so no other thread's save
+        lands between them (each write still commits on its own).
+        """
+        with self._lock:
+            yield self
+
+    def has(self, worksheet: str) -> bool:
+        with self._lock:
+            return self._con.execute(
+                "SELECT count(*) FROM _sheet_versions WHERE worksheet = ?", [worksheet]
+            ).fetchone()[0] > 0
+
+    def read(self, worksheet: str) -> Optional[pd.DataFrame]:
+        """The stored worksheet, or None if it was never written."""
+        if not self.has(worksheet):
+            return None
+        with self._lock:
+            return self._con.execute(f"SELECT * FROM {_table(worksheet)}").df()
+
+    def write(self, worksheet: str, data: pd.DataFrame) -> int:
+        """Replaces the worksheet in one transaction; returns its new version."""
+        self._check_writable(worksheet)
+        return self._replace(worksheet, data)
+
+    def _replace(self, worksheet: str, data: pd.DataFrame) -> int:
+        table = _table(worksheet)
+        frame = data.reset_index(drop=True)
+        with self._lock:
+            self._con.execute("BEGIN TRANSACTION")
+            try:
+                self._con.register("_incoming", frame)
+                self._con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM _incoming")
+                self._con.unregister("_incoming")
+                self._bump(worksheet)
+                self._con.execute("COMMIT")
+            except Exception:
+                self._con.execute("ROLLBACK")
+                raise
+            return self.version(worksheet)
+
+    def replace_if_version(self, worksheet: str, data: pd.DataFrame, version: int, token: Optional[str] = None) -> bool:
+        """
+        Replaces the worksheet with data downloaded from Google Sheets, unless
+        a save landed since `version` was read (that save will overwrite the
+        sheet); `token` becomes its sync token. False if nothing was replaced.
+        """
+
+        with self._lock:
+            if self.version(worksheet) != version:
+                return False
+            self.mark_synced(worksheet, self._replace(worksheet, data))
+            if token is not None:
+                self.set_sync_token(worksheet, token)
+            return True
+
+    def append(self, worksheet: str, rows: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        Appends rows in one transaction without reading the worksheet back.
+
+        Returns the rows aligned to the stored columns (missing ones empty),
+        i.e. as they must be appended to the sheet. Stored columns whose type
+        the rows do not fit (a float in a column seeded with integers, text
+        in an all-empty one) are widened first, so the store keeps what the
+        sheet gets. Rows bringing new columns fall back to rewriting the table
+        with the columns added and return None: the whole worksheet then has
+        to be uploaded again.
+        """
+
+        self._check_writable(worksheet)
+        table = _table(worksheet)
+        frame = rows.reset_index(drop=True)
+        with self._lock:
+            if not self.has(worksheet):
+                self.write(worksheet, frame)
+                return None
+            columns = [c[0] for c in self._con.execute(f"SELECT * FROM {table} LIMIT 0").description]
+            if not set(frame.columns) <= set(columns):
+                self.write(worksheet, pd.concat([self.read(worksheet), frame], ignore_index=True))
+                return None
+
+            aligned = frame.reindex(columns=columns)
+            self._con.execute("BEGIN TRANSACTION")
+            try:
+                self._con.register("_incoming", aligned)
+                stored = dict(self._con.execute(f"SELECT column_name, column_type FROM (DESCRIBE {table})").fetchall())
+                incoming = self._con.execute("SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM _incoming)").fetchall()
+                for column, column_type in incoming:
+                    # An empty column takes no values, whatever type it was inferred as
+                    widened = None if aligned[column].isna().all() else _widened_type(stored[column], column_type)
+                    if widened is not None:
+                        self._con.execute(f'ALTER TABLE {table} ALTER COLUMN "{column}" TYPE {widened}')
+                self._con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM _incoming")
+                self._con.unregister("_incoming")
+                self._bump(worksheet)
+                self._con.execute("COMMIT")
+            except Exception:
+                self._con.execute("ROLLBACK")
+                raise
+            return aligned
+
+    def tail(self, worksheet: str, n: int = 20, **filters: Any) -> pd.DataFrame:
+        """The last `n` rows appended to a worksheet, optionally filtered by column equality."""
+        if not self.has(worksheet):
+            return pd.DataFrame()
+        table = _table(worksheet)
+        where = " AND ".join(f'"{column}" = ?' for column in filters) or "TRUE"
+        with self._lock:
+            return self._con.execute(
+                f"SELECT * EXCLUDE (_row) FROM (SELECT *, rowid AS _row FROM {table} WHERE {where} "
+                f"ORDER BY _row DESC LIMIT ?) ORDER BY _row",
+                [*filters.values(), n],
+            ).df()
+
+    def _bump(self, worksheet: str) -> None:
+        self._con.execute(
+            "INSERT INTO _sheet_versions (worksheet, version, updated_at, synced_version) VALUES (?, 1, now(), 0) "
+            "ON CONFLICT (worksheet) DO UPDATE SET version = version + 1, updated_at = now()",
+            [worksheet],
+        )
+
+    def version(self, worksheet: str) -> int:
+        """0 until the worksheet is first written, then +1 per write."""
+        with self._lock:
+            row = self._con.execute(
+                "SELECT version FROM _sheet_versions WHERE worksheet = ?", [worksheet]
+            ).fetchone()
+        return int(row[0]) if row else 0
+
+    def synced_version(self, worksheet: str) -> int:
+        """The last version uploaded to (or downloaded from) the sheet; 0 if none."""
+        with self._lock:
+            row = self._con.execute(
+                "SELECT synced_version FROM _sheet_versions WHERE worksheet = ?", [worksheet]
+            ).fetchone()
+        return int(row[0]) if row else 0
+
+    def mark_synced(self, worksheet: str, version: int) -> None:
+        """Records that the sheet holds the worksheet as of `version` (never moves back)."""
+        with self._lock:
+            self._con.execute(
+                "UPDATE _sheet_versions SET synced_version = greatest(synced_version, ?) WHERE worksheet = ?",
+                [version, worksheet],
+            )
+
+    def unsynced_worksheets(self) -> List[str]:
+        """Worksheets with local saves the sheet has not received yet."""
+        with self._lock:
+            rows = self._con.execute(
+                "SELECT worksheet FROM _sheet_versions WHERE version > synced_version ORDER BY worksheet"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def sync_token(self, worksheet: str) -> Optional[str]:
+        """Change token of the sheet contents the worksheet last matched (None if unknown)."""
+        with self._lock:
+            row = self._con.execute(
+                "SELECT token FROM _sheet_versions WHERE worksheet = ?", [worksheet]
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_sync_token(self, worksheet: str, token: str) -> None:
+        with self._lock:
+            self._con.execute("UPDATE _sheet_versions SET token = ? WHERE worksheet = ?", [token, worksheet])
+
+    def read_only(self, worksheet: str) -> Optional[str]:
+        """Why saves to the worksheet are refused, or None if it is writable."""
+        return self._read_only.get(worksheet)
+
+    def read_only_worksheets(self) -> Dict[str, str]:
+        return dict(self._read_only)
+
+    def mark_read_only(self, worksheet: str, reason: str) -> None:
+        self._read_only[worksheet] = reason
+
+    def clear_read_only(self, worksheet: str) -> None:
+        self._read_only.pop(worksheet, None)
+
+    def _check_writable(self, worksheet: str) -> None:
+        reason = self._read_only.get(worksheet)
+        if reason:
+            raise ReadOnlyWorksheet(f"{worksheet} is read-only: {reason}")
+
+    def snapshot_path(self, worksheet: str) -> Optional[str]:
+        if self.snapshot_dir is None:
+            return None
+        return os.path.join(self.snapshot_dir, f"{worksheet}.parquet")
+
+    def snapshot(self, worksheet: str) -> Optional[str]:
+        """Writes the worksheet's typed Parquet snapshot (atomically); returns its path."""
+        path = self.snapshot_path(worksheet)
+        if path is None or not self.has(worksheet):
+            return None
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with self._lock:
+            table = self._con.execute(f"SELECT * FROM {_table(worksheet)}").arrow()
+        if not isinstance(table, pa.Table):
+            table = table.read_all()
+        partial = f"{path}.{threading.get_ident()}.tmp"
+        pq.write_table(table, partial)
+        os.replace(partial, path)
+        return path
+
+    def restore(self, worksheet: str) -> bool:
+        """Loads the worksheet from its snapshot (memory-mapped); False if there is none."""
+        path = self.snapshot_path(worksheet)
+        if path is None or not os.path.exists(path):
+            return False
+        frame = pq.read_table(path, memory_map=True).to_pandas()
+        # Snapshots are only taken of what the sheet holds
+        with self._lock:
+            self.mark_synced(worksheet, self._replace(worksheet, frame))
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+
+class SheetsReplicator:
+    """
+    Write-behind queue pushing saved worksheets to Google Sheets.
+
+    `push` is called with (worksheet, data), e.g. `conn.update` or a
+    `sheet_sync.DeltaSync` sending only the changed rows, and `append` with
+    (worksheet, rows) for append-only worksheets. Saves are
+    coalesced per worksheet: each save replaces the pending upload of its
+    worksheet and restarts a `debounce` timer, so a burst of saves becomes a
+    single upload of the latest data. A background thread performs the
+    uploads, retrying with exponential backoff; an upload that still fails
+    stays pending and is retried after `max_backoff` seconds, so nothing
+    saved locally is lost while Sheets is down. `on_synced(worksheet, version)`
+    runs after each successful upload, with the store version the upload
+    brought the sheet to (the one passed to `enqueue`, None if not given).
+    """
+
+    def __init__(
+        self,
+        push: Callable[..., Any],
+        append: Optional[Callable[..., Any]] = None,
+        debounce: float = 2.0,
+        max_attempts: int = 5,
+        max_backoff: float = 60.0,
+        on_synced: Optional[Callable[[str, Optional[int]], Any]] = None,
+    ):
+        self._push = push
+        self._on_synced = on_synced
+        self.debounce = debounce
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._append = append
+        # worksheet -> (kind, data, due, version); kind is "write" (whole worksheet) or "append" (new rows)
+        self._pending: Dict[str, Tuple[str, pd.DataFrame, float, Optional[int]]] = {}
+        self._in_flight: Optional[str] = None
+        self._cond = threading.Condition()
+        self.uploads = 0
+        self.coalesced = 0
+        self.last_error: Optional[str] = None
+        self.last_synced: Dict[str, float] = {}
+        self._thread = threading.Thread(target=self._run, name="sheets-replicator", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, worksheet: str, data: pd.DataFrame, version: Optional[int] = None) -> None:
+        """Queues an upload of the whole worksheet (at store `version`); supersedes anything pending for it."""
+        with self._cond:
+            if worksheet in self._pending:
+                self.coalesced += 1
+            self._pending[worksheet] = ("write", data.copy(), time.monotonic() + self.debounce, version)
+            self._cond.notify()
+
+    def enqueue_append(self, worksheet: str, rows: pd.DataFrame, version: Optional[int] = None) -> None:
+        """Queues rows to append (reaching store `version`); joins a pending upload of the same worksheet."""
+        with self._cond:
+            pending = self._pending.get(worksheet)
+            if pending is not None:
+                self.coalesced += 1
+            self._pending[worksheet] = self._merge(
+                pending, ("append", rows.copy(), time.monotonic() + self.debounce, version)
+            )
+            self._cond.notify()
+
+    @staticmethod
+    def _merge(
+        earlier: Optional[Tuple[str, pd.DataFrame, float, Optional[int]]],
+        later: Tuple[str, pd.DataFrame, float, Optional[int]],
+    ) -> Tuple[str, pd.DataFrame, float, Optional[int]]:
+        """One pending operation doing `earlier` then `later`."""
+        if earlier is None or later[0] == "write":
+            return later
+        kind, data, _, _ = earlier
+        return kind, pd.concat([data, later[1]], ignore_index=True), later[2], later[3]
+
+    def pending_worksheets(self) -> List[str]:
+        """Worksheets saved locally whose upload has not completed yet."""
+        with self._cond:
+            names = set(self._pending)
+            if self._in_flight:
+                names.add(self._in_flight)
+        return sorted(names)
+
+    def pending(self) -> int:
+        return len(self.pending_worksheets())
+
+    def _upload(self, worksheet: str, kind: str, data: pd.DataFrame) -> None:
+        for attempt in Retrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential(multiplier=0.5, max=self.max_backoff),
+            reraise=True,
+        ):
+            with attempt:
+                if kind == "append":
+                    self._append(worksheet=worksheet, rows=data)
+                else:
+                    self._push(worksheet=worksheet, data=data)
+
+    def _next_due(self) -> Tuple[str, Tuple[str, pd.DataFrame, float, Optional[int]]]:
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                worksheet = min(self._pending, key=lambda ws: self._pending[ws][2])
+                wait = self._pending[worksheet][2] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._in_flight = worksheet
+                return worksheet, self._pending.pop(worksheet)
+
+    def _run(self) -> None:
+        while True:
+            worksheet, operation = self._next_due()
+            kind, data, _, version = operation
+            try:
+                self._upload(worksheet, kind, data)
+                self.uploads += 1
+                self.last_synced[worksheet] = time.time()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{worksheet}: {e}"
+                with self._cond:
+                    # Retry later, ahead of (or superseded by) newer saves of the same worksheet
+                    retry = (kind, data, time.monotonic() + self.max_backoff, version)
+                    self._pending[worksheet] = self._merge(retry, self._pending[worksheet]) if worksheet in self._pending else retry
+            else:
+                if self._on_synced is not None:
+                    # The upload itself succeeded: a failing hook must not queue it again
+                    try:
+                        self._on_synced(worksheet, version)
+                    except Exception as e:
+                        self.last_error = f"{worksheet}: {e}"
+            finally:
+                with self._cond:
+                    self._in_flight = None
+                    self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Uploads everything pending now (skipping the debounce); False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            now = time.monotonic()
+            self._pending = {
+                ws: (kind, data, min(due, now), version) for ws, (kind, data, due, version) in self._pending.items()
+            }
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+        return True
+
+
+def _cell_key(value: Any) -> Any:
+    """
+    A cell as both a download and the local copy show it: numbers as floats,
+    TRUE/FALSE text as booleans, dates as ISO text, missing as ''.
+    """
+    if isinstance(value, (pd.Timestamp, datetime, date)) and not pd.isna(value):
+        stamp = pd.Timestamp(value)
+        return stamp.strftime("%Y-%m-%d") if stamp == stamp.normalize() else stamp.isoformat(sep=" ")
+    value = cell_value(value)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.upper() in ("TRUE", "FALSE"):
+            return text.upper() == "TRUE"
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        return number if number == number else ""
+    return value
+
+
+def _same_rows(downloaded: pd.DataFrame, local: Optional[pd.DataFrame]) -> bool:
+    """Whether a download shows the same cells as the local copy, whatever types each side inferred."""
+    if local is None or list(downloaded.columns) != list(local.columns) or len(downloaded) != len(local):
+        return False
+    rows = zip(downloaded.itertuples(index=False, name=None), local.itertuples(index=False, name=None))
+    return all(
+        _cell_key(a) == _cell_key(b)
+        for remote_row, local_row in rows
+        for a, b in zip(remote_row, local_row)
+    )
+
+
+def load_worksheet(
+    store: LocalStore,
+    worksheet: str,
+    fetch: Callable[[], Optional[pd.DataFrame]],
+    remote_token: Optional[Callable[[], Optional[str]]] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Reads a worksheet from the store, seeding it the first time.
+
+    Rules:
+    - A worksheet with a snapshot is restored from it without calling
+      `fetch()` (or anything else remote), and is read-only until
+      `refresh_worksheet` confirms it.
+    - Otherwise it is seeded with `fetch()` (a Sheets read), tagged with the
+      change token `remote_token()` returned just before. A worksheet
+      missing on the sheet is empty and writable (None is returned); any
+      other failed fetch marks it read-only and re-raises. An empty fetch
+      is not stored.
+    """
+
+    data = store.read(worksheet)
+    if data is not None:
+        return data
+    if store.restore(worksheet):
+        store.mark_read_only(worksheet, "showing the last local snapshot until Google Sheets answers")
+        return store.read(worksheet)
+    # Token first: the data is at least as new as the token it is tagged with
+    token = remote_token() if remote_token is not None else None
+    try:
+        data = fetch()
+    except Exception as e:
+        if not worksheet_missing(e):
+            store.mark_read_only(worksheet, f"Google Sheets is unreachable ({e})")
+            raise
+        data = None
+    store.clear_read_only(worksheet)
+    if data is not None and not data.empty:
+        store.mark_synced(worksheet, store.write(worksheet, data))
+        if token:
+            store.set_sync_token(worksheet, token)
+        store.snapshot(worksheet)
+    return data
+
+
+def queue_write(store: LocalStore, replicator: SheetsReplicator, worksheet: str, data: pd.DataFrame) -> int:
+    """
+    Saves a whole worksheet locally and queues its upload, as one step:
+    concurrent saves reach the upload queue in the order the store applied
+    them, so the sheet ends up with what the store holds. Returns the new
+    version; raises `ReadOnlyWorksheet` like `LocalStore.write`.
+    """
+
+    with store.transaction():
+        version = store.write(worksheet, data)
+        replicator.enqueue(worksheet, data, version)
+    return version
+
+
+def queue_append(
+    store: LocalStore,
+    replicator: SheetsReplicator,
+    worksheet: str,
+    rows: pd.DataFrame,
+    fetch: Callable[[], Optional[pd.DataFrame]],
+    remote_token: Optional[Callable[[], Optional[str]]] = None,
+) -> None:
+    """
+    Appends rows locally and queues their upload: no full read or rewrite.
+
+    Rules:
+    - A worksheet not in the store is seeded once with `load_worksheet`, so
+      the local table starts from the sheet's history; one missing on the
+      sheet starts empty.
+    - Rows with the stored columns are queued as a Sheets append; a new
+      table or new columns queue the whole worksheet once.
+    - Raises `ReadOnlyWorksheet` (with the reason) when the seeding fetch
+      could not reach Google Sheets.
+    """
+
+    if not store.has(worksheet):
+        try:
+            load_worksheet(store, worksheet, fetch, remote_token)
+        except Exception:
+            pass  # Marked read-only: the append below is refused with the reason
+    # Queued in one store transaction, like `queue_write`, so uploads follow the local order
+    with store.transaction():
+        aligned = store.append(worksheet, rows)
+        version = store.version(worksheet)
+        if aligned is not None:
+            replicator.enqueue_append(worksheet, aligned, version)
+        else:
+            replicator.enqueue(worksheet, store.read(worksheet), version)
+
+
+def requeue_unsynced(store: LocalStore, replicator: SheetsReplicator) -> List[str]:
+    """
+    Queues a whole-worksheet upload for every worksheet saved locally but
+    not uploaded (e.g. the process stopped with saves still queued); run it
+    once at startup. Returns the worksheets queued.
+    """
+
+    queued = []
+    with store.transaction():
+        for worksheet in store.unsynced_worksheets():
+            data = store.read(worksheet)
+            if data is not None:
+                replicator.enqueue(worksheet, data, store.version(worksheet))
+                queued.append(worksheet)
+    return queued
+
+
+def refresh_worksheet(
+    store: LocalStore,
+    worksheet: str,
+    fetch: Callable[[], Optional[pd.DataFrame]],
+    remote_token: Optional[Callable[[], Optional[str]]] = None,
+) -> bool:
+    """
+    Replaces a worksheet restored from its snapshot with a fresh Sheets read
+    (tagged with the change token `remote_token()` returned just before) and
+    makes it writable again. False (still read-only) if the fetch fails.
+    """
+
+    version = store.version(worksheet)
+    try:
+        token = remote_token() if remote_token is not None else None
+        data = fetch()
+    except Exception as e:
+        if not worksheet_missing(e):
+            store.mark_read_only(worksheet, f"Google Sheets is unreachable ({e})")
+            return False
+        data = None  # Nothing on the sheet yet: the local copy is the newest there is
+    if data is not None and not data.empty:
+        store.replace_if_version(worksheet, data, version, token or None)
+    store.clear_read_only(worksheet)
+    store.snapshot(worksheet)
+    return True
+
+
+class SnapshotRefresher:
+    """
+    Runs `refresh_worksheet` for read-only worksheets in background threads:
+    at most one per worksheet at a time, and one attempt per `interval` seconds.
+    """
+
+    def __init__(self, store: LocalStore, interval: float = 30.0):
+        self.store = store
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._running: set = set()
+        self._last_attempt: Dict[str, float] = {}
+
+    def schedule(
+        self,
+        worksheet: str,
+        fetch: Callable[[], Optional[pd.DataFrame]],
+        remote_token: Optional[Callable[[], Optional[str]]] = None,
+    ) -> bool:
+        """Starts a refresh if the worksheet is read-only and none is due yet; True if started."""
+        if not self.store.read_only(worksheet):
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if worksheet in self._running or now - self._last_attempt.get(worksheet, -self.interval) < self.interval:
+                return False
+            self._running.add(worksheet)
+            self._last_attempt[worksheet] = now
+        threading.Thread(
+            target=self._refresh, args=(worksheet, fetch, remote_token), name=f"refresh-{worksheet}", daemon=True
+        ).start()
+        return True
+
+    def _refresh(
+        self,
+        worksheet: str,
+        fetch: Callable[[], Optional[pd.DataFrame]],
+        remote_token: Optional[Callable[[], Optional[str]]],
+    ) -> None:
+        try:
+            refresh_worksheet(self.store, worksheet, fetch, remote_token)
+        finally:
+            with self._lock:
+                self._running.discard(worksheet)
+
+
+class ChangeWatcher:
+    """
+    Re-downloads worksheets that changed on Google Sheets since this store
+    last synced them.
+
+    `remote_tokens()` returns {worksheet: token} from the sheet, `fetch(worksheet)`
+    downloads one worksheet and `busy()` lists worksheets with local saves not
+    uploaded yet (those keep the local copy, which will overwrite the sheet;
+    so do the store's `unsynced_worksheets`, saved before a restart).
+    Tokens only move when an app process uploads, so every `reseed_interval`
+    seconds the worksheets are also downloaded again to pick up edits made
+    directly in the sheet; with `remote_revision()` (e.g. the spreadsheet's
+    Drive modifiedTime) that download is skipped while the revision has not
+    moved. A download identical to the local copy changes nothing.
+    `on_refreshed(worksheet)` runs after each download that replaced the
+    local copy. Checks run in a background thread, at most one per `interval`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        store: LocalStore,
+        remote_tokens: Callable[[], Dict[str, str]],
+        fetch: Callable[[str], Optional[pd.DataFrame]],
+        busy: Callable[[], List[str]] = list,
+        on_refreshed: Optional[Callable[[str], Any]] = None,
+        interval: float = 60.0,
+        remote_revision: Optional[Callable[[], Optional[str]]] = None,
+        reseed_interval: float = 600.0,
+    ):
+        self.store = store
+        self._remote_tokens = remote_tokens
+        self._fetch = fetch
+        self._busy = busy
+        self._on_refreshed = on_refreshed
+        self._remote_revision = remote_revision
+        self.interval = interval
+        self.reseed_interval = reseed_interval
+        self._lock = threading.Lock()
+        self._running = False
+        self._last_check = -interval
+        self._last_reseed = time.monotonic()
+        self._revision: Optional[str] = None
+        self.checks = 0
+        self.downloads = 0
+
+    def _download(self, worksheet: str, token: Optional[str]) -> bool:
+        """Replaces the local copy with the sheet's; False if unchanged or a save landed meanwhile."""
+        version = self.store.version(worksheet)
+        data = self._fetch(worksheet)
+        if data is None or data.empty:
+            return False
+        if _same_rows(data, self.store.read(worksheet)):
+            if token is not None:
+                self.store.set_sync_token(worksheet, token)
+            return False
+        # A save that landed meanwhile wins, as it will overwrite the sheet
+        if not self.store.replace_if_version(worksheet, data, version, token):
+            return False
+        self.downloads += 1
+        self.store.snapshot(worksheet)
+        if self._on_refreshed is not None:
+            self._on_refreshed(worksheet)
+        return True
+
+    def _eligible(self, worksheet: str, busy: set) -> bool:
+        # Read-only worksheets belong to SnapshotRefresher
+        return (
+            worksheet in WORKSHEETS and worksheet not in busy
+            and self.store.has(worksheet) and not self.store.read_only(worksheet)
+        )
+
+    def check(self) -> List[str]:
+        """Compares tokens (and, when due, re-downloads everything) now; returns the worksheets replaced."""
+        self.checks += 1
+        reseed = time.monotonic() - self._last_reseed >= self.reseed_interval
+        revision = None
+        if reseed and self._remote_revision is not None:
+            # Read before downloading: anything newer moves it again
+            revision = self._remote_revision()
+            if revision is not None and revision == self._revision:
+                reseed = False
+                self._last_reseed = time.monotonic()
+
+        remote = self._remote_tokens()
+        busy = set(self._busy()) | set(self.store.unsynced_worksheets())
+        refreshed: List[str] = []
+        for worksheet, token in remote.items():
+            if not self._eligible(worksheet, busy) or self.store.sync_token(worksheet) == token:
+                continue
+            if self._download(worksheet, token):
+                refreshed.append(worksheet)
+
+        if reseed:
+            for worksheet in WORKSHEETS:
+                if worksheet in refreshed or not self._eligible(worksheet, busy):
+                    continue
+                if self._download(worksheet, remote.get(worksheet)):
+                    refreshed.append(worksheet)
+            self._revision = revision
+            self._last_reseed = time.monotonic()
+        return refreshed
+
+    def maybe_check(self) -> bool:
+        """Starts a background check if `interval` has passed and none is running; True if started."""
+        with self._lock:
+            now = time.monotonic()
+            if self._running or now - self._last_check < self.interval:
+                return False
+            self._running = True
+            self._last_check = now
+        threading.Thread(target=self._check, name="sheets-change-watcher", daemon=True).start()
+        return True
+
+    def _check(self) -> None:
+        try:
+            self.check()
+        except Exception:
+            pass  # Sheets unreachable: the next check tries again
+        finally:
+            with self._lock:
+                self._running = False
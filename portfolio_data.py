@@ -0,0 +1,247 @@
+"""
+Parsed, typed Portfolios data shared by every session of the process.
+
+The Portfolios worksheet used to be read, schema-repaired and cast once per
+browser session and kept in each session's state. `SharedFrame` keeps a
+single prepared copy per server process instead, tagged with the
+`LocalStore` version it was built from; every save bumps that version, so
+the next reader in any session rebuilds it once and everybody else reuses
+it. Sessions must treat the shared frame as read-only and copy before
+editing.
+
+`PortfolioModel` is a read-side index over the same data: portfolio-level
+settings, which the sheet repeats on every holding row, live once per
+portfolio in a dimension table, and the holdings fact table stores names as
+categoricals. Per user and per portfolio lookups are dictionary hits on
+precomputed row positions instead of boolean masks over the whole sheet.
+The shared frame stays the write model: saves edit a copy of it and upload
+the sheet layout, settings on every row, and the next read rebuilds the
+index once per process alongside it.
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PORTFOLIO_COLUMNS = [
+    'username', 'stock_name', 'current_value', 'target_allocation',
+    'portfolio_name', 'tolerance', 'expense_ratio', 'portfolio_monthly_invest',
+    'portfolio_use_indicators', 'portfolio_buffett_index',
+    'stock_full_name', 'sector', 'industry', 'country', 'currency',
+    'quantity', 'average_price', 'dividend_yield', 'portfolio_type',
+    'portfolio_birth_date', 'portfolio_uninvested_cash', 'current_price', 'investor_birth_date',
+    'portfolio_joint_hedge'
+]
+
+# Settings repeated on every holding row of a portfolio in the sheet layout
+PORTFOLIO_SETTINGS = [
+    'portfolio_type', 'portfolio_monthly_invest', 'portfolio_use_indicators',
+    'portfolio_buffett_index', 'portfolio_birth_date', 'portfolio_uninvested_cash',
+    'investor_birth_date', 'portfolio_joint_hedge',
+]
+
+PORTFOLIO_KEY = ['username', 'portfolio_name']
+
+CATEGORICAL_COLUMNS = ['username', 'portfolio_name', 'stock_name', 'sector', 'country', 'currency']
+
+# Value given to a column missing from the sheet ('' for any column not listed)
+COLUMN_DEFAULTS: Dict[str, Any] = {
+    'portfolio_monthly_invest': 1000.0,
+    'portfolio_use_indicators': False,
+    'portfolio_buffett_index': 195.0,
+    'portfolio_type': 'Other',
+    'portfolio_birth_date': '',
+    'portfolio_uninvested_cash': 0.0,
+    'investor_birth_date': '1992-01-01',  # Default starting point (34y approx)
+    'portfolio_joint_hedge': False,
+    'current_value': 0.0,
+    'target_allocation': 0.0,
+    'tolerance': 0.0,
+    'expense_ratio': 0.0,
+    'quantity': 0.0,
+    'average_price': 0.0,
+    'dividend_yield': 0.0,
+    'current_price': 0.0,
+}
+
+
+def prepare_portfolios(raw_data: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    The Portfolios worksheet as the app uses it.
+
+    Rules:
+    - Missing columns are added with their `COLUMN_DEFAULTS`.
+    - Names are strings, values and allocations floats, and the
+      `portfolio_joint_hedge` opt-in a bool (TRUE/FALSE on the sheet).
+    - Missing portfolio names become 'Default', missing users 'unknown',
+      and the legacy 'Unified' type is renamed 'Growth & Dividends'.
+    """
+
+    if raw_data is None or raw_data.empty:
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+
+    raw_data = raw_data.copy()
+    if 'portfolio_name' not in raw_data.columns:
+        raw_data['portfolio_name'] = 'Default'
+    for col in PORTFOLIO_COLUMNS:
+        if col not in raw_data.columns:
+            raw_data[col] = COLUMN_DEFAULTS.get(col, '')
+
+    raw_data = raw_data.astype({
+        'username': 'str',
+        'stock_name': 'str',
+        'current_value': 'float',
+        'target_allocation': 'float',
+        'expense_ratio': 'float',
+        'portfolio_name': 'str',
+        'current_price': 'float'
+    })
+    raw_data['portfolio_name'] = raw_data['portfolio_name'].fillna('Default')
+    raw_data['username'] = raw_data['username'].fillna('unknown')
+    raw_data['portfolio_type'] = raw_data['portfolio_type'].replace('Unified', 'Growth & Dividends')
+    raw_data['portfolio_joint_hedge'] = raw_data['portfolio_joint_hedge'].astype(str).str.strip().str.upper() == 'TRUE'
+    return raw_data
+
+
+class SharedFrame:
+    """
+    One prepared frame (or `PortfolioModel`) per process, rebuilt when its
+    source version changes.
+
+    `get(version, build)` returns the cached value if it was built for
+    `version`, otherwise calls `build()` once (concurrent callers wait for it)
+    and caches the result under `version`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._frame: Any = None
+        self.builds = 0
+
+    def get(self, version: int, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if self._frame is None or self._version != version:
+                self._frame = build()
+                self._version = version
+                self.builds += 1
+            return self._frame
+
+    def advance(self, from_version: int, to_version: int, apply: Callable[[Any], Any]) -> bool:
+        """
+        Replaces the cached value with `apply(value)`, a new value derived from
+        it (the old one may still be read by other sessions, so it must not be
+        changed), when it is at `from_version`, and tags it `to_version`;
+        False (next `get` rebuilds) otherwise.
+        """
+        with self._lock:
+            if self._frame is None or self._version != from_version:
+                return False
+            self._frame = apply(self._frame)
+            self._version = to_version
+            return True
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._frame = None
+            self._version = None
+
+
+class PortfolioModel:
+    """
+    Portfolios worksheet split into a portfolio dimension and a holdings fact
+    table, for lookups; it is derived from the sheet frame and never saved.
+
+    - `portfolios`: one row per (username, portfolio_name) with the
+      `PORTFOLIO_SETTINGS`, taken from the portfolio's first sheet row.
+    - `holdings`: one row per sheet row without the settings; the
+      `CATEGORICAL_COLUMNS` are categoricals and the index is the sheet
+      frame's index, so rows can be matched back to it.
+
+    `to_sheet()` rebuilds the sheet layout (columns in their original order);
+    a round trip is exact unless a portfolio's rows disagreed on a setting.
+    """
+
+    def __init__(self, portfolios: pd.DataFrame, holdings: pd.DataFrame, columns: List[str]):
+        self.portfolios = portfolios
+        self.holdings = holdings
+        self.columns = columns
+        self._by_portfolio: Dict[Tuple[str, str], np.ndarray] = {
+            (str(k[0]), str(k[1])): v
+            for k, v in holdings.groupby(PORTFOLIO_KEY, observed=True, sort=False).indices.items()
+        }
+        self._by_user: Dict[str, np.ndarray] = {
+            str(k): v for k, v in holdings.groupby('username', observed=True, sort=False).indices.items()
+        }
+        self._settings: Dict[Tuple[str, str], Dict[str, Any]] = {
+            key: dict(zip(PORTFOLIO_SETTINGS, row))
+            for key, row in zip(
+                portfolios.index,
+                portfolios[PORTFOLIO_SETTINGS].itertuples(index=False, name=None),
+            )
+        }
+
+    @classmethod
+    def from_sheet(cls, frame: pd.DataFrame) -> "PortfolioModel":
+        """Normalizes a `prepare_portfolios` frame."""
+        frame = frame if not frame.empty else pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+        columns = list(frame.columns)
+        for col in PORTFOLIO_KEY + PORTFOLIO_SETTINGS:
+            if col not in frame.columns:
+                frame = frame.assign(**{col: COLUMN_DEFAULTS.get(col, '')})
+
+        portfolios = (
+            frame.drop_duplicates(PORTFOLIO_KEY, keep='first')[PORTFOLIO_KEY + PORTFOLIO_SETTINGS]
+            .astype({'username': 'str', 'portfolio_name': 'str'})
+            .set_index(PORTFOLIO_KEY)
+        )
+        holdings = frame.drop(columns=PORTFOLIO_SETTINGS)
+        holdings = holdings.astype({
+            col: 'category' for col in CATEGORICAL_COLUMNS if col in holdings.columns
+        })
+        return cls(portfolios, holdings, columns)
+
+    def to_sheet(self, username: Optional[str] = None, portfolio_name: Optional[str] = None) -> pd.DataFrame:
+        """
+        Sheet layout of all rows, of one user's rows or of one portfolio's rows
+        (in sheet order, with the sheet frame's index).
+        """
+
+        if portfolio_name is not None:
+            positions = self._by_portfolio.get((username, portfolio_name), np.empty(0, dtype=int))
+        elif username is not None:
+            positions = self._by_user.get(username, np.empty(0, dtype=int))
+        else:
+            positions = np.arange(len(self.holdings))
+
+        rows = self.holdings.iloc[np.sort(positions)]
+        rows = rows.astype({col: 'object' for col in CATEGORICAL_COLUMNS if col in rows.columns})
+        settings = self.portfolios.reindex(pd.MultiIndex.from_frame(rows[PORTFOLIO_KEY]))
+        for col in PORTFOLIO_SETTINGS:
+            rows[col] = settings[col].to_numpy()
+        return rows[[c for c in self.columns if c in rows.columns]]
+
+    def settings(self, username: str, portfolio_name: str) -> Dict[str, Any]:
+        """A portfolio's settings ({} if it does not exist)."""
+        return dict(self._settings.get((username, portfolio_name), {}))
+
+    def portfolio_type(self, username: str, portfolio_name: str, default: Optional[str] = None) -> Optional[str]:
+        return self._settings.get((username, portfolio_name), {}).get('portfolio_type', default)
+
+    def portfolio_names(self, username: str) -> List[str]:
+        """The user's portfolios, sorted by name."""
+        return sorted(name for user, name in self._by_portfolio if user == username)
+
+    def holdings_of(self, username: str, portfolio_name: Optional[str] = None) -> pd.DataFrame:
+        """Fact rows of one user, or of one of their portfolios (categoricals kept)."""
+        if portfolio_name is None:
+            positions = self._by_user.get(username, np.empty(0, dtype=int))
+        else:
+            positions = self._by_portfolio.get((username, portfolio_name), np.empty(0, dtype=int))
+        return self.holdings.iloc[np.sort(positions)]
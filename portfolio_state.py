@@ -0,0 +1,254 @@
+"""
+Per-portfolio session state, precomputed for every portfolio of a user.
+
+Selecting a portfolio used to rebuild its holdings list (`stocks`) and its
+widget values from the Portfolios rows on the spot. `PortfolioStates` builds
+them for all of a user's portfolios right after login in a thread pool and
+keeps them per data version, so switching portfolios only copies a ready
+result. The builders are pure functions of the `PortfolioModel`: they never
+touch Streamlit's session state, which is only written by the caller.
+"""
+
+import csv
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from allocation_engine import TOLERANCE_PP
+from portfolio_data import PortfolioModel
+
+STATE_WORKERS = 4
+
+# Legacy ticker -> current ticker, one row per alias (see `load_ticker_aliases`)
+TICKER_ALIASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ticker_aliases.csv")
+
+# Holding fields taken from the first row of the merged tickers ('' / default if absent)
+_FIRST_ROW_FIELDS = {
+    "full_name": "stock_full_name",
+    "sector": "sector",
+    "industry": "industry",
+    "country": "country",
+    "currency": "currency",
+}
+
+
+@lru_cache(maxsize=None)
+def load_ticker_aliases(path: str = TICKER_ALIASES_PATH) -> Dict[str, str]:
+    """{alias: ticker} from the alias registry CSV (alias, ticker, note columns)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["alias"].strip(): row["ticker"].strip() for row in csv.DictReader(f) if row.get("alias")}
+
+
+def aggregate_holdings(rows: pd.DataFrame, aliases: Mapping[str, str]) -> List[Dict[str, Any]]:
+    """
+    Merges rows of the same ticker after mapping `aliases` onto current tickers.
+
+    Rules (one holding per ticker, in order of first appearance):
+    - current_value and quantity are summed; target_allocation starts at 0.
+    - expense_ratio and current_price come from the first row, or from the
+      first row with a positive value when the first is 0.
+    - Names, sector, country, currency, average_price and dividend_yield
+      come from the first row.
+    """
+
+    if rows.empty:
+        return []
+
+    key = rows['stock_name'].astype(str)
+    key = key.map(lambda name: aliases.get(name, name)) if aliases else key
+
+    def column(name: str) -> pd.Series:
+        return rows[name].astype(float) if name in rows.columns else pd.Series(0.0, index=rows.index)
+
+    values = pd.DataFrame({
+        "current_value": column('current_value'),
+        "quantity": column('quantity'),
+        "expense_ratio": column('expense_ratio'),
+        "current_price": column('current_price'),
+    })
+    # 'first' skips NaN: over the positive values only it finds the first positive one
+    values["expense_ratio_positive"] = values["expense_ratio"].where(values["expense_ratio"] > 0)
+    values["current_price_positive"] = values["current_price"].where(values["current_price"] > 0)
+    # A NaN member keeps the sum NaN, as when adding the floats one by one
+    values["current_value_nan"] = values["current_value"].isna()
+    values["quantity_nan"] = values["quantity"].isna()
+
+    totals = values.groupby(key.to_numpy(), sort=False).agg(
+        current_value=("current_value", "sum"),
+        quantity=("quantity", "sum"),
+        current_value_nan=("current_value_nan", "any"),
+        quantity_nan=("quantity_nan", "any"),
+        expense_ratio_positive=("expense_ratio_positive", "first"),
+        current_price_positive=("current_price_positive", "first"),
+    )
+    first = ~key.duplicated().to_numpy()
+    first_rows = rows.loc[first]
+    first_values = values.loc[first]
+    names = totals.index.to_numpy()
+
+    def first_nonzero(field: str) -> np.ndarray:
+        value = first_values[field].to_numpy()
+        return np.where(value != 0.0, value, totals[f"{field}_positive"].fillna(0.0).to_numpy())
+
+    merged = pd.DataFrame({
+        "name": names,
+        "current_value": totals["current_value"].where(~totals["current_value_nan"]).to_numpy(),
+        "target_allocation": 0.0,
+        "tolerance": [TOLERANCE_PP.get(name, 2.0) for name in names],
+        "expense_ratio": first_nonzero("expense_ratio"),
+    })
+    for field, source in _FIRST_ROW_FIELDS.items():
+        default = 'EUR' if field == 'currency' else ''
+        merged[field] = first_rows[source].to_numpy() if source in rows.columns else (names if field == 'full_name' else default)
+    merged["quantity"] = totals["quantity"].where(~totals["quantity_nan"]).to_numpy()
+    merged["average_price"] = column('average_price').loc[first].to_numpy()
+    merged["current_price"] = first_nonzero("current_price")
+    merged["dividend_yield"] = column('dividend_yield').loc[first].to_numpy()
+    return merged.to_dict('records')
+
+
+def build_stocks(user_portfolio_df: pd.DataFrame, p_type: str) -> List[Dict[str, Any]]:
+    """
+    Holdings list of one portfolio as the UI edits it.
+
+    Growth & Dividends portfolios merge legacy tickers into their current
+    ones and always list the 9 target assets.
+    """
+
+    current_stocks = []
+    if p_type == "Growth & Dividends":
+        # Map legacy tickers and aggregate duplicate holdings (e.g. from historical merges)
+        current_stocks = aggregate_holdings(user_portfolio_df, load_ticker_aliases())
+        
+        # Ensure all 9 target assets are present in the list
+        required_tickers = ["SPYL.DE", "IXUA.DE", "VFEA.DE", "WTEQ.DE", "VDIV.DE", "JMT.PT", "EDP.PT", "EGLN.UK", "YCSH.DE"]
+        existing_tickers = [s["name"] for s in current_stocks]
+        for ticker in required_tickers:
+            if ticker not in existing_tickers:
+                current_stocks.append({
+                    "name": ticker,
+                    "current_value": 0.0,
+                    "target_allocation": 0.0,
+                    "tolerance": TOLERANCE_PP.get(ticker, 2.0),
+                    "expense_ratio": 0.0,
+                    "full_name": ticker,
+                    "sector": "",
+                    "industry": "",
+                    "country": "",
+                    "currency": "EUR",
+                    "quantity": 0.0,
+                    "average_price": 0.0,
+                    "current_price": 0.0,
+                    "dividend_yield": 0.0
+                })
+    else:
+        for _, row in user_portfolio_df.iterrows():
+            current_stocks.append({
+                "name": row['stock_name'],
+                "current_value": row['current_value'],
+                "target_allocation": row['target_allocation'],
+                "tolerance": row.get('tolerance', 0.0),
+                "expense_ratio": row.get('expense_ratio', 0.0),
+                "full_name": row.get('stock_full_name', ''),
+                "sector": row.get('sector', ''),
+                "industry": row.get('industry', ''),
+                "country": row.get('country', ''),
+                "currency": row.get('currency', ''),
+                "quantity": float(row.get('quantity', 0.0)),
+                "average_price": float(row.get('average_price', 0.0)),
+                "current_price": float(row.get('current_price', 0.0)),
+                "dividend_yield": float(row.get('dividend_yield', 0.0))
+            })
+    return current_stocks
+
+
+def build_portfolio_state(model: PortfolioModel, username: str, portfolio_name: str) -> Dict[str, Any]:
+    """
+    Everything selecting `portfolio_name` puts into the session.
+
+    Returns:
+    - p_type: the portfolio type
+    - stocks: holdings list (see `build_stocks`)
+    - widgets: {session key: value} for the portfolio's settings and per-stock inputs
+    """
+
+    p_type = model.portfolio_type(username, portfolio_name, "Growth & Dividends")
+    user_portfolio_df = model.to_sheet(username, portfolio_name)
+    user_portfolio_df = user_portfolio_df[user_portfolio_df['stock_name'] != "__PLACEHOLDER__"] if not user_portfolio_df.empty else pd.DataFrame()
+    if not user_portfolio_df.empty:
+        user_portfolio_df = user_portfolio_df.sort_values(by='target_allocation', ascending=False)
+
+    stocks = build_stocks(user_portfolio_df, p_type)
+
+    widgets: Dict[str, Any] = {}
+    if not user_portfolio_df.empty:
+        first_row = model.settings(username, portfolio_name)
+        # Note: We use fixed keys for portfolio-level settings
+        widgets[f"{portfolio_name}_monthly_invest"] = float(first_row.get('portfolio_monthly_invest', 1000.0))
+        widgets[f"{portfolio_name}_use_indicators"] = bool(first_row.get('portfolio_use_indicators', False))
+        widgets[f"{portfolio_name}_buffett_index"] = float(first_row.get('portfolio_buffett_index', 195.0))
+        widgets[f"{portfolio_name}_birth_date"] = first_row.get('portfolio_birth_date', '')
+        try:
+            widgets[f"{portfolio_name}_uninvested_cash"] = float(first_row.get('portfolio_uninvested_cash', 0.0))
+        except (ValueError, TypeError):
+            widgets[f"{portfolio_name}_uninvested_cash"] = 0.0
+        widgets[f"{portfolio_name}_investor_birth_date"] = first_row.get('investor_birth_date', '1992-01-01')
+
+    for idx, stock in enumerate(stocks):
+        key_prefix = f"{portfolio_name}_{idx}"
+        widgets[f"{key_prefix}_name"] = stock['name']
+        widgets[f"{key_prefix}_value"] = float(stock['current_value'])
+        widgets[f"{key_prefix}_target"] = float(stock['target_allocation'])
+        widgets[f"{key_prefix}_tolerance"] = float(stock.get('tolerance', 0.0))
+
+    return {"p_type": p_type, "stocks": stocks, "widgets": widgets}
+
+
+class PortfolioStates:
+    """
+    Portfolio states per (username, data version), built in a thread pool.
+
+    `prefetch` queues every portfolio of a user and returns immediately;
+    `get` returns a copy of one state, waiting for its build if it is still
+    running or building it inline if it was never queued. States of older
+    versions are dropped when a newer one is prefetched.
+    """
+
+    def __init__(self, workers: int = STATE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="portfolio-state")
+        self._lock = threading.Lock()
+        self._states: Dict[Tuple[str, int], Dict[str, Future]] = {}
+
+    def prefetch(self, model: PortfolioModel, username: str, version: int) -> int:
+        """Queues the states of all the user's portfolios; returns how many were queued."""
+        queued = 0
+        with self._lock:
+            for key in [k for k in self._states if k[0] == username and k[1] != version]:
+                del self._states[key]
+            states = self._states.setdefault((username, version), {})
+            for portfolio_name in model.portfolio_names(username):
+                if portfolio_name not in states:
+                    states[portfolio_name] = self._pool.submit(build_portfolio_state, model, username, portfolio_name)
+                    queued += 1
+        return queued
+
+    def get(self, model: PortfolioModel, username: str, portfolio_name: str, version: int) -> Dict[str, Any]:
+        """The state of one portfolio (a copy the session may edit)."""
+        with self._lock:
+            future: Optional[Future] = self._states.get((username, version), {}).get(portfolio_name)
+        state = future.result() if future is not None else build_portfolio_state(model, username, portfolio_name)
+        if future is None:
+            done: Future = Future()
+            done.set_result(state)
+            with self._lock:
+                self._states.setdefault((username, version), {})[portfolio_name] = done
+        return {
+            "p_type": state["p_type"],
+            "stocks": [dict(stock) for stock in state["stocks"]],
+            "widgets": dict(state["widgets"]),
+        }
@@ -0,0 +1,112 @@
+"""
+Sensitivity surface of the Growth & Dividends buy plan.
+
+Evaluates `calculate_growth_dividends_buys` over a Buffett x age x
+contribution grid for one holdings snapshot. Targets only change with the
+lifecycle phase and the SPYL level, so the grid collapses to at most
+7 phases x 21 levels per contribution; those scenarios run in one
+vectorized call and are broadcast back to the full grid. Results are
+memoized per (holdings, grid) so moving a slider only indexes the cache.
+"""
+
+from functools import lru_cache
+from typing import Dict, Any, Sequence, Tuple
+
+import numpy as np
+
+from vectorized_engine import (
+    ASSETS,
+    calculate_growth_dividends_buys_vectorized,
+    lifecycle_band,
+    spyl_level,
+)
+
+BUFFETT_RANGE = (80.0, 260.0, 1.0)
+AGE_RANGE = (30, 70)
+SENSITIVITY_CACHE_SIZE = 32
+
+
+def _grid_axis(start: float, stop: float, step: float) -> np.ndarray:
+    return np.arange(start, stop + step / 2.0, step)
+
+
+@lru_cache(maxsize=SENSITIVITY_CACHE_SIZE)
+def _cached_surface(
+    holdings: Tuple[float, ...],
+    contributions: Tuple[float, ...],
+    buffett_range: Tuple[float, float, float],
+    age_range: Tuple[int, int],
+    min_order_size: float,
+) -> Dict[str, Any]:
+    buffett = _grid_axis(*buffett_range)
+    ages = np.arange(age_range[0], age_range[1] + 1)
+    levels = spyl_level(buffett)
+    bands = lifecycle_band(ages)
+
+    # One scenario per distinct (phase, SPYL level, contribution)
+    unique_levels, level_index = np.unique(levels, return_inverse=True)
+    unique_bands, band_index = np.unique(bands, return_inverse=True)
+    # A representative age and Buffett value for each distinct phase / level
+    band_ages = ages[np.searchsorted(bands, unique_bands)]
+    level_buffett = np.array([buffett[levels == level][0] for level in unique_levels])
+
+    n_contrib, n_bands, n_levels = len(contributions), len(unique_bands), len(unique_levels)
+    scenario_contrib = np.repeat(np.asarray(contributions, dtype=float), n_bands * n_levels)
+    scenario_ages = np.tile(np.repeat(band_ages, n_levels), n_contrib)
+    scenario_buffett = np.tile(level_buffett, n_contrib * n_bands)
+    values = np.tile(np.asarray(holdings, dtype=float), (len(scenario_contrib), 1))
+
+    plan = calculate_growth_dividends_buys_vectorized(
+        scenario_ages, scenario_buffett, values, scenario_contrib,
+        min_order_size=min_order_size, cap_defensive=True,
+    )
+
+    shape = (n_contrib, n_bands, n_levels)
+    buys = plan["buys"].reshape(shape + (len(ASSETS),))
+    leftover = plan["leftover_cash"].reshape(shape)
+    infeasible = plan["infeasible"].reshape(shape)
+
+    # Broadcast (contribution, phase, level) back to (contribution, age, buffett)
+    take = (slice(None), band_index[:, None], level_index[None, :])
+    buys = np.where(infeasible[take][..., None], np.nan, buys[take])
+    leftover = np.where(infeasible[take], np.nan, leftover[take])
+
+    for array in (buys, leftover):
+        array.setflags(write=False)
+    return {
+        "buffett": buffett,
+        "ages": ages,
+        "contributions": list(contributions),
+        "assets": list(ASSETS),
+        "buys": buys,
+        "leftover_cash": leftover,
+        "scenarios": len(scenario_contrib),
+    }
+
+
+def buy_surface(
+    current_values: Dict[str, float],
+    contributions: Sequence[float],
+    buffett_range: Tuple[float, float, float] = BUFFETT_RANGE,
+    age_range: Tuple[int, int] = AGE_RANGE,
+    min_order_size: float = 5.0,
+) -> Dict[str, Any]:
+    """
+    Buy plans over the full Buffett x age x contribution grid.
+
+    Returns the grid axes, `buys` as a (contributions x ages x buffett x 9)
+    array in `assets` order and `leftover_cash` as (contributions x ages x
+    buffett). Cells where the defensive transition alone would use up the
+    contribution (the Action Center rejects those) are NaN. The arrays are
+    shared between callers and read-only.
+    """
+
+    holdings = tuple(round(float(current_values.get(asset, 0.0) or 0.0), 2) for asset in ASSETS)
+    contributions = tuple(round(float(c), 2) for c in contributions)
+    return _cached_surface(
+        holdings,
+        contributions,
+        tuple(float(x) for x in buffett_range),
+        (int(age_range[0]), int(age_range[1])),
+        float(min_order_size),
+    )
@@ -0,0 +1,399 @@
+"""
+Row-level delta sync for Google Sheets worksheets.
+
+Instead of rewriting a whole worksheet on every save, the last uploaded
+snapshot is compared with the new frame by a stable row key (for Portfolios
+`(username, portfolio_name, stock_name)`), and only the changed cells, the
+deleted rows and the inserted rows are sent: one batched range update, one
+delete per run of adjacent rows and one append. Payload and API time scale
+with the size of the change, not with the size of the sheet. A delta is
+positional, so it is only sent while the sheet is still the snapshot: if
+another process uploaded the worksheet or the spreadsheet was edited since
+this process last wrote it, the upload is a full rewrite instead.
+
+`ChangeTokens` keeps one random token per worksheet in its own row of a tiny
+`_versions` worksheet, replaced after every upload. Checking whether a worksheet changed
+since this process last saw it is then one small read instead of a full
+download of the worksheet.
+"""
+
+import math
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ROW_KEYS = {
+    "Portfolios": ("username", "portfolio_name", "stock_name"),
+    "Dividends": ("username", "portfolio_name", "ticker", "date"),
+    "InvestmentLog": ("timestamp", "username", "portfolio_name", "Stock"),
+}
+
+# Above this share of changed rows a full rewrite is cheaper
+FULL_REWRITE_RATIO = 0.5
+
+# Sheet row of the first data row (row 1 is the header)
+FIRST_DATA_ROW = 2
+
+# Marker worksheet holding the change token of every worksheet, one row each
+VERSION_SHEET = "_versions"
+VERSION_COLUMNS = ("worksheet", "token", "updated_at")
+
+
+def cell_value(value: Any) -> Any:
+    """A pandas cell as the JSON value written to the sheet ('' for missing)."""
+    if value is None:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return "" if math.isnan(value) else float(value)
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return "" if pd.isna(value) else str(value)
+    if value is pd.NaT or value is pd.NA:
+        return ""
+    return value
+
+
+def worksheet_missing(error: BaseException) -> bool:
+    """
+    True when a call failed because the worksheet does not exist yet
+    (gspread's `WorksheetNotFound`, or a missing file of `LocalSheetsConnection`)
+    rather than because Google Sheets could not be reached.
+    """
+
+    return isinstance(error, FileNotFoundError) or any(
+        cls.__name__ == "WorksheetNotFound" for cls in type(error).__mro__
+    )
+
+
+def column_letter(col: int) -> str:
+    """1-based column index to its A1 letters."""
+    letters = ""
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _keyed(frame: pd.DataFrame, key: Sequence[str]) -> pd.Series:
+    """Row keys as tuples, with an occurrence counter so duplicate keys stay distinct."""
+    parts = frame[list(key)].astype(str)
+    occurrence = parts.groupby(list(key), sort=False).cumcount()
+    return pd.Series(list(zip(*[parts[c] for c in key], occurrence)), index=frame.index)
+
+
+def _rows(frame: pd.DataFrame) -> List[List[Any]]:
+    return [[cell_value(v) for v in row] for row in frame.itertuples(index=False, name=None)]
+
+
+def diff_frames(before: pd.DataFrame, after: pd.DataFrame, key: Sequence[str]) -> Dict[str, Any]:
+    """
+    Changes turning `before` (as on the sheet) into `after`.
+
+    Returns:
+    - updates: [(position in `before`, {column position: new value})]
+    - deletes: positions in `before` to remove
+    - inserts: rows of `after` (cell values) to append
+    - changed_rows: how many rows the delta touches
+    """
+
+    before = before.reset_index(drop=True)
+    after = after.reset_index(drop=True)[list(before.columns)]
+    before_keys = _keyed(before, key)
+    after_keys = _keyed(after, key)
+    after_position = {k: i for i, k in enumerate(after_keys)}
+
+    before_rows = _rows(before)
+    after_rows = _rows(after)
+
+    updates: List[Tuple[int, Dict[int, Any]]] = []
+    deletes: List[int] = []
+    for position, k in enumerate(before_keys):
+        match = after_position.pop(k, None)
+        if match is None:
+            deletes.append(position)
+            continue
+        old, new = before_rows[position], after_rows[match]
+        changed = {c: new[c] for c in range(len(new)) if old[c] != new[c]}
+        if changed:
+            updates.append((position, changed))
+
+    inserts = [after_rows[i] for i in sorted(after_position.values())]
+    return {
+        "updates": updates,
+        "deletes": deletes,
+        "inserts": inserts,
+        "changed_rows": len(updates) + len(deletes) + len(inserts),
+    }
+
+
+def _runs(positions: Sequence[int]) -> List[Tuple[int, int]]:
+    """Adjacent positions grouped into (first, last) runs."""
+    runs: List[Tuple[int, int]] = []
+    for p in sorted(positions):
+        if runs and p == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], p)
+        else:
+            runs.append((p, p))
+    return runs
+
+
+def apply_delta(worksheet: Any, delta: Dict[str, Any]) -> int:
+    """
+    Sends a `diff_frames` delta to a gspread-style worksheet; returns the
+    number of API calls. Order matters: updates use the old positions,
+    deletes go bottom-up, inserts are appended last.
+    """
+
+    calls = 0
+    if delta["updates"]:
+        ranges = []
+        for position, changed in delta["updates"]:
+            row = FIRST_DATA_ROW + position
+            cols = sorted(changed)
+            # One range per run of adjacent changed cells in the row
+            for first, last in _runs(cols):
+                ranges.append({
+                    "range": f"{column_letter(first + 1)}{row}:{column_letter(last + 1)}{row}",
+                    "values": [[changed[c] for c in range(first, last + 1)]],
+                })
+        worksheet.batch_update(ranges, value_input_option="USER_ENTERED")
+        calls += 1
+
+    for first, last in reversed(_runs(delta["deletes"])):
+        worksheet.delete_rows(FIRST_DATA_ROW + first, FIRST_DATA_ROW + last)
+        calls += 1
+
+    if delta["inserts"]:
+        worksheet.append_rows(delta["inserts"], value_input_option="USER_ENTERED")
+        calls += 1
+    return calls
+
+
+def sheet_order(before: pd.DataFrame, after: pd.DataFrame, key: Sequence[str]) -> pd.DataFrame:
+    """`after` in the row order the sheet has once a delta is applied."""
+    before = before.reset_index(drop=True)
+    after = after.reset_index(drop=True)
+    after_keys = _keyed(after, key)
+    rank = {k: i for i, k in enumerate(_keyed(before, key))}
+    # Kept rows stay in their old order, inserted rows follow in `after` order
+    order = sorted(range(len(after)), key=lambda i: (rank.get(after_keys[i], len(rank)), i))
+    return after.iloc[order].reset_index(drop=True)
+
+
+class DeltaSync:
+    """
+    Upload function for `SheetsReplicator` that sends row-level deltas.
+
+    `rewrite(worksheet, data)` replaces a whole worksheet (e.g. `conn.update`),
+    `create(worksheet, data)` (e.g. `conn.create`) adds one the sheet does
+    not have yet, and `open_worksheet(name)` returns the gspread worksheet (e.g.
+    `spreadsheet.worksheet`); each handle is opened once and reused until a
+    call through it fails. The first upload of each worksheet, a change of
+    columns, a large delta or a failure mid-delta falls back to a full
+    rewrite, after which the uploaded frame is the snapshot the next delta
+    is computed from. `append` adds
+    rows to the end of append-only worksheets and to their snapshot.
+
+    With `remote_token(worksheet)` (the worksheet's `ChangeTokens` token) and
+    `remote_revision()` (the spreadsheet's last modification time), a delta
+    is only sent when both still equal what `mark` recorded after this
+    process's last upload; otherwise the sheet may have moved under the
+    snapshot and the worksheet is rewritten. A token that moved decides on
+    its own; the revision is only asked for when the token still matches.
+    """
+
+    def __init__(
+        self,
+        rewrite: Callable[..., Any],
+        open_worksheet: Callable[[str], Any],
+        remote_token: Optional[Callable[[str], Optional[str]]] = None,
+        remote_revision: Optional[Callable[[], Optional[str]]] = None,
+        create: Optional[Callable[..., Any]] = None,
+    ):
+        self._rewrite = rewrite
+        self._create = create
+        self._open = open_worksheet
+        self._remote_token = remote_token
+        self._remote_revision = remote_revision
+        self._snapshots: Dict[str, pd.DataFrame] = {}
+        self._handles: Dict[str, Any] = {}
+        self._tokens: Dict[str, Optional[str]] = {}
+        self._revision: Optional[str] = None
+        self.api_calls = 0
+        self.rows_sent = 0
+        self.stale_rewrites = 0
+
+    def __call__(self, worksheet: str, data: pd.DataFrame) -> None:
+        key = ROW_KEYS.get(worksheet)
+        before = self._snapshots.pop(worksheet, None)
+
+        delta: Optional[Dict[str, Any]] = None
+        if (
+            key is not None and before is not None
+            and list(before.columns) == list(data.columns)
+            and set(key) <= set(data.columns)
+        ):
+            delta = diff_frames(before, data, key)
+            if delta["changed_rows"] > FULL_REWRITE_RATIO * max(len(before), len(data), 1):
+                delta = None
+            elif delta["changed_rows"] and not self._unchanged_since_mark(worksheet):
+                self.stale_rewrites += 1
+                delta = None
+
+        if delta is None:
+            self._replace(worksheet, data)
+            self.api_calls += 1
+            self.rows_sent += len(data)
+            self._snapshots[worksheet] = data.reset_index(drop=True).copy()
+            return
+
+        if delta["changed_rows"]:
+            try:
+                self.api_calls += apply_delta(self._worksheet(worksheet), delta)
+            except Exception:
+                self._handles.pop(worksheet, None)
+                raise
+            self.rows_sent += delta["changed_rows"]
+        self._snapshots[worksheet] = sheet_order(before, data, key).copy()
+
+    def _replace(self, worksheet: str, data: pd.DataFrame) -> None:
+        """Rewrites the whole worksheet, creating it when the sheet does not have it."""
+        try:
+            self._rewrite(worksheet=worksheet, data=data)
+        except Exception as e:
+            if self._create is None or not worksheet_missing(e):
+                raise
+            self._create(worksheet=worksheet, data=data)
+
+    def _worksheet(self, worksheet: str) -> Any:
+        """The cached worksheet handle, opened on first use."""
+        handle = self._handles.get(worksheet)
+        if handle is None:
+            handle = self._handles[worksheet] = self._open(worksheet)
+        return handle
+
+    def _unchanged_since_mark(self, worksheet: str) -> bool:
+        """Whether the sheet still holds this process's last upload (True when nothing can tell)."""
+        try:
+            if self._remote_token is not None and self._remote_token(worksheet) != self._tokens.get(worksheet):
+                return False
+            # Same token: only a hand edit can have moved the sheet, which the revision shows
+            if self._remote_revision is not None and self._remote_revision() != self._revision:
+                return False
+        except Exception:
+            return False
+        return True
+
+    def mark(self, worksheet: str, token: Optional[str] = None) -> None:
+        """
+        Records the sheet's state after this process uploaded `worksheet` and
+        published `token` for it; the next delta is checked against it.
+        """
+        self._tokens[worksheet] = token
+        if self._remote_revision is not None:
+            try:
+                self._revision = self._remote_revision()
+            except Exception:
+                self._revision = None
+
+    def forget(self, worksheet: str) -> None:
+        """Drops the snapshot after the sheet changed elsewhere; the next upload is a full rewrite."""
+        self._snapshots.pop(worksheet, None)
+
+    def append(self, worksheet: str, rows: pd.DataFrame) -> None:
+        """Appends rows (already in the sheet's column order) with one call."""
+        try:
+            self._worksheet(worksheet).append_rows(_rows(rows), value_input_option="USER_ENTERED")
+        except Exception:
+            self._handles.pop(worksheet, None)
+            raise
+        self.api_calls += 1
+        self.rows_sent += len(rows)
+        before = self._snapshots.get(worksheet)
+        if before is not None:
+            self._snapshots[worksheet] = pd.concat([before, rows[list(before.columns)]], ignore_index=True)
+
+
+class ChangeTokens:
+    """
+    Change tokens of the worksheets, kept in the `VERSION_SHEET` marker worksheet.
+
+    `read` and `create` are the connection's methods (e.g. `conn.read`,
+    `conn.create`) and `open_worksheet(name)` returns the gspread worksheet.
+    The marker worksheet holds one row per worksheet, and publishing a token
+    writes only that row, so processes uploading different worksheets at the
+    same time cannot overwrite each other's token. A token is an opaque
+    random string: equal tokens mean the worksheet has not been uploaded
+    since, whichever process uploaded it.
+    """
+
+    def __init__(
+        self,
+        read: Callable[..., Any],
+        open_worksheet: Callable[[str], Any],
+        create: Optional[Callable[..., Any]] = None,
+    ):
+        self._read = read
+        self._open = open_worksheet
+        self._create = create
+        self._handle: Any = None
+
+    def _markers(self) -> Optional[pd.DataFrame]:
+        """The marker rows as on the sheet (None if the marker worksheet is missing or unreadable)."""
+        try:
+            markers = self._read(worksheet=VERSION_SHEET, ttl=0)
+        except Exception:
+            return None
+        if markers is None or not {"worksheet", "token"} <= set(markers.columns):
+            return None
+        return markers.reset_index(drop=True)
+
+    def remote(self) -> Dict[str, str]:
+        """{worksheet: token} as on the sheet ({} if the marker worksheet is missing)."""
+        markers = self._markers()
+        if markers is None or markers.empty:
+            return {}
+        markers = markers.dropna(subset=["worksheet", "token"])
+        return dict(zip(markers["worksheet"].astype(str), markers["token"].astype(str)))
+
+    def publish(self, worksheet: str) -> str:
+        """Gives `worksheet` a new token after an upload; returns it."""
+        token = uuid.uuid4().hex
+        row = [worksheet, token, datetime.now().isoformat(timespec="seconds")]
+        try:
+            if self._handle is None:
+                self._handle = self._open(VERSION_SHEET)
+        except Exception as e:
+            if self._create is None or not worksheet_missing(e):
+                raise
+            self._create(worksheet=VERSION_SHEET, data=pd.DataFrame([row], columns=list(VERSION_COLUMNS)))
+            return token
+
+        markers = self._markers()
+        try:
+            if markers is None:
+                # Marker worksheet without a header yet
+                self._handle.append_rows([list(VERSION_COLUMNS), row], value_input_option="RAW")
+                return token
+            positions = markers.index[markers["worksheet"].astype(str) == worksheet]
+            if len(positions):
+                # Rows are only ever appended, so the positions read above still hold
+                self._handle.batch_update([
+                    {
+                        "range": f"A{FIRST_DATA_ROW + p}:{column_letter(len(row))}{FIRST_DATA_ROW + p}",
+                        "values": [row],
+                    }
+                    for p in positions
+                ], value_input_option="RAW")
+            else:
+                self._handle.append_rows([row], value_input_option="RAW")
+        except Exception:
+            self._handle = None
+            raise
+        return token
@@ -0,0 +1,216 @@
+"""
+Monte Carlo accumulation simulator for Growth & Dividends portfolios.
+
+Every simulated month applies the real contribution logic (defensive
+transition first, then `calculate_monthly_buys`) to the simulated holdings,
+with lifecycle targets following the investor's age. Paths are simulated
+together as arrays and split into chunks that run across a process pool;
+percentile bands are streamed back as chunks finish.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Dict, Any, Iterator, Optional
+
+import numpy as np
+
+from allocation_engine import base_investment_for_month
+from glide_path import DateLike, ages_on
+from vectorized_engine import (
+    ASSETS,
+    calculate_growth_dividends_buys_vectorized,
+)
+
+# Illustrative long-run assumptions (annual expected return, annual volatility)
+DEFAULT_ASSET_RETURNS = {
+    "SPYL.DE": (0.07, 0.16),
+    "IXUA.DE": (0.08, 0.20),
+    "VFEA.DE": (0.06, 0.21),
+    "WTEQ.DE": (0.065, 0.15),
+    "VDIV.DE": (0.06, 0.14),
+    "JMT.PT": (0.05, 0.22),
+    "EDP.PT": (0.05, 0.20),
+    "EGLN.UK": (0.03, 0.15),
+    "YCSH.DE": (0.02, 0.01),
+}
+
+# Equities share one market factor, gold and short bonds are nearly independent
+EQUITY_CORRELATION = 0.75
+
+PERCENTILES = (5, 50, 95)
+
+
+def contribution_schedule(months: int, start: Optional[date] = None, extra_monthly: float = 0.0) -> np.ndarray:
+    """Growth & Dividends base contributions for `months` consecutive months from `start`."""
+    start = start or date.today()
+    schedule = np.empty(months)
+    for m in range(months):
+        month_index = start.month - 1 + m
+        schedule[m] = base_investment_for_month("Growth & Dividends", month_index % 12 + 1, start.year + month_index // 12)
+    return schedule + extra_monthly
+
+
+def month_dates(months: int, start: Optional[date] = None) -> np.ndarray:
+    """The same day of the month in `months` consecutive months from `start` (clipped to month end)."""
+    start = np.datetime64(start or date.today(), "D")
+    first = start.astype("datetime64[M]") + np.arange(months)
+    days = first.astype("datetime64[D]") + (start - start.astype("datetime64[M]"))
+    return np.minimum(days, (first + 1).astype("datetime64[D]") - 1)
+
+
+def _correlation_matrix() -> np.ndarray:
+    equity = np.array([asset not in ("EGLN.UK", "YCSH.DE") for asset in ASSETS])
+    corr = np.where(equity[:, None] & equity[None, :], EQUITY_CORRELATION, 0.0)
+    np.fill_diagonal(corr, 1.0)
+    return corr
+
+
+def simulate_paths(
+    n_paths: int,
+    birth_date: DateLike,
+    buffett_index: float,
+    current_values: Dict[str, float],
+    contributions: np.ndarray,
+    asset_returns: Optional[Dict[str, tuple]] = None,
+    min_order_size: float = 5.0,
+    seed=None,
+    glide: str = "step",
+    start: Optional[date] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Simulates `n_paths` paths over `len(contributions)` months.
+
+    Each month the contribution plus any cash left over is invested with the
+    Growth & Dividends rules, then holdings grow by one month of correlated
+    log-normal returns. Month m falls m months after `start` (default
+    today); the investor's age on it comes from `ages_on`. With
+    `glide="step"` targets change on birthdays; "linear" and "smooth" glide
+    them month by month. Returns (paths x months) float32 arrays:
+    - wealth: holdings plus uninvested cash at month end
+    - drift: largest absolute deviation from target weight, in pp
+    - cash: uninvested cash carried to the next month
+    """
+
+    asset_returns = asset_returns or DEFAULT_ASSET_RETURNS
+    months = len(contributions)
+    rng = np.random.default_rng(seed)
+    ages = ages_on(birth_date, month_dates(months, start))
+    if glide == "step":
+        ages = np.floor(ages)
+
+    mu = np.array([asset_returns[a][0] for a in ASSETS])
+    sigma = np.array([asset_returns[a][1] for a in ASSETS])
+    monthly_sigma = sigma / np.sqrt(12.0)
+    monthly_drift = np.log1p(mu) / 12.0 - 0.5 * monthly_sigma ** 2
+    chol = np.linalg.cholesky(_correlation_matrix())
+
+    values = np.tile([float(current_values.get(a, 0.0)) for a in ASSETS], (n_paths, 1))
+    cash = np.zeros(n_paths)
+
+    wealth_out = np.empty((n_paths, months), dtype=np.float32)
+    drift_out = np.empty((n_paths, months), dtype=np.float32)
+    cash_out = np.empty((n_paths, months), dtype=np.float32)
+
+    for m in range(months):
+        age = ages[m]
+        budget = contributions[m] + cash
+
+        plan = calculate_growth_dividends_buys_vectorized(
+            age, buffett_index, values, budget, min_order_size=min_order_size, cap_defensive=True, glide=glide,
+        )
+        values = values + plan["buys"]
+        cash = np.maximum(0.0, np.round(budget - plan["buys"].sum(axis=1), 2))
+
+        shocks = rng.standard_normal((n_paths, len(ASSETS))) @ chol.T
+        values = values * np.exp(monthly_drift + monthly_sigma * shocks)
+
+        total = values.sum(axis=1)
+        weights = values / np.where(total > 0, total, 1.0)[:, None] * 100.0
+        drift = np.abs(weights - plan["portfolio_targets"]).max(axis=1)
+
+        wealth_out[:, m] = total + cash
+        drift_out[:, m] = drift
+        cash_out[:, m] = cash
+
+    return {"wealth": wealth_out, "drift": drift_out, "cash": cash_out}
+
+
+def percentile_bands(paths: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """P5/P50/P95 per month for every simulated metric."""
+    bands = {}
+    for metric, values in paths.items():
+        pct = np.percentile(values, PERCENTILES, axis=0)
+        bands[metric] = {f"P{p}": pct[i] for i, p in enumerate(PERCENTILES)}
+    return bands
+
+
+def _simulate_chunk(args) -> Dict[str, np.ndarray]:
+    return simulate_paths(**args)
+
+
+def iter_simulation_bands(
+    n_paths: int,
+    years: int,
+    birth_date: DateLike,
+    buffett_index: float,
+    current_values: Dict[str, float],
+    start: Optional[date] = None,
+    extra_monthly_contribution: float = 0.0,
+    asset_returns: Optional[Dict[str, tuple]] = None,
+    chunk_size: int = 1000,
+    max_workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    glide: str = "step",
+) -> Iterator[Dict[str, Any]]:
+    """
+    Runs the simulation in chunks across a process pool.
+
+    Yields a progress dict after every finished chunk with the number of
+    completed paths and the percentile bands over all completed paths, so the
+    UI can redraw as results arrive. With `max_workers=1` chunks run in-process.
+    """
+
+    if not 1 <= years <= 60:
+        raise ValueError("Simulation horizon must be between 1 and 60 years.")
+
+    contributions = contribution_schedule(years * 12, start, extra_monthly_contribution)
+    seeds = np.random.SeedSequence(seed).spawn((n_paths + chunk_size - 1) // chunk_size)
+
+    jobs = []
+    for i, chunk_seed in enumerate(seeds):
+        jobs.append({
+            "n_paths": min(chunk_size, n_paths - i * chunk_size),
+            "birth_date": birth_date,
+            "buffett_index": buffett_index,
+            "current_values": current_values,
+            "contributions": contributions,
+            "asset_returns": asset_returns,
+            "seed": chunk_seed,
+            "glide": glide,
+            "start": start,
+        })
+
+    completed = {"wealth": [], "drift": [], "cash": []}
+
+    def _progress(result):
+        for metric in completed:
+            completed[metric].append(result[metric])
+        paths = {metric: np.concatenate(chunks) for metric, chunks in completed.items()}
+        return {
+            "completed_paths": len(paths["wealth"]),
+            "total_paths": n_paths,
+            "months": len(contributions),
+            "total_contributed": float(contributions.sum()),
+            "bands": percentile_bands(paths),
+        }
+
+    if max_workers == 1:
+        for job in jobs:
+            yield _progress(_simulate_chunk(job))
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_simulate_chunk, job) for job in jobs]
+        for future in as_completed(futures):
+            yield _progress(future.result())
+
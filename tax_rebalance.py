@@ -0,0 +1,182 @@
+"""
+Tax-aware full rebalance that may sell.
+
+The monthly engines never sell. This mode may, when the drift it removes is
+worth the tax it triggers: each holding's realized gain is estimated from its
+`quantity` x `average_price` cost basis, and the trades minimize
+
+    drift_aversion * sum(outside_band_i^2 + INSIDE_BAND_WEIGHT * deviation_i^2) / total
+    + tax_rate * sum(gain_fraction_i * sold_i)
+
+subject to the trades netting to the cash available and no position going
+below zero. The cost is separable and convex in each trade, so the QP is
+solved exactly through its dual: bisection on the price of cash, with every
+holding's best trade for that price in closed form (vectorized in NumPy).
+"""
+
+from typing import Dict, Any, List, Mapping, Sequence
+
+import numpy as np
+
+# Portuguese flat rate on realized capital gains
+DEFAULT_TAX_RATE = 0.28
+
+# Euros of drift cost per squared euro outside the band, relative to the total
+DEFAULT_DRIFT_AVERSION = 5.0
+
+# Keeps pulling towards target once a holding is inside its band
+INSIDE_BAND_WEIGHT = 1e-3
+
+BISECTION_STEPS = 100
+
+
+def _inverse_gradient(y: np.ndarray, weight: float, band: np.ndarray) -> np.ndarray:
+    """Deviation d at which the drift cost's derivative equals y (per holding)."""
+    inside = 2.0 * weight * INSIDE_BAND_WEIGHT
+    outside = 2.0 * weight * (1.0 + INSIDE_BAND_WEIGHT)
+    return np.where(
+        np.abs(y) <= inside * band,
+        y / inside,
+        np.sign(y) * (np.abs(y) + 2.0 * weight * band) / outside,
+    )
+
+
+def _trades_for_price(
+    price: float,
+    offset: np.ndarray,
+    band: np.ndarray,
+    weight: float,
+    marginal_tax: np.ndarray,
+    lower: np.ndarray,
+    free: np.ndarray,
+) -> np.ndarray:
+    """Best trade per holding when a euro of cash is worth `price`."""
+    buy = _inverse_gradient(np.full_like(offset, price), weight, band) - offset
+    sell = _inverse_gradient(price + marginal_tax, weight, band) - offset
+    trade = np.where(buy > 0, buy, np.where(sell < 0, sell, 0.0))
+    return np.where(free, np.maximum(trade, lower), 0.0)
+
+
+def rebalance_with_sells(
+    stocks: Sequence[Dict[str, Any]],
+    targets: Mapping[str, float],
+    tolerances: Mapping[str, float],
+    cash: float = 0.0,
+    tax_rate: float = DEFAULT_TAX_RATE,
+    drift_aversion: float = DEFAULT_DRIFT_AVERSION,
+    min_trade: float = 5.0,
+) -> Dict[str, Any]:
+    """
+    Computes a full rebalance (buys and sells) for one portfolio.
+
+    Rules:
+    - `targets` are % weights, `tolerances` pp bands (holdings missing from
+      `targets` target 0%); `cash` is new money to invest (may be 0).
+    - Sells never exceed the position. A holding without a cost basis
+      (`quantity` or `average_price` missing) is never sold: its gain is unknown.
+    - A sale realizes gain_fraction = 1 - cost basis / current value per euro;
+      losses are sold tax-free but not credited against other gains.
+    - Trades below `min_trade` euros are dropped and the others re-solved.
+
+    Returns per-holding trades (positive = buy, negative = sell) with the
+    estimated realized gain and tax, and the drift outside the bands before
+    and after, in pp.
+    """
+
+    names = [s['name'] for s in stocks]
+    n = len(names)
+    values = np.array([float(s.get('current_value', 0.0) or 0.0) for s in stocks])
+    basis = np.array([
+        float(s.get('quantity', 0.0) or 0.0) * float(s.get('average_price', 0.0) or 0.0) for s in stocks
+    ])
+    if (values < 0).any():
+        raise ValueError("Portfolio value cannot be negative.")
+    if cash < 0:
+        raise ValueError("Cash to invest cannot be negative.")
+
+    target_pct = np.array([float(targets.get(name, 0.0) or 0.0) for name in names])
+    if n and target_pct.sum() <= 0:
+        raise ValueError("Targets must add up to more than 0%.")
+    target_pct = target_pct / target_pct.sum() * 100.0 if n else target_pct
+    tolerance_pp = np.array([float(tolerances.get(name, 0.0) or 0.0) for name in names])
+
+    total = values.sum() + cash
+    if total <= 0 or n == 0:
+        return {
+            "trades": [], "cash_left": round(cash, 2), "total_bought": 0.0, "total_sold": 0.0,
+            "realized_gain": 0.0, "estimated_tax": 0.0,
+            "drift_before_pp": 0.0, "drift_after_pp": 0.0,
+        }
+
+    centers = total * target_pct / 100.0
+    band = total * np.minimum(tolerance_pp, target_pct) / 100.0
+    offset = values - centers
+    weight = drift_aversion / total
+
+    has_basis = basis > 0
+    gain_fraction = np.where(has_basis & (values > 0), 1.0 - basis / np.where(values > 0, values, 1.0), 0.0)
+    marginal_tax = tax_rate * np.maximum(gain_fraction, 0.0)
+    lower = np.where(has_basis, -values, 0.0)
+
+    free = np.ones(n, dtype=bool)
+    for _ in range(n + 1):
+        # The net trade grows with the price of cash: bisect until it matches `cash`
+        reach = 4.0 * weight * (np.abs(offset).max() + total)
+        low, high = -(reach + marginal_tax.max()), reach
+        for _ in range(BISECTION_STEPS):
+            price = (low + high) / 2.0
+            if _trades_for_price(price, offset, band, weight, marginal_tax, lower, free).sum() > cash:
+                high = price
+            else:
+                low = price
+        trades = _trades_for_price(low, offset, band, weight, marginal_tax, lower, free)
+        # Hand the bisection residual to the largest buy
+        if free.any():
+            trades[np.argmax(np.where(free, trades, -np.inf))] += cash - trades.sum()
+
+        small = free & (np.abs(trades) < min_trade)
+        if not small.any() or small.sum() == free.sum():
+            break
+        # Fix the tiny trades at zero and re-solve the others
+        free &= ~small
+
+    trades = np.where(np.abs(trades) < min_trade, 0.0, trades)
+    trades = np.maximum(np.round(trades, 2), np.where(has_basis, -values, 0.0))
+    # Rounding may overspend by a few cents: take them from the largest buy
+    overspend = round(float(trades.sum()) - cash, 2)
+    if overspend > 0 and trades.max() > 0:
+        trades[np.argmax(trades)] = round(trades.max() - overspend, 2)
+
+    sold = np.maximum(-trades, 0.0)
+    realized = sold * gain_fraction
+    tax = tax_rate * np.maximum(realized, 0.0)
+    after = values + trades
+
+    def drift_pp(holdings: np.ndarray) -> np.ndarray:
+        return np.maximum(0.0, np.abs(holdings - centers) - band) / total * 100.0
+
+    rows: List[Dict[str, Any]] = []
+    for i, name in enumerate(names):
+        rows.append({
+            "name": name,
+            "current_value": round(float(values[i]), 2),
+            "target_value": round(float(centers[i]), 2),
+            "trade": round(float(trades[i]), 2),
+            "realized_gain": round(float(realized[i]), 2),
+            "estimated_tax": round(float(tax[i]), 2),
+            "value_after": round(float(after[i]), 2),
+            "weight_after": round(float(after[i] / total * 100.0), 2),
+            "target_allocation": round(float(target_pct[i]), 2),
+            "drift_after_pp": round(float(drift_pp(after)[i]), 2),
+        })
+
+    return {
+        "trades": rows,
+        "cash_left": round(cash - float(trades.sum()), 2),
+        "total_bought": round(float(np.maximum(trades, 0.0).sum()), 2),
+        "total_sold": round(float(sold.sum()), 2),
+        "realized_gain": round(float(realized.sum()), 2),
+        "estimated_tax": round(float(tax.sum()), 2),
+        "drift_before_pp": round(float(drift_pp(values).sum()), 2),
+        "drift_after_pp": round(float(drift_pp(after).sum()), 2),
+    }
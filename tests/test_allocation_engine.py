@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from allocation_engine import (
+    LIFECYCLE_AGE_BOUNDS,
+    PT_MIN_ORDER,
+    SPYL_LEVELS,
+    TARGET_TABLE,
+    _combine_targets,
+    allocate_orders,
+    calculate_growth_split,
+    calculate_portfolio_targets,
+    finalize_standard_orders,
+    get_lifecycle_targets,
+    lifecycle_band,
+    lookup_targets,
+    spyl_level,
+)
+
+TICKERS = ["VWCE.DE", "EDP.PT", "GALP.PT", "SXR8.DE", "JMT.PT", "IS3N.DE"]
+
+
+def test_allocate_orders_rounds_to_the_budget_in_whole_euros():
+    rng = np.random.default_rng(5)
+    for _ in range(500):
+        raw = dict(zip(TICKERS, np.round(rng.uniform(0, 80, size=len(TICKERS)), 2).tolist()))
+        for ticker in TICKERS:
+            if rng.random() < 0.2:
+                raw[ticker] = 0.0
+        budget = float(rng.integers(10, 400))
+
+        orders, leftover = allocate_orders(raw, budget)
+
+        assert list(orders) == TICKERS
+        eligible = {t: v for t, v in raw.items() if v >= (PT_MIN_ORDER if t.endswith(".PT") else 5.0)}
+        if not any(orders.values()):
+            # Too small a budget for any order to reach its minimum
+            assert leftover == budget
+            assert all(v * budget / sum(eligible.values()) < 5.0 for v in eligible.values())
+            continue
+        assert sum(orders.values()) == pytest.approx(budget)
+        assert leftover == 0.0
+        # Orders a short budget shrinks below €5 are dropped and the rest rescaled
+        kept = {t: v for t, v in eligible.items() if orders[t] > 0}
+        total = sum(kept.values())
+        for ticker, amount in orders.items():
+            assert amount == int(amount)
+            if ticker.endswith(".PT") and amount:
+                assert amount >= PT_MIN_ORDER
+            assert abs(amount - kept.get(ticker, 0.0) * budget / total) < 1.0
+        if budget >= sum(eligible.values()):
+            assert kept == eligible
+
+
+def test_allocate_orders_breaks_remainder_ties_by_key_order():
+    assert allocate_orders({"A": 12.5, "B": 12.5}, 25.0) == ({"A": 13.0, "B": 12.0}, 0.0)
+    assert allocate_orders({"B": 12.5, "A": 12.5}, 25.0) == ({"B": 13.0, "A": 12.0}, 0.0)
+
+
+def test_standard_orders_spread_leftover_euros_by_remainder():
+    raw = {"A": 40.6, "B": 30.7, "C": 20.2}
+
+    orders, leftover = finalize_standard_orders(raw, 100.40, False, {"A": 50, "B": 30, "C": 20})
+
+    assert sum(orders.values()) == 100.0
+    assert leftover == pytest.approx(0.40)
+    assert all(abs(orders[t] - raw[t] * 100.40 / 91.5) < 1.0 for t in raw)
+    # Nothing to buy: the split follows the targets
+    assert finalize_standard_orders(dict.fromkeys(raw, 0.0), 10.0, False, {"A": 50, "B": 30, "C": 20}) == (
+        {"A": 5.0, "B": 3.0, "C": 2.0}, 0.0,
+    )
+
+
+def test_target_table_matches_a_fresh_calculation():
+    ages = np.arange(0, 100.5, 0.5).tolist() + [bound - 1e-9 for bound in LIFECYCLE_AGE_BOUNDS]
+    buffetts = np.arange(40.0, 302.5, 2.5).tolist()
+    seen = set()
+
+    for age in ages:
+        lifecycle = get_lifecycle_targets(age)
+        for buffett in buffetts:
+            growth_split = calculate_growth_split(buffett)
+            targets, total = _combine_targets(lifecycle, growth_split)
+
+            result = calculate_portfolio_targets(age, buffett)
+
+            assert dict(lookup_targets(age, buffett)) == targets
+            assert result["targets"] == targets
+            assert result["lifecycle"] == lifecycle
+            assert result["growth_split"] == growth_split
+            assert result["total"] == total
+            seen.add((lifecycle_band(age), spyl_level(buffett)))
+
+    # Every (band, level) cell was reached by some (age, buffett) pair
+    assert seen == {(band, level) for band in range(len(TARGET_TABLE)) for level in SPYL_LEVELS}
+
+
+def test_lookup_targets_is_read_only_and_results_are_copies():
+    with pytest.raises(TypeError):
+        lookup_targets(30, 150.0)["SPYL.DE"] = 0.0
+
+    result = calculate_portfolio_targets(30, 150.0)
+    result["targets"]["SPYL.DE"] = 0.0
+    result["lifecycle"]["growth"] = 0.0
+
+    assert calculate_portfolio_targets(30, 150.0)["targets"] == dict(lookup_targets(30, 150.0))
+    assert lookup_targets(30, 150.0)["SPYL.DE"] > 0.0
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from backtest import DIVIDEND_PREFIX, prepare_price_history, run_backtest, run_backtests
+from vectorized_engine import ASSETS
+
+
+def _history():
+    """Three flat months; VDIV.DE rises in March and pays €0.25 a share in February and March."""
+    raw = pd.DataFrame({"date": ["2025-01-15", "2025-02-14", "2025-03-14"]})
+    for asset in ASSETS:
+        raw[asset] = 10.0
+    raw["VDIV.DE"] = [10.0, 10.0, 11.0]
+    raw[f"{DIVIDEND_PREFIX}VDIV.DE"] = [0.0, 0.25, 0.25]
+    return prepare_price_history(raw)
+
+
+# 1000 VDIV.DE shares: far above target, so the rules never buy more of it
+PARAMS = {"birth_date": "1980-05-01", "initial_values": {"VDIV.DE": 10000.0}}
+
+
+def test_cash_and_dividends_by_hand():
+    (report,) = run_backtest(_history(), [PARAMS])
+
+    assert report["holdings_units"]["VDIV.DE"] == 1000.0
+    assert report["total_contributed"] == 1500.0
+    # February's €250 is invested in March; March's €250 has no next month and stays as cash
+    assert report["total_dividends"] == 500.0
+    assert report["cash"] == 250.0
+    # Other holdings bought at €10 keep their cost; VDIV.DE is now worth €11,000
+    assert report["value_series"].tolist() == pytest.approx([10500.0, 11000.0, 13000.0])
+    assert report["final_value"] == pytest.approx(13000.0)
+    assert sum(report["holdings_values"].values()) + report["cash"] == pytest.approx(13000.0)
+
+    # €1,750 bought over a quarter
+    assert report["turnover"] == pytest.approx(1750.0 / report["value_series"].mean() / 0.25, abs=1e-4)
+
+
+def test_extra_contributions_and_groups_keep_input_order():
+    history = _history()
+    params = [dict(PARAMS, extra_monthly=100.0), PARAMS, dict(PARAMS, min_order_size=10.0)]
+
+    reports = run_backtests(history, params, max_workers=1)
+
+    assert [r["params"] for r in reports] == params
+    assert [r["total_contributed"] for r in reports] == [1800.0, 1500.0, 1500.0]
+    assert reports[0]["final_value"] == pytest.approx(13300.0)
+    assert reports[1]["holdings_units"] == run_backtest(history, [PARAMS])[0]["holdings_units"]
+
+
+def test_history_needs_a_starting_price():
+    raw = pd.DataFrame({"date": ["2025-01-15", "2025-02-14"], **{asset: [10.0, 10.0] for asset in ASSETS}})
+    raw.loc[0, "JMT.PT"] = None
+
+    with pytest.raises(ValueError, match="JMT.PT"):
+        prepare_price_history(raw)
@@ -0,0 +1,17 @@
+import math
+import warnings
+from datetime import date
+
+from contribution_planner import plan_contributions
+
+
+def test_zero_budget_month_on_empty_portfolio_plans_without_nan():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        plan = plan_contributions("1990-01-01", 195.0, {}, [0.0, 500.0, 1000.0], start=date(2026, 1, 1))
+
+    first, second, third = plan["schedule"]
+    assert sum(first["buys"].values()) == 0.0
+    assert math.isclose(sum(second["buys"].values()) + second["leftover_cash"], 500.0)
+    assert math.isclose(sum(third["buys"].values()) + third["leftover_cash"], 1000.0)
+    assert not math.isnan(plan["total_drift_outside_band_pp"])
@@ -0,0 +1,64 @@
+import random
+
+import pandas as pd
+import pytest
+
+from dividend_ledger import DividendLedger, parse_dividends
+
+
+def _dividends(rng, count):
+    return pd.DataFrame([
+        {
+            "date": rng.choice([f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                                f"2026-{rng.randint(1, 12):02d}-15", ""]),
+            "ticker": rng.choice(["VDIV.DE", "RENE.PT", "TDIV.AS"]),
+            "amount": round(rng.uniform(0, 40), 2),
+            "portfolio_name": rng.choice(["Main", "Dividends"]),
+            "username": rng.choice(["ana", "rui"]),
+        }
+        for _ in range(count)
+    ])
+
+
+def _masked_total(ledger, username, portfolio, ticker=None, year=None, month=None):
+    """The boolean-mask total the cube replaces."""
+    mask = (ledger["username"] == username) & (ledger["portfolio_name"] == portfolio)
+    if ticker is not None:
+        mask &= ledger["ticker"] == ticker
+    if year is not None:
+        mask &= ledger["date"].dt.year == year
+    if month is not None:
+        mask &= ledger["date"].dt.month == month
+    return round(float(ledger.loc[mask, "amount"].sum()), 2)
+
+
+def test_edited_ledger_matches_fresh_build_and_masks():
+    rng = random.Random(2)
+    raw = _dividends(rng, 30)
+    ledger = DividendLedger(raw)
+    original, original_total = ledger, ledger.total("ana", "Main")
+
+    for _ in range(20):
+        if rng.random() < 0.7:
+            rows = _dividends(rng, rng.randint(1, 3))
+            ledger = ledger.add(rows)
+            raw = pd.concat([raw, rows], ignore_index=True)
+        else:
+            username, portfolio = rng.choice(["ana", "rui"]), rng.choice(["Main", "Dividends"])
+            rows = _dividends(rng, rng.randint(0, 5)).assign(username=username, portfolio_name=portfolio)
+            ledger = ledger.replace_portfolio(username, portfolio, rows)
+            keep = ~((raw["username"] == username) & (raw["portfolio_name"] == portfolio))
+            raw = pd.concat([raw[keep], rows], ignore_index=True)
+
+        fresh = DividendLedger(raw)
+        parsed = parse_dividends(raw)
+        for username in ("ana", "rui"):
+            for portfolio in ("Main", "Dividends"):
+                assert ledger.ticker_totals(username, portfolio) == fresh.ticker_totals(username, portfolio)
+                for ticker in (None, "VDIV.DE", "RENE.PT"):
+                    for year, month in ((None, None), (2025, None), (2026, 3), (2025, 7)):
+                        expected = _masked_total(parsed, username, portfolio, ticker, year, month)
+                        assert ledger.total(username, portfolio, ticker, year, month) == pytest.approx(expected, abs=0.011)
+
+    # Ledgers handed out earlier never change
+    assert original.total("ana", "Main") == original_total
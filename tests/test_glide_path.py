@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from allocation_engine import (
+    KIDS_PHASES,
+    LIFECYCLE_PHASES,
+    STRATEGY_PHASES,
+    get_kids_targets,
+    phase_index,
+)
+from glide_path import GLIDE_MODES, KIDS_GLIDE, LIFECYCLE_GLIDE, STRATEGY_GLIDE, ages_on, lifecycle_weights
+
+GLIDES = [(LIFECYCLE_GLIDE, LIFECYCLE_PHASES), (STRATEGY_GLIDE, STRATEGY_PHASES), (KIDS_GLIDE, KIDS_PHASES)]
+AGES = np.arange(0, 90 * 12 + 1) / 12.0
+
+
+@pytest.mark.parametrize("glide, phases", GLIDES)
+def test_step_mode_matches_phase_index(glide, phases):
+    expected_phase = [phase_index(phases, age) for age in AGES]
+
+    assert glide.phase_at(AGES).tolist() == expected_phase
+    assert (glide.weights_at(AGES, "step") == np.array([phases[i][-1] for i in expected_phase])).all()
+
+
+@pytest.mark.parametrize("mode", GLIDE_MODES)
+def test_every_row_sums_to_100(mode):
+    assert (lifecycle_weights(AGES, mode).sum(axis=1).round(9) == 100.0).all()
+    # Accumulation and Dividends blocks of the strategy ladder each sum to 100
+    strategy = STRATEGY_GLIDE.weights_at(AGES, mode)
+    assert np.allclose(strategy[:, :3].sum(axis=1), 100.0)
+    assert np.allclose(strategy[:, 3:].sum(axis=1), 100.0)
+    assert np.allclose(KIDS_GLIDE.weights_at(AGES, mode).sum(axis=1), 100.0)
+    for age in (13.5, 14.25, 17.9):
+        assert sum(get_kids_targets(age, mode).values()) == pytest.approx(100.0)
+
+
+@pytest.mark.parametrize("glide", [glide for glide, _ in GLIDES])
+@pytest.mark.parametrize("mode", ["linear", "smooth"])
+def test_ramps_are_monotonic(glide, mode):
+    weights = glide.weights_at(AGES, mode)
+    steps = np.diff(weights, axis=0)
+    phase = glide.phase_at(AGES[:-1])
+    following = np.minimum(phase + 1, len(glide.weights) - 1)
+    direction = np.sign(glide.weights[following] - glide.weights[phase])
+
+    # Each column only moves towards the next phase, and ends on it
+    assert (steps * direction >= -1e-9).all()
+    assert (np.abs(steps)[direction == 0] < 1e-9).all()
+    starts = np.searchsorted(AGES, glide.starts[1:])
+    assert np.allclose(weights[starts], glide.weights[1:len(starts) + 1])
+
+
+def test_ages_count_whole_months():
+    ages = ages_on("1990-03-15", ["2030-03-14", "2030-03-15", "2030-04-14", "2030-04-15"])
+
+    assert ages.tolist() == pytest.approx([40 - 1 / 12, 40.0, 40.0, 40 + 1 / 12])
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from hedge_funding import solve_hedge_funding
+
+
+def _portfolios(receiver):
+    rows = [
+        ("Accumulation", "Stocks", 5000.0, 0.0, 0.0, 500.0, 0.07, False),
+        ("Dividends", "Stocks", 5000.0, 0.0, 0.0, 500.0, 0.10, False),
+    ]
+    if receiver:
+        rows.append(("Gold & Bonds", "Stocks", 200.0, 100.0, 100.0, 0.0, 0.0, True))
+    return pd.DataFrame(rows, columns=[
+        'portfolio_name', 'portfolio_type', 'total_value', 'gold_value', 'bond_value',
+        'monthly_budget', 'diversion_cap', 'is_hedge_portfolio',
+    ])
+
+
+def test_without_hedge_portfolio_nothing_is_diverted():
+    funding = solve_hedge_funding(_portfolios(receiver=False), target_pct=10.0, gold_share=0.5)
+    table = funding["portfolios"]
+
+    assert not funding["on_target"]
+    assert not funding["has_receiver"]
+    assert funding["diverted"] == 0.0
+    assert table['diversion'].tolist() == [0.0, 0.0]
+    assert table['budget_after'].tolist() == [500.0, 500.0]
+    assert funding["hedge_weight_after"] == funding["hedge_weight_before"]
+    assert funding["gold_buy"] == funding["bond_buy"] == 0.0
+
+
+def test_diverted_cash_reaches_the_hedge_portfolio():
+    funding = solve_hedge_funding(_portfolios(receiver=True), target_pct=10.0, gold_share=0.5)
+    table = funding["portfolios"].set_index('portfolio_name')
+
+    assert funding["diverted"] == pytest.approx(85.0)
+    assert table.at["Accumulation", 'budget_after'] == pytest.approx(465.0)
+    assert table.at["Dividends", 'budget_after'] == pytest.approx(450.0)
+    assert table.at["Gold & Bonds", 'received'] == pytest.approx(85.0)
+    assert table['budget_after'].sum() == pytest.approx(table['monthly_budget'].sum())
+    assert funding["gold_buy"] + funding["bond_buy"] == pytest.approx(85.0)
+    assert funding["hedge_weight_after"] == pytest.approx(285.0 / 11200.0 * 100.0, abs=0.01)
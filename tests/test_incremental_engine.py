@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from allocation_engine import calculate_standard_buys, finalize_standard_orders
+from incremental_engine import IncrementalAllocator
+
+
+def _random_stock(rng, name):
+    return {
+        "name": name,
+        "current_value": rng.choice([0.0, round(rng.uniform(0, 5000), 2)]),
+        "target_allocation": rng.choice([0.0, 5.0, 12.5, 25.0, round(rng.uniform(0, 40), 1)]),
+        "tolerance": rng.choice([0.0, 1.0, 2.5]),
+        "current_price": round(rng.uniform(1, 300), 2),
+    }
+
+
+def test_remainder_ties_survive_float_drift():
+    clean = {"VWCE.DE": 12.5, "IWDA.AS": 87.5}
+    for drift in (1e-12, -1e-12):
+        drifted = {"VWCE.DE": 12.5 + drift, "IWDA.AS": 87.5 - drift}
+        for is_dividends in (False, True):
+            expected = finalize_standard_orders(clean, 100.0, is_dividends)
+            assert finalize_standard_orders(drifted, 100.0, is_dividends) == expected
+
+
+@pytest.mark.parametrize("is_dividends", [False, True])
+def test_incremental_allocator_matches_full_recalculation(is_dividends):
+    rng = random.Random(7)
+    names = ["RENE.PT", "VWCE.DE", "IWDA.AS", "EGLN.UK", "JPGL.DE", "ZPRV.DE"]
+
+    for _ in range(40):
+        stocks = {name: _random_stock(rng, name) for name in rng.sample(names, rng.randint(1, len(names)))}
+        monthly = rng.choice([50.0, 100.0, 195.0, round(rng.uniform(10, 1000), 2)])
+        allocator = IncrementalAllocator(list(stocks.values()), monthly, is_dividends)
+
+        for _ in range(15):
+            edit = rng.random()
+            if edit < 0.6:
+                name = rng.choice(list(stocks))
+                stock = _random_stock(rng, name)
+                stocks[name] = stock
+                allocator.update(name, **{k: v for k, v in stock.items() if k != "name"})
+            elif edit < 0.75 and len(stocks) > 1:
+                name = rng.choice(list(stocks))
+                del stocks[name]
+                allocator.remove(name)
+            elif edit < 0.9:
+                name = rng.choice(names)
+                stocks.pop(name, None)
+                stocks[name] = _random_stock(rng, name)
+                allocator.add(stocks[name])
+            else:
+                monthly = round(rng.uniform(10, 1000), 2)
+                allocator.set_monthly_investment(monthly)
+
+            expected = calculate_standard_buys(list(stocks.values()), monthly, is_dividends)
+            actual = allocator.recommendations()
+            assert actual["buys"] == expected["buys"]
+            assert actual["leftover_cash"] == expected["leftover_cash"]
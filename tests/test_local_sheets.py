@@ -0,0 +1,20 @@
+import pandas as pd
+import pytest
+
+from local_sheets import LocalSheetsConnection
+
+
+def test_update_needs_an_existing_worksheet(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path))
+    rows = pd.DataFrame({"worksheet": ["Portfolios"], "token": ["abc"]})
+
+    with pytest.raises(FileNotFoundError):
+        conn.update(worksheet="_versions", data=rows)
+    with pytest.raises(FileNotFoundError):
+        conn.open_spreadsheet().worksheet("_versions")
+
+    conn.create(worksheet="_versions", data=rows)
+    with pytest.raises(FileExistsError):
+        conn.create(worksheet="_versions", data=rows)
+    conn.update(worksheet="_versions", data=rows.assign(token="def"))
+    assert conn.read(worksheet="_versions")["token"].tolist() == ["def"]
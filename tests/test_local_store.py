@@ -0,0 +1,202 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from local_sheets import LocalSheetsConnection
+from local_store import (
+    ChangeWatcher,
+    LocalStore,
+    ReadOnlyWorksheet,
+    SheetsReplicator,
+    SnapshotRefresher,
+    load_worksheet,
+    queue_append,
+    queue_write,
+    refresh_worksheet,
+    requeue_unsynced,
+)
+from sheet_sync import DeltaSync
+
+
+def _replica(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path / "sheets"))
+    store = LocalStore(":memory:", snapshot_dir=str(tmp_path / "snapshots"))
+    upload = DeltaSync(conn.update, conn.open_spreadsheet().worksheet, create=conn.create)
+    replicator = SheetsReplicator(upload, upload.append, debounce=0.0)
+    return conn, store, replicator
+
+
+def test_first_append_to_missing_worksheet_creates_it(tmp_path):
+    conn, store, replicator = _replica(tmp_path)
+    rows = pd.DataFrame([{"date": "2026-01-15", "ticker": "VDIV.DE", "amount": 3.5,
+                          "portfolio_name": "Main", "username": "ana"}])
+
+    queue_append(store, replicator, "Dividends", rows, lambda: conn.read(worksheet="Dividends", ttl=0))
+
+    assert store.read_only("Dividends") is None
+    assert replicator.flush(5.0)
+    sheet = conn.read(worksheet="Dividends")
+    assert sheet["ticker"].tolist() == ["VDIV.DE"]
+
+    # The next entry is a plain append
+    queue_append(store, replicator, "Dividends", rows.assign(amount=4.0), lambda: conn.read(worksheet="Dividends", ttl=0))
+    assert replicator.flush(5.0)
+    assert conn.read(worksheet="Dividends")["amount"].tolist() == [3.5, 4.0]
+    assert conn.calls["append_rows"] == 1
+
+
+def test_append_is_refused_when_sheets_is_unreachable(tmp_path):
+    _, store, replicator = _replica(tmp_path)
+
+    def unreachable():
+        raise ConnectionError("timed out")
+
+    with pytest.raises(ReadOnlyWorksheet, match="unreachable"):
+        queue_append(store, replicator, "InvestmentLog", pd.DataFrame([{"Stock": "SPYL.DE"}]), unreachable)
+    assert store.read_only("InvestmentLog")
+    assert not store.has("InvestmentLog")
+
+
+def test_concurrent_saves_upload_what_the_store_holds(tmp_path):
+    conn, store, replicator = _replica(tmp_path)
+    frames = [pd.DataFrame({"username": ["ana"], "portfolio_name": ["Main"], "stock_name": ["VWCE.DE"],
+                            "current_value": [float(i)]}) for i in range(40)]
+
+    threads = [threading.Thread(target=queue_write, args=(store, replicator, "Portfolios", f)) for f in frames]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert replicator.flush(5.0)
+    assert conn.read(worksheet="Portfolios", ttl=0)["current_value"].tolist() == store.read("Portfolios")["current_value"].tolist()
+
+
+def test_float_appended_to_an_int_seeded_column(tmp_path):
+    _, store, _ = _replica(tmp_path)
+    store.write("Dividends", pd.DataFrame({"date": ["2026-01-15"], "ticker": ["VDIV.DE"], "amount": [3],
+                                           "portfolio_name": ["Main"], "username": ["ana"], "note": [None]}))
+
+    aligned = store.append("Dividends", pd.DataFrame({"date": ["2026-02-15"], "ticker": ["VDIV.DE"], "amount": [3.55],
+                                                      "portfolio_name": ["Main"], "username": ["ana"], "note": ["late"]}))
+
+    assert aligned["amount"].tolist() == [3.55]
+    stored = store.read("Dividends")
+    assert stored["amount"].tolist() == [3.0, 3.55]
+    assert stored["note"].tolist()[1] == "late"
+
+
+def test_download_typed_differently_is_not_a_change(tmp_path):
+    _, store, _ = _replica(tmp_path)
+    # A copy the sheet already holds
+    store.mark_synced("Portfolios", store.write("Portfolios", pd.DataFrame({
+        "username": ["ana", "ana"], "portfolio_name": ["Main", "Main"], "stock_name": ["VWCE.DE", "EGLN.UK"],
+        "current_value": [1, 250], "portfolio_joint_hedge": [True, False],
+        "portfolio_birth_date": pd.to_datetime(["1990-01-01", "1990-01-01"]),
+    })))
+    sheet = pd.DataFrame({
+        "username": ["ana", "ana"], "portfolio_name": ["Main", "Main"], "stock_name": ["VWCE.DE", "EGLN.UK"],
+        "current_value": [1.0, 250.0], "portfolio_joint_hedge": ["TRUE", "FALSE"],
+        "portfolio_birth_date": ["1990-01-01", "1990-01-01"],
+    })
+    watcher = ChangeWatcher(store, lambda: {"Portfolios": "remote"}, lambda worksheet: sheet)
+    version = store.version("Portfolios")
+
+    assert watcher.check() == []
+    assert store.version("Portfolios") == version
+    assert store.sync_token("Portfolios") == "remote"
+
+    sheet.loc[1, "current_value"] = 260.0
+    watcher = ChangeWatcher(store, lambda: {"Portfolios": "moved"}, lambda worksheet: sheet)
+    assert watcher.check() == ["Portfolios"]
+    assert store.read("Portfolios")["current_value"].tolist() == [1.0, 260.0]
+
+
+def test_saves_queued_at_shutdown_are_uploaded_after_a_restart(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path / "sheets"))
+    conn.create(worksheet="Portfolios")
+    path = str(tmp_path / "portfolio.duckdb")
+    frame = pd.DataFrame({"username": ["ana"], "portfolio_name": ["Main"], "stock_name": ["VWCE.DE"],
+                          "current_value": [125.0]})
+
+    store = LocalStore(path, snapshot_dir=None)
+
+    def unreachable(worksheet, data):
+        raise ConnectionError("timed out")
+
+    offline = SheetsReplicator(unreachable, debounce=0.0, max_attempts=1, max_backoff=3600.0)
+    version = queue_write(store, offline, "Portfolios", frame)
+    assert not offline.flush(0.5)
+    store.close()
+
+    # Restart: the save is still owed to the sheet, and the watcher keeps the local copy
+    store = LocalStore(path, snapshot_dir=None)
+    assert store.unsynced_worksheets() == ["Portfolios"]
+    stale = frame.assign(current_value=99.0)
+    watcher = ChangeWatcher(store, lambda: {"Portfolios": "other"}, lambda worksheet: stale)
+    assert watcher.check() == []
+    assert store.read("Portfolios")["current_value"].tolist() == [125.0]
+
+    upload = DeltaSync(conn.update, conn.open_spreadsheet().worksheet, create=conn.create)
+    replicator = SheetsReplicator(upload, upload.append, debounce=0.0, on_synced=store.mark_synced)
+    assert requeue_unsynced(store, replicator) == ["Portfolios"]
+    assert replicator.flush(5.0)
+    assert conn.read(worksheet="Portfolios", ttl=0)["current_value"].tolist() == [125.0]
+    assert store.synced_version("Portfolios") == version
+    assert store.unsynced_worksheets() == []
+    assert requeue_unsynced(store, replicator) == []
+
+
+def _seeded_snapshot(tmp_path):
+    """A sheet with one portfolio and a store that seeded (and snapshotted) it, then lost its database."""
+    online = LocalSheetsConnection(str(tmp_path / "sheets"))
+    online.create(worksheet="Portfolios", data=pd.DataFrame({
+        "username": ["ana", "ana"], "portfolio_name": ["Main", "Main"], "stock_name": ["VWCE.DE", "EGLN.UK"],
+        "current_value": [100.0, 25.0],
+    }))
+    seeded = LocalStore(":memory:", snapshot_dir=str(tmp_path / "snapshots"))
+    load_worksheet(seeded, "Portfolios", lambda: online.read(worksheet="Portfolios", ttl=0))
+    seeded.close()
+    return online, LocalStore(":memory:", snapshot_dir=str(tmp_path / "snapshots"))
+
+
+def test_cold_start_offline_serves_the_snapshot_read_only(tmp_path):
+    _, store = _seeded_snapshot(tmp_path)
+    offline = LocalSheetsConnection(str(tmp_path / "sheets"), error_rate=1.0)
+
+    data = load_worksheet(store, "Portfolios", lambda: offline.read(worksheet="Portfolios", ttl=0))
+
+    assert data["current_value"].tolist() == [100.0, 25.0]
+    assert offline.calls["read"] == 0
+    assert "snapshot" in store.read_only("Portfolios")
+    with pytest.raises(ReadOnlyWorksheet, match="snapshot"):
+        store.write("Portfolios", data)
+    with pytest.raises(ReadOnlyWorksheet):
+        store.append("Portfolios", data.head(1))
+
+    # Still offline: the refresh fails and saves stay refused
+    assert not refresh_worksheet(store, "Portfolios", lambda: offline.read(worksheet="Portfolios", ttl=0))
+    assert "unreachable" in store.read_only("Portfolios")
+    assert offline.errors == 1
+
+
+def test_refresh_makes_the_restored_worksheet_writable(tmp_path):
+    online, store = _seeded_snapshot(tmp_path)
+    offline = LocalSheetsConnection(str(tmp_path / "sheets"), error_rate=1.0)
+    load_worksheet(store, "Portfolios", lambda: offline.read(worksheet="Portfolios", ttl=0))
+    # The sheet moved on after the snapshot was taken
+    newer = online.read(worksheet="Portfolios").assign(current_value=[110.0, 30.0])
+    online.update(worksheet="Portfolios", data=newer)
+
+    refresher = SnapshotRefresher(store, interval=0.0)
+    assert refresher.schedule("Portfolios", lambda: online.read(worksheet="Portfolios", ttl=0))
+    deadline = time.monotonic() + 5.0
+    while store.read_only("Portfolios") and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert store.read_only("Portfolios") is None
+    assert store.read("Portfolios")["current_value"].tolist() == [110.0, 30.0]
+    assert not refresher.schedule("Portfolios", lambda: online.read(worksheet="Portfolios", ttl=0))
+    store.write("Portfolios", newer)
@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from portfolio_data import PORTFOLIO_COLUMNS, PortfolioModel, SharedFrame, prepare_portfolios
+
+USERS = ["ana", "rui", "ines"]
+PORTFOLIOS = ["Main", "Kids", "Dividends"]
+TYPES = ["Growth & Dividends", "Kids", "Other", "Unified"]
+
+
+def _random_sheet(rng):
+    """A Portfolios sheet whose rows agree on their portfolio's settings, in shuffled column order."""
+    settings = {
+        (user, name): {
+            "portfolio_type": rng.choice(TYPES),
+            "portfolio_monthly_invest": float(rng.choice([100, 195, 1000])),
+            "portfolio_use_indicators": rng.choice([True, False]),
+            "portfolio_buffett_index": round(rng.uniform(90, 250), 1),
+            "portfolio_birth_date": rng.choice(["", "2015-06-01"]),
+            "portfolio_uninvested_cash": round(rng.uniform(0, 50), 2),
+            "investor_birth_date": rng.choice(["1992-01-01", "1985-03-20"]),
+            "portfolio_joint_hedge": rng.choice(["TRUE", "FALSE"]),
+        }
+        for user in USERS for name in PORTFOLIOS
+    }
+    rows = []
+    for _ in range(rng.randint(1, 40)):
+        key = (rng.choice(USERS), rng.choice(PORTFOLIOS))
+        rows.append({
+            "username": key[0], "portfolio_name": key[1],
+            "stock_name": rng.choice(["VWCE.DE", "EGLN.UK", "JMT.PT", "EDP.PT"]),
+            "current_value": round(rng.uniform(0, 3000), 2),
+            "target_allocation": rng.choice([0.0, 10.0, 25.0]),
+            "tolerance": rng.choice([1.0, 2.0]),
+            "sector": rng.choice(["", "Energy", "Utilities"]),
+            "country": rng.choice(["PT", "IE", ""]),
+            "currency": rng.choice(["EUR", "USD"]),
+            "quantity": float(rng.randint(0, 50)),
+            **settings[key],
+        })
+    raw = pd.DataFrame(rows)
+    raw = raw[rng.sample(list(raw.columns), len(raw.columns))]
+    sheet = prepare_portfolios(raw)
+    # Rows kept after an earlier filter: the index is not a range
+    return sheet.set_axis([i * 3 + 7 for i in range(len(sheet))])
+
+
+def test_round_trip_reproduces_the_sheet_frame():
+    rng = random.Random(19)
+
+    for _ in range(50):
+        sheet = _random_sheet(rng)
+
+        back = PortfolioModel.from_sheet(sheet).to_sheet()
+
+        assert list(back.columns) == list(sheet.columns)
+        pd.testing.assert_index_equal(back.index, sheet.index)
+        pd.testing.assert_frame_equal(back, sheet)
+
+
+def test_round_trip_of_an_empty_sheet():
+    back = PortfolioModel.from_sheet(prepare_portfolios(None)).to_sheet()
+
+    assert back.empty
+    assert list(back.columns) == PORTFOLIO_COLUMNS
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_slices_match_boolean_masks(seed):
+    sheet = _random_sheet(random.Random(seed))
+    model = PortfolioModel.from_sheet(sheet)
+
+    for user in USERS + ["nobody"]:
+        pd.testing.assert_frame_equal(model.to_sheet(user), sheet[sheet["username"] == user], check_index_type=False)
+        for name in PORTFOLIOS:
+            expected = sheet[(sheet["username"] == user) & (sheet["portfolio_name"] == name)]
+            pd.testing.assert_frame_equal(model.to_sheet(user, name), expected, check_index_type=False)
+
+
+def test_shared_frame_builds_once_per_version():
+    shared = SharedFrame()
+
+    def build():
+        time.sleep(0.05)
+        return pd.DataFrame({"version": [shared.builds + 1]})
+
+    frames = []
+    threads = [threading.Thread(target=lambda: frames.append(shared.get(1, build))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert shared.builds == 1
+    assert all(frame is frames[0] for frame in frames)
+    assert shared.get(2, build) is not frames[0]
+    assert shared.get(2, build)["version"].tolist() == [2]
+    assert shared.builds == 2
+
+
+def test_shared_frame_advance_refuses_a_stale_version():
+    shared = SharedFrame()
+    assert not shared.advance(0, 1, lambda frame: frame)
+
+    original = shared.get(1, lambda: pd.DataFrame({"value": [1.0]}))
+
+    assert not shared.advance(0, 2, lambda frame: frame.assign(value=2.0))
+    assert shared.version == 1
+    assert shared.get(1, pytest.fail) is original
+
+    assert shared.advance(1, 2, lambda frame: frame.assign(value=2.0))
+    assert shared.version == 2
+    assert shared.get(2, pytest.fail)["value"].tolist() == [2.0]
+    # Sessions still holding the old frame see it unchanged
+    assert original["value"].tolist() == [1.0]
+    assert shared.builds == 1
+
+    shared.invalidate()
+    assert not shared.advance(2, 3, lambda frame: frame)
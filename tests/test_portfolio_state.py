@@ -0,0 +1,183 @@
+import math
+import random
+
+import pandas as pd
+
+import portfolio_state
+from allocation_engine import TOLERANCE_PP
+from portfolio_data import PortfolioModel, prepare_portfolios
+from portfolio_state import PortfolioStates, aggregate_holdings, build_portfolio_state
+
+ALIASES = {"EGNL.UK": "EGLN.UK", "IBTE.UK": "YCSH.DE", "PRAB.DE": "YCSH.DE"}
+TICKERS = ["EGNL.UK", "EGLN.UK", "IBTE.UK", "PRAB.DE", "YCSH.DE", "SPYL.DE", "JMT.PT"]
+OPTIONAL_COLUMNS = [
+    "quantity", "expense_ratio", "current_price", "average_price", "dividend_yield",
+    "stock_full_name", "sector", "industry", "country", "currency",
+]
+
+
+def _iterrows_baseline(user_portfolio_df, ticker_map):
+    """The row-by-row merge `aggregate_holdings` replaced."""
+    aggregated_holdings = {}
+    for _, row in user_portfolio_df.iterrows():
+        raw_name = str(row['stock_name'])
+        mapped_name = ticker_map.get(raw_name, raw_name)
+
+        if mapped_name not in aggregated_holdings:
+            aggregated_holdings[mapped_name] = {
+                "name": mapped_name,
+                "current_value": 0.0,
+                "target_allocation": 0.0,
+                "tolerance": TOLERANCE_PP.get(mapped_name, 2.0),
+                "expense_ratio": float(row.get('expense_ratio', 0.0)),
+                "full_name": row.get('stock_full_name', mapped_name),
+                "sector": row.get('sector', ''),
+                "industry": row.get('industry', ''),
+                "country": row.get('country', ''),
+                "currency": row.get('currency', 'EUR'),
+                "quantity": 0.0,
+                "average_price": float(row.get('average_price', 0.0)),
+                "current_price": float(row.get('current_price', 0.0)),
+                "dividend_yield": float(row.get('dividend_yield', 0.0))
+            }
+
+        rec = aggregated_holdings[mapped_name]
+        rec["current_value"] += float(row['current_value'])
+        rec["quantity"] += float(row.get('quantity', 0.0))
+        if rec["expense_ratio"] == 0.0 and float(row.get('expense_ratio', 0.0)) > 0.0:
+            rec["expense_ratio"] = float(row.get('expense_ratio', 0.0))
+        if rec["current_price"] == 0.0 and float(row.get('current_price', 0.0)) > 0.0:
+            rec["current_price"] = float(row.get('current_price', 0.0))
+
+    return list(aggregated_holdings.values())
+
+
+def _number(rng):
+    return rng.choice([0.0, 0.0, float("nan"), round(rng.uniform(0, 500), 2), float(rng.randint(1, 40))])
+
+
+def _text(rng, options):
+    return rng.choice(options + [None])
+
+
+def _random_rows(rng):
+    n = rng.randint(1, 12)
+    frame = pd.DataFrame({
+        "stock_name": [rng.choice(TICKERS) for _ in range(n)],
+        "current_value": [_number(rng) for _ in range(n)],
+        "quantity": [_number(rng) for _ in range(n)],
+        "expense_ratio": [_number(rng) for _ in range(n)],
+        "current_price": [_number(rng) for _ in range(n)],
+        "average_price": [_number(rng) for _ in range(n)],
+        "dividend_yield": [_number(rng) for _ in range(n)],
+        "stock_full_name": [_text(rng, ["Gold", "Bonds", "S&P 500"]) for _ in range(n)],
+        "sector": [_text(rng, ["", "Energy"]) for _ in range(n)],
+        "industry": [_text(rng, ["", "Utilities"]) for _ in range(n)],
+        "country": [_text(rng, ["PT", "IE"]) for _ in range(n)],
+        "currency": [_text(rng, ["EUR", "USD"]) for _ in range(n)],
+    })
+    # Zero first, then positive: the merged row takes the first positive value
+    if n > 1 and rng.random() < 0.3:
+        frame.loc[0, "stock_name"] = frame.loc[1, "stock_name"]
+        frame.loc[0, ["expense_ratio", "current_price"]] = 0.0
+        frame.loc[1, ["expense_ratio", "current_price"]] = [0.22, 61.5]
+    dropped = [c for c in OPTIONAL_COLUMNS if rng.random() < 0.15]
+    return frame.drop(columns=dropped).sample(frac=1.0, random_state=rng.randint(0, 10**6)).reset_index(drop=True)
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-9)
+    if a is None or b is None or (isinstance(a, float) and math.isnan(a)) or (isinstance(b, float) and math.isnan(b)):
+        return pd.isna(a) and pd.isna(b)
+    return a == b
+
+
+def test_aggregate_holdings_matches_the_iterrows_baseline():
+    rng = random.Random(25)
+
+    for _ in range(500):
+        rows = _random_rows(rng)
+        aliases = rng.choice([ALIASES, {}])
+
+        expected = _iterrows_baseline(rows, aliases)
+        actual = aggregate_holdings(rows, aliases)
+
+        assert [h["name"] for h in actual] == [h["name"] for h in expected]
+        for got, want in zip(actual, expected):
+            assert set(got) == set(want)
+            for field in want:
+                assert _same(got[field], want[field]), (field, got[field], want[field], rows)
+
+
+def test_aggregate_holdings_of_no_rows():
+    assert aggregate_holdings(pd.DataFrame(columns=["stock_name", "current_value"]), ALIASES) == []
+
+
+def _model(value):
+    return PortfolioModel.from_sheet(prepare_portfolios(pd.DataFrame({
+        "username": ["ana", "ana", "ana", "rui"],
+        "portfolio_name": ["Main", "Main", "Kids", "Main"],
+        "stock_name": ["VWCE.DE", "EGLN.UK", "VWCE.DE", "SPYL.DE"],
+        "current_value": [value, 50.0, 20.0, 10.0],
+        "target_allocation": [90.0, 10.0, 100.0, 100.0],
+        "portfolio_type": ["Other", "Other", "Kids", "Growth & Dividends"],
+    })))
+
+
+def _counting_builds(monkeypatch):
+    builds = []
+
+    def build(model, username, portfolio_name):
+        builds.append((username, portfolio_name))
+        return build_portfolio_state(model, username, portfolio_name)
+
+    monkeypatch.setattr(portfolio_state, "build_portfolio_state", build)
+    return builds
+
+
+def test_prefetch_builds_every_portfolio_once(monkeypatch):
+    builds = _counting_builds(monkeypatch)
+    states = PortfolioStates(workers=2)
+    model = _model(100.0)
+
+    assert states.prefetch(model, "ana", 1) == 2
+    assert states.prefetch(model, "ana", 1) == 0
+    for name in ("Main", "Kids"):
+        assert states.get(model, "ana", name, 1) == build_portfolio_state(model, "ana", name)
+
+    assert sorted(builds) == [("ana", "Kids"), ("ana", "Main")]
+
+
+def test_prefetch_drops_older_versions(monkeypatch):
+    builds = _counting_builds(monkeypatch)
+    states = PortfolioStates(workers=2)
+    old, new = _model(100.0), _model(300.0)
+    states.prefetch(old, "ana", 1)
+    states.prefetch(old, "rui", 1)
+    states.get(old, "ana", "Main", 1)
+
+    states.prefetch(new, "ana", 2)
+
+    assert states.get(new, "ana", "Main", 2)["stocks"][0]["current_value"] == 300.0
+    # Version 1 of ana is built again, rui's states are untouched
+    assert states.get(old, "ana", "Main", 1)["stocks"][0]["current_value"] == 100.0
+    states.get(old, "rui", "Main", 1)
+    assert builds.count(("ana", "Main")) == 3
+    assert builds.count(("rui", "Main")) == 1
+
+
+def test_get_returns_a_copy_the_session_can_edit():
+    states = PortfolioStates(workers=1)
+    model = _model(100.0)
+    states.prefetch(model, "ana", 1)
+
+    state = states.get(model, "ana", "Main", 1)
+    state["stocks"][0]["current_value"] = -1.0
+    state["stocks"].append({"name": "NEW"})
+    state["widgets"]["Main_monthly_invest"] = -1.0
+
+    again = states.get(model, "ana", "Main", 1)
+    assert again["stocks"][0]["current_value"] == 100.0
+    assert [s["name"] for s in again["stocks"]] == ["VWCE.DE", "EGLN.UK"]
+    assert again["widgets"]["Main_monthly_invest"] == 1000.0
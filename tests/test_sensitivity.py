@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from allocation_engine import calculate_growth_dividends_buys
+from sensitivity import buy_surface
+from vectorized_engine import ASSETS
+
+HOLDINGS = [
+    dict(zip(ASSETS, [4200.0, 900.0, 300.0, 650.0, 800.0, 120.0, 95.0, 150.0, 60.0])),
+    # No gold or bonds yet: the defensive transition can use up small contributions
+    dict(zip(ASSETS, [30000.0, 8000.0, 2500.0, 4000.0, 5000.0, 900.0, 700.0, 0.0, 0.0])),
+    {},
+]
+CONTRIBUTIONS = [50.0, 195.0, 1000.0]
+
+
+@pytest.mark.parametrize("holdings", HOLDINGS)
+def test_surface_matches_the_scalar_engine(holdings):
+    surface = buy_surface(holdings, CONTRIBUTIONS, buffett_range=(80.0, 260.0, 5.0), age_range=(30, 70))
+
+    assert surface["buys"].shape == (len(CONTRIBUTIONS), 41, len(surface["buffett"]), len(ASSETS))
+    for c, contribution in enumerate(CONTRIBUTIONS):
+        for a, age in enumerate(surface["ages"]):
+            for b, buffett in enumerate(surface["buffett"]):
+                args = (int(age), float(buffett), dict(holdings), contribution)
+                buys = surface["buys"][c, a, b]
+                if np.isnan(surface["leftover_cash"][c, a, b]):
+                    assert np.isnan(buys).all()
+                    with pytest.raises(ValueError):
+                        calculate_growth_dividends_buys(*args)
+                    continue
+                expected = calculate_growth_dividends_buys(*args)
+                assert dict(zip(ASSETS, buys.tolist())) == pytest.approx(expected["buys"], abs=1e-9)
+                assert surface["leftover_cash"][c, a, b] == pytest.approx(expected["leftover_cash"], abs=1e-9)
+
+
+def test_surface_marks_infeasible_cells():
+    surface = buy_surface(HOLDINGS[1], CONTRIBUTIONS, buffett_range=(80.0, 260.0, 5.0))
+
+    infeasible = np.isnan(surface["leftover_cash"])
+    assert infeasible[0].any()
+    # A larger contribution only clears cells
+    assert (infeasible[-1] <= infeasible[0]).all() and not infeasible[-1].all()
+    # Orders plus leftover cash spend exactly the contribution, never a cent more
+    spent = surface["buys"].sum(axis=-1) + surface["leftover_cash"]
+    contribution = np.broadcast_to(np.array(CONTRIBUTIONS)[:, None, None], spent.shape)
+    assert np.allclose(spent[~infeasible], contribution[~infeasible])
+
+
+def test_surface_is_cached_and_read_only():
+    first = buy_surface(HOLDINGS[0], CONTRIBUTIONS)
+
+    assert buy_surface(dict(HOLDINGS[0]), list(CONTRIBUTIONS)) is first
+    with pytest.raises(ValueError):
+        first["buys"][0, 0, 0, 0] = 1.0
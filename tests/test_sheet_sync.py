@@ -0,0 +1,155 @@
+import random
+import time
+
+import pandas as pd
+
+from local_sheets import LocalSheetsConnection
+from sheet_sync import ROW_KEYS, VERSION_SHEET, ChangeTokens, DeltaSync, apply_delta, diff_frames, sheet_order
+
+
+def _portfolio_rows(rng, count):
+    return pd.DataFrame([
+        {
+            "username": rng.choice(["ana", "rui"]),
+            "portfolio_name": rng.choice(["Main", "Kids"]),
+            "stock_name": rng.choice(["VWCE.DE", "IWDA.AS", "RENE.PT", "EGLN.UK"]),
+            "current_value": round(rng.uniform(0, 900), 2),
+            "target_allocation": rng.choice([10, 25, 40]),
+        }
+        for _ in range(count)
+    ], columns=["username", "portfolio_name", "stock_name", "current_value", "target_allocation"])
+
+
+def test_applied_delta_reproduces_the_target_frame(tmp_path):
+    rng = random.Random(4)
+    conn = LocalSheetsConnection(str(tmp_path))
+    key = ROW_KEYS["Portfolios"]
+    conn.create(worksheet="Portfolios")
+
+    for _ in range(25):
+        before = _portfolio_rows(rng, rng.randint(1, 12))
+        conn.update(worksheet="Portfolios", data=before)
+        # Edit, drop and add rows (duplicate keys included)
+        after = before.sample(frac=rng.uniform(0.3, 1.0), random_state=rng.randint(0, 999))
+        after = after.assign(current_value=[
+            v if rng.random() < 0.5 else round(rng.uniform(0, 900), 2) for v in after["current_value"]
+        ])
+        after = pd.concat([after, _portfolio_rows(rng, rng.randint(1, 4))], ignore_index=True)
+
+        apply_delta(conn.open_spreadsheet().worksheet("Portfolios"), diff_frames(before, after, key))
+
+        expected = sheet_order(before, after, key)
+        sheet = conn.read(worksheet="Portfolios", ttl=0)
+        assert len(sheet) == len(expected)
+        if len(expected):
+            pd.testing.assert_frame_equal(sheet.astype(str), expected.astype(str), check_dtype=False)
+
+
+def _instance(conn, tokens):
+    """One app process: delta uploads, then a published token recorded by `mark`."""
+    sync = DeltaSync(
+        conn.update,
+        conn.open_spreadsheet().worksheet,
+        remote_token=lambda worksheet: tokens.remote().get(worksheet),
+        remote_revision=conn.open_spreadsheet().get_lastUpdateTime,
+        create=conn.create,
+    )
+
+    def upload(worksheet, data):
+        sync(worksheet, data)
+        sync.mark(worksheet, tokens.publish(worksheet))
+
+    return sync, upload
+
+
+def test_delta_is_not_sent_over_another_process_upload(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path))
+    tokens = ChangeTokens(conn.read, conn.open_spreadsheet().worksheet, conn.create)
+    first, upload_first = _instance(conn, tokens)
+    second, upload_second = _instance(conn, tokens)
+    rows = pd.DataFrame({
+        "username": ["ana"] * 4,
+        "portfolio_name": ["Main"] * 4,
+        "stock_name": ["VWCE.DE", "IWDA.AS", "RENE.PT", "EGLN.UK"],
+        "current_value": [100.0, 200.0, 300.0, 400.0],
+    })
+
+    upload_first("Portfolios", rows)
+    # Another process drops the first row: positions shift under the first snapshot
+    upload_second("Portfolios", rows.iloc[1:])
+    edited = rows.assign(current_value=[100.0, 200.0, 300.0, 450.0])
+    upload_first("Portfolios", edited)
+
+    assert first.stale_rewrites == 1
+    assert conn.read(worksheet="Portfolios", ttl=0)["current_value"].tolist() == [100.0, 200.0, 300.0, 450.0]
+
+    # Unchanged since its own upload: a plain delta
+    rewrites = conn.calls["update"]
+    upload_first("Portfolios", edited.assign(current_value=[100.0, 200.0, 350.0, 450.0]))
+    assert first.stale_rewrites == 1
+    assert conn.calls["update"] == rewrites
+
+
+def test_delta_is_not_sent_over_a_hand_edit(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path))
+    tokens = ChangeTokens(conn.read, conn.open_spreadsheet().worksheet, conn.create)
+    sync, upload = _instance(conn, tokens)
+    rows = pd.DataFrame({
+        "username": ["ana"] * 3,
+        "portfolio_name": ["Main"] * 3,
+        "stock_name": ["VWCE.DE", "IWDA.AS", "RENE.PT"],
+        "current_value": [100.0, 200.0, 300.0],
+    })
+
+    upload("Portfolios", rows)
+    time.sleep(0.01)
+    conn.open_spreadsheet().worksheet("Portfolios").delete_rows(2)
+    upload("Portfolios", rows.assign(current_value=[100.0, 200.0, 350.0]))
+
+    assert sync.stale_rewrites == 1
+    assert conn.read(worksheet="Portfolios", ttl=0)["stock_name"].tolist() == ["VWCE.DE", "IWDA.AS", "RENE.PT"]
+
+
+def test_worksheet_handle_is_opened_once(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path))
+    tokens = ChangeTokens(conn.read, conn.open_spreadsheet().worksheet, conn.create)
+    sync, upload = _instance(conn, tokens)
+    rows = pd.DataFrame({
+        "username": ["ana"] * 3,
+        "portfolio_name": ["Main"] * 3,
+        "stock_name": ["VWCE.DE", "IWDA.AS", "RENE.PT"],
+        "current_value": [100.0, 200.0, 300.0],
+    })
+
+    upload("Portfolios", rows)
+    conn.calls.clear()
+    for value in (310.0, 320.0, 330.0):
+        upload("Portfolios", rows.assign(current_value=[100.0, 200.0, value]))
+
+    # One rewrite, then a single call per delta
+    assert sync.api_calls == 4
+    # One handle for Portfolios, one for the change tokens
+    assert conn.calls["worksheet"] == 2
+
+
+def test_concurrent_publishes_keep_each_other_token(tmp_path):
+    conn = LocalSheetsConnection(str(tmp_path))
+    open_worksheet = conn.open_spreadsheet().worksheet
+    tokens = ChangeTokens(conn.read, open_worksheet, conn.create)
+    tokens.publish("Portfolios")
+    tokens.publish("Dividends")
+    before = conn.read(worksheet=VERSION_SHEET)
+
+    # The second process decides from markers read before the first one published
+    first = ChangeTokens(conn.read, open_worksheet, conn.create)
+    second = ChangeTokens(lambda **kwargs: before.copy(), open_worksheet, conn.create)
+    portfolios_token = first.publish("Portfolios")
+    dividends_token = second.publish("Dividends")
+    log_token = second.publish("InvestmentLog")
+
+    assert tokens.remote() == {
+        "Portfolios": portfolios_token,
+        "Dividends": dividends_token,
+        "InvestmentLog": log_token,
+    }
+    assert conn.calls["update"] == 0
@@ -0,0 +1,52 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from simulation import DEFAULT_ASSET_RETURNS, contribution_schedule, month_dates, simulate_paths
+from vectorized_engine import ASSETS
+
+START = date(2026, 1, 31)
+HOLDINGS = dict(zip(ASSETS, [4200.0, 900.0, 300.0, 650.0, 800.0, 120.0, 95.0, 150.0, 60.0]))
+FLAT_RETURNS = dict.fromkeys(ASSETS, (0.0, 0.0))
+
+
+def test_contribution_schedule_follows_the_calendar():
+    schedule = contribution_schedule(24, START, extra_monthly=25.0)
+
+    # June 2026 override, then June and December doubled
+    expected = [525.0] * 24
+    expected[5], expected[11], expected[17], expected[23] = 931.19, 1025.0, 1025.0, 1025.0
+    assert schedule.tolist() == pytest.approx(expected)
+
+
+def test_month_dates_clip_to_month_end():
+    assert month_dates(4, START).astype(str).tolist() == ["2026-01-31", "2026-02-28", "2026-03-31", "2026-04-30"]
+
+
+def test_flat_returns_invest_exactly_the_contribution_calendar():
+    contributions = contribution_schedule(36, START)
+
+    paths = simulate_paths(
+        64, "1990-03-15", 150.0, HOLDINGS, contributions, asset_returns=FLAT_RETURNS, seed=3, start=START,
+    )
+
+    # Without growth, month-end wealth is the holdings plus every contribution so far
+    expected = sum(HOLDINGS.values()) + np.cumsum(contributions)
+    assert np.allclose(paths["wealth"], expected[None, :], rtol=0, atol=0.02)
+    assert (paths["cash"] >= 0).all()
+    # Leftover cash is carried, not lost: it stays below the smallest order
+    assert (paths["cash"] < 5.0 * len(ASSETS)).all()
+
+
+def test_seeded_runs_repeat():
+    contributions = contribution_schedule(24, START)
+    args = (32, "1990-03-15", 150.0, HOLDINGS, contributions)
+
+    first = simulate_paths(*args, asset_returns=DEFAULT_ASSET_RETURNS, seed=7, start=START)
+    again = simulate_paths(*args, asset_returns=DEFAULT_ASSET_RETURNS, seed=7, start=START)
+    other = simulate_paths(*args, asset_returns=DEFAULT_ASSET_RETURNS, seed=8, start=START)
+
+    for metric in first:
+        assert np.array_equal(first[metric], again[metric])
+    assert not np.array_equal(first["wealth"], other["wealth"])
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+import pytest
+
+from tax_rebalance import DEFAULT_DRIFT_AVERSION, DEFAULT_TAX_RATE, INSIDE_BAND_WEIGHT, rebalance_with_sells
+
+
+def _cost(trades, values, basis, targets, tolerances, cash):
+    """The documented objective for trade arrays (one column per holding)."""
+    total = values.sum() + cash
+    centers = total * targets / targets.sum()
+    band = total * np.minimum(tolerances, targets / targets.sum() * 100.0) / 100.0
+    deviation = values + trades - centers
+    outside = np.maximum(0.0, np.abs(deviation) - band)
+    drift = DEFAULT_DRIFT_AVERSION / total * (outside ** 2 + INSIDE_BAND_WEIGHT * deviation ** 2).sum(axis=-1)
+    gain_fraction = np.where(basis > 0, np.maximum(1.0 - basis / values, 0.0), 0.0)
+    return drift + DEFAULT_TAX_RATE * (gain_fraction * np.maximum(-trades, 0.0)).sum(axis=-1)
+
+
+def test_two_holding_rebalance_matches_grid_search():
+    rng = random.Random(9)
+
+    for _ in range(40):
+        values = np.array([round(rng.uniform(100, 3000), 2) for _ in range(2)])
+        basis = np.array([rng.choice([0.0, round(v * rng.uniform(0.3, 1.5), 2)]) for v in values])
+        targets = np.array([rng.choice([20.0, 50.0, 70.0]) for _ in range(2)])
+        tolerances = np.array([rng.choice([0.0, 2.0, 5.0]) for _ in range(2)])
+        cash = rng.choice([0.0, round(rng.uniform(0, 500), 2)])
+        stocks = [
+            {"name": name, "current_value": v, "quantity": b / 10.0, "average_price": 10.0}
+            for name, v, b in zip(("A", "B"), values, basis)
+        ]
+
+        result = rebalance_with_sells(
+            stocks, dict(zip("AB", targets)), dict(zip("AB", tolerances)), cash, min_trade=0.0,
+        )
+        trades = np.array([row["trade"] for row in result["trades"]])
+
+        # Every cent split of the cash between the two holdings that sells no more than allowed
+        lower = np.where(basis > 0, -values, 0.0)
+        first = np.arange(round(lower[0] * 100), round((cash - lower[1]) * 100) + 1) / 100.0
+        grid = np.stack([first, cash - first], axis=1)
+        best = _cost(grid, values, basis, targets, tolerances, cash).min()
+
+        assert (trades >= lower - 1e-9).all()
+        assert trades.sum() == pytest.approx(cash, abs=0.02)
+        assert _cost(trades, values, basis, targets, tolerances, cash) == pytest.approx(best, abs=0.01)
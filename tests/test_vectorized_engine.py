@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from allocation_engine import allocate_orders, calculate_growth_dividends_buys, calculate_monthly_buys
+from vectorized_engine import (
+    ASSETS,
+    allocate_orders_vectorized,
+    buys_to_dicts,
+    calculate_growth_dividends_buys_vectorized,
+    calculate_monthly_buys_vectorized,
+    spyl_level,
+)
+
+
+def _scenarios(seed, n=300):
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.uniform(0, 3000, size=(n, len(ASSETS))), 2)
+    # Some empty portfolios and some missing holdings
+    values[rng.random(n) < 0.1] = 0.0
+    values[rng.random(values.shape) < 0.2] = 0.0
+    ages = rng.integers(18, 80, size=n)
+    # Buffett indicator in percent, across and beyond the 100-230 band
+    buffett = np.round(rng.uniform(60, 280, size=n), 2)
+    contributions = np.round(rng.choice([50.0, 100.0, 195.0, 1000.0], size=n) + rng.uniform(0, 1, size=n), 2)
+    return ages, buffett, values, contributions
+
+
+def test_scenarios_cover_the_spyl_levels():
+    _, buffett, _, _ = _scenarios(11)
+
+    levels = set(spyl_level(buffett).tolist())
+    assert {50, 70} <= levels
+    assert len(levels) > 15
+
+
+def test_allocate_orders_vectorized_matches_scalar():
+    rng = np.random.default_rng(3)
+    raw = np.round(rng.uniform(0, 60, size=(500, len(ASSETS))), 2)
+    raw[rng.random(raw.shape) < 0.3] = 0.0
+    # Exact remainder ties, also after float noise
+    raw[:50] = np.tile([12.5, 87.5, 0, 0, 0, 0, 0, 0, 0], (50, 1))[:, :len(ASSETS)]
+    raw[25:50, :2] += [[1e-12, -1e-12]]
+    budgets = np.round(raw.sum(axis=1) + rng.uniform(-5, 5, size=500), 2)
+
+    orders, leftover = allocate_orders_vectorized(raw, budgets)
+    for i in range(len(raw)):
+        expected, expected_leftover = allocate_orders(dict(zip(ASSETS, raw[i])), budgets[i])
+        assert dict(zip(ASSETS, orders[i].tolist())) == pytest.approx(expected, abs=1e-9)
+        assert leftover[i] == pytest.approx(expected_leftover, abs=1e-9)
+
+
+def test_monthly_buys_vectorized_matches_scalar():
+    ages, buffett, values, contributions = _scenarios(11)
+
+    result = calculate_monthly_buys_vectorized(ages, buffett, values, contributions)
+    for i, buys in enumerate(buys_to_dicts(result)):
+        expected = calculate_monthly_buys(int(ages[i]), buffett[i], dict(zip(ASSETS, values[i])), contributions[i])
+        assert buys == pytest.approx(expected["buys"], abs=1e-9)
+        assert result["leftover_cash"][i] == pytest.approx(expected["leftover_cash"], abs=1e-9)
+
+
+def test_growth_dividends_buys_vectorized_matches_scalar():
+    ages, buffett, values, contributions = _scenarios(12)
+
+    result = calculate_growth_dividends_buys_vectorized(ages, buffett, values, contributions, cap_defensive=True)
+    for i, buys in enumerate(buys_to_dicts(result)):
+        args = (int(ages[i]), buffett[i], dict(zip(ASSETS, values[i])), contributions[i])
+        if result["infeasible"][i]:
+            with pytest.raises(ValueError):
+                calculate_growth_dividends_buys(*args)
+            continue
+        assert buys == pytest.approx(calculate_growth_dividends_buys(*args)["buys"], abs=1e-9)
@@ -0,0 +1,131 @@
+import itertools
+import math
+import random
+import time
+
+import pytest
+
+from allocation_engine import min_order_for
+from whole_shares import allocate_whole_shares
+
+
+def _brute_force(current_values, prices, target_values, budget, min_order_size, exhaustive=False):
+    """
+    Smallest squared drift over every affordable quantity combination.
+
+    Unless `exhaustive`, a holding is never bought past the smallest order
+    that covers its gap, so larger cases stay enumerable.
+    """
+    tickers = [t for t in target_values if prices.get(t, 0.0) > 0]
+    choices = []
+    for t in tickers:
+        gap = target_values[t] - current_values.get(t, 0.0)
+        min_qty = max(1, math.ceil(min_order_for(t, min_order_size) / prices[t] - 1e-9))
+        affordable = math.floor(budget / prices[t] + 1e-9)
+        if exhaustive:
+            upper = affordable
+        else:
+            upper = max(0, min(affordable, max(math.ceil(gap / prices[t]), min_qty))) if gap > 0 else 0
+        choices.append([0] + list(range(min_qty, upper + 1)))
+
+    best = math.inf
+    for quantities in itertools.product(*choices):
+        if sum(q * prices[t] for q, t in zip(quantities, tickers)) > budget + 1e-9:
+            continue
+        best = min(best, sum(
+            (current_values.get(t, 0.0) + q * prices[t] - target_values[t]) ** 2 for q, t in zip(quantities, tickers)
+        ))
+    return best
+
+
+def test_whole_shares_match_brute_force():
+    rng = random.Random(5)
+    names = ["RENE.PT", "VWCE.DE", "IWDA.AS", "EGLN.UK"]
+
+    for _ in range(60):
+        tickers = rng.sample(names, rng.randint(1, len(names)))
+        prices = {t: rng.choice([0.0, round(rng.uniform(2, 120), 2)]) for t in tickers}
+        current_values = {t: round(rng.uniform(0, 500), 2) for t in tickers}
+        budget = round(rng.uniform(20, 300), 2)
+        target_values = {t: current_values[t] + rng.uniform(0, budget) for t in tickers}
+        min_order_size = rng.choice([0.0, 5.0, 25.0])
+
+        result = allocate_whole_shares(current_values, prices, target_values, budget, min_order_size)
+
+        assert result["optimal"]
+        assert result["spent"] <= budget + 1e-9
+        assert sorted(result["skipped"]) == sorted(t for t in tickers if prices[t] <= 0)
+        for t, q in result["quantities"].items():
+            assert q == 0 or q * prices[t] >= min_order_for(t, min_order_size) - 1e-9
+        drift = sum(
+            (current_values[t] + q * prices[t] - target_values[t]) ** 2 for t, q in result["quantities"].items()
+        )
+        assert drift == pytest.approx(_brute_force(current_values, prices, target_values, budget, min_order_size), abs=1e-6)
+
+
+def test_minimum_order_above_the_desired_value_is_still_considered():
+    result = allocate_whole_shares({"RENE.PT": 0.0}, {"RENE.PT": 1.22}, {"RENE.PT": 4.0}, 20.0, 5.0)
+
+    assert result["optimal"]
+    assert result["quantities"] == {"RENE.PT": 5}
+
+
+def test_small_cases_match_exhaustive_search():
+    rng = random.Random(11)
+    names = ["RENE.PT", "EDP.PT", "VWCE.DE"]
+
+    for _ in range(150):
+        tickers = rng.sample(names, rng.randint(1, len(names)))
+        prices = {t: round(rng.uniform(0.8, 4.0), 2) for t in tickers}
+        current_values = {t: round(rng.uniform(0, 20), 2) for t in tickers}
+        budget = round(rng.uniform(4, 14), 2)
+        target_values = {t: current_values[t] + rng.uniform(0, budget) for t in tickers}
+        min_order_size = rng.choice([0.0, 5.0])
+
+        result = allocate_whole_shares(current_values, prices, target_values, budget, min_order_size)
+
+        assert result["optimal"]
+        drift = sum(
+            (current_values[t] + q * prices[t] - target_values[t]) ** 2 for t, q in result["quantities"].items()
+        )
+        expected = _brute_force(current_values, prices, target_values, budget, min_order_size, exhaustive=True)
+        assert drift == pytest.approx(expected, abs=1e-6)
+
+
+def _large_case(seed, n, scale):
+    rng = random.Random(seed)
+    tickers = [f"T{i}.PT" if i % 3 == 0 else f"T{i}.DE" for i in range(n)]
+    prices = {t: round(rng.choice([rng.uniform(1, 20), rng.uniform(20, 600)]), 2) for t in tickers}
+    current_values = {t: round(rng.uniform(0, 3000), 2) for t in tickers}
+    weights = [rng.random() for _ in tickers]
+    target_values = {t: current_values[t] + scale * 5000.0 * w / sum(weights) for t, w in zip(tickers, weights)}
+    return current_values, prices, target_values
+
+
+@pytest.mark.parametrize("n", [50, 80])
+def test_large_allocations_of_the_budget_are_proven_optimal(n):
+    current_values, prices, target_values = _large_case(n, n, 1.0)
+
+    started = time.perf_counter()
+    result = allocate_whole_shares(current_values, prices, target_values, 5000.0, 5.0)
+
+    assert time.perf_counter() - started < 0.08
+    assert result["optimal"]
+    assert result["spent"] <= 5000.0
+
+
+def test_time_cap_covers_the_whole_call():
+    current_values, prices, target_values = _large_case(3, 80, 3.0)
+
+    def squared(result):
+        return sum((current_values[t] + q * prices[t] - target_values[t]) ** 2 for t, q in result["quantities"].items())
+
+    greedy = allocate_whole_shares(current_values, prices, target_values, 5000.0, 5.0, max_nodes=1)
+    started = time.perf_counter()
+    result = allocate_whole_shares(current_values, prices, target_values, 5000.0, 5.0, time_limit=0.02)
+    elapsed = time.perf_counter() - started
+
+    assert not result["optimal"]
+    assert elapsed < 0.02 + 0.01
+    assert result["spent"] <= 5000.0
+    assert squared(result) <= squared(greedy) + 1e-6
@@ -0,0 +1,356 @@
+"""
+NumPy-vectorized allocation engine.
+
+Array versions of the `allocation_engine` rules for sweeping thousands of
+scenarios at once. Every scenario is one row of an (N scenarios x 9 assets)
+array whose columns follow `GROWTH_DIVIDENDS_TICKERS`; the results match the
+scalar functions exactly.
+"""
+
+from typing import Dict, Any, List, Sequence
+
+import numpy as np
+
+from allocation_engine import (
+    GROWTH_DIVIDENDS_TICKERS,
+    LIFECYCLE_AGE_BOUNDS,
+    SPYL_LEVELS,
+    TARGET_TABLE,
+    TOLERANCE_PP,
+    exclude_defensive_targets,
+    growth_split_for_level,
+    min_order_for,
+)
+from glide_path import lifecycle_weights
+
+ASSETS = GROWTH_DIVIDENDS_TICKERS
+TOLERANCE_ARRAY = np.array([TOLERANCE_PP[asset] for asset in ASSETS])
+
+# (phase x SPYL level x asset) views of the engine's precomputed target table
+TARGETS_BY_BAND_LEVEL = np.array([
+    [[entry["targets"][asset] for asset in ASSETS] for entry in row]
+    for row in TARGET_TABLE
+])
+TARGETS_BY_BAND_LEVEL_EXCLUDING_DEFENSIVE = np.array([
+    [[exclude_defensive_targets(entry["targets"])[asset] for asset in ASSETS] for entry in row]
+    for row in TARGET_TABLE
+])
+
+_AGE_BOUNDS = np.array(LIFECYCLE_AGE_BOUNDS)
+
+# (SPYL level x [SPYL, IXUA, VFEA]) growth block splits
+GROWTH_SPLIT_BY_LEVEL = np.array([
+    [growth_split_for_level(level)[asset] for asset in ("SPYL.DE", "IXUA.DE", "VFEA.DE")]
+    for level in SPYL_LEVELS
+])
+_DEFENSIVE = np.array([asset in ("EGLN.UK", "YCSH.DE") for asset in ASSETS])
+
+
+def values_to_array(current_values: Sequence[Dict[str, float]]) -> np.ndarray:
+    """Converts a list of `{ticker: value}` dicts into an (N x 9) value array."""
+    return np.array(
+        [[float(values.get(asset, 0.0)) for asset in ASSETS] for values in current_values],
+        dtype=float,
+    ).reshape(len(current_values), len(ASSETS))
+
+
+def lifecycle_band(ages) -> np.ndarray:
+    """Index of the `get_lifecycle_targets` phase for each age (0 = under 40)."""
+    return np.searchsorted(_AGE_BOUNDS, np.asarray(ages), side="right")
+
+
+def spyl_level(buffett_indices) -> np.ndarray:
+    """Vectorized SPYL.DE growth weight of `calculate_growth_split` (integer 50-70)."""
+    buffett = np.asarray(buffett_indices, dtype=float)
+    target_spyl = 70.0 - ((buffett - 100.0) / (230.0 - 100.0)) * (70.0 - 50.0)
+    return np.rint(np.clip(target_spyl, 50.0, 70.0)).astype(int)
+
+
+def targets_array(ages, buffett_indices, exclude_defensive: bool = False, glide: str = "step") -> np.ndarray:
+    """
+    Returns the (N x 9) portfolio target weights for each (age, buffett_index) row.
+
+    `glide="step"` reads the precomputed phase table; "linear" and "smooth"
+    glide the lifecycle weights between phases (see `glide_path`) and apply
+    the growth split the same way `_combine_targets` does.
+    """
+    ages, buffett = np.broadcast_arrays(np.asarray(ages), np.asarray(buffett_indices, dtype=float))
+    levels = spyl_level(buffett.ravel()) - SPYL_LEVELS[0]
+    if glide == "step":
+        table = TARGETS_BY_BAND_LEVEL_EXCLUDING_DEFENSIVE if exclude_defensive else TARGETS_BY_BAND_LEVEL
+        return table[lifecycle_band(ages.ravel()), levels]
+
+    lifecycle = lifecycle_weights(ages.ravel(), glide)
+    split = GROWTH_SPLIT_BY_LEVEL[levels]
+    growth = lifecycle[:, 0]
+    spyl = round2(growth * split[:, 0] / 100.0)
+    vfea = round2(growth * split[:, 2] / 100.0)
+    ixua = round2(growth - spyl - vfea)
+    # ASSETS order: the growth block, then the other lifecycle columns
+    targets = np.column_stack([spyl, ixua, vfea, lifecycle[:, 1:]])
+
+    if exclude_defensive:
+        remaining_sum = 100.0 - targets[:, _DEFENSIVE].sum(axis=1)
+        scale = np.where(remaining_sum > 0, 100.0 / np.where(remaining_sum > 0, remaining_sum, 1.0), 1.0)
+        targets = np.where(_DEFENSIVE, 0.0, targets * scale[:, None])
+    return targets
+
+
+def round2(values: np.ndarray) -> np.ndarray:
+    """
+    Rounds to 2 decimals exactly like Python's `round(x, 2)`.
+
+    `np.round` scales by 100 first, which can land on a .5 tie that the
+    decimal value does not have; those few elements fall back to `round`.
+    """
+
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, 2)
+    scaled = values * 100.0
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if ties.any():
+        rounded[ties] = [round(float(v), 2) for v in values[ties]]
+    return rounded
+
+
+def _row_sum(matrix: np.ndarray) -> np.ndarray:
+    """Sums columns left to right so totals match the scalar `sum()` bit for bit."""
+    total = np.zeros(matrix.shape[0])
+    for col in range(matrix.shape[1]):
+        total = total + matrix[:, col]
+    return total
+
+
+def allocate_orders_vectorized(raw_buys: np.ndarray, budgets, min_order_size: float = 5.0, invest_cents: bool = True):
+    """
+    Row-wise `allocate_orders` (largest-remainder whole-euro rounding).
+
+    Returns (orders, leftover_cash) with the same values as the scalar
+    function applied to every row.
+    """
+
+    raw_buys = np.asarray(raw_buys, dtype=float)
+    n = raw_buys.shape[0]
+    budgets = np.broadcast_to(np.asarray(budgets, dtype=float), (n,))
+    budget_cents = np.rint(budgets * 100.0)
+
+    min_orders = np.array([min_order_for(asset, min_order_size) for asset in ASSETS])
+    eligible = (raw_buys > 0) & (raw_buys >= min_orders)
+
+    while True:
+        total_raw = _row_sum(np.where(eligible, raw_buys, 0.0))
+        active = eligible.any(axis=1) & (total_raw > 0) & (budget_cents > 0)
+        eligible &= active[:, None]
+
+        # Raw buys rescaled to the budget, in cents
+        safe_total = np.where(active, total_raw, 1.0)
+        scaled = np.where(eligible, np.round(raw_buys * budget_cents[:, None] / safe_total[:, None], 6), 0.0)
+        # Orders a short budget shrinks below their minimum are dropped, then rescaled
+        too_small = eligible & (scaled < 100.0 * min_orders)
+        if not too_small.any():
+            break
+        eligible &= ~too_small
+
+    euros = np.floor_divide(scaled, 100.0)
+    remainders = np.where(eligible, scaled - 100.0 * euros, -np.inf)
+
+    missing_euros = np.floor_divide(budget_cents - 100.0 * _row_sum(euros), 100.0)
+    rank = np.argsort(np.argsort(-remainders, axis=1, kind="stable"), axis=1)
+    euros = euros + (eligible & (rank < missing_euros[:, None]))
+
+    cents = 100.0 * euros
+    left_cents = np.where(active, budget_cents - _row_sum(cents), 0.0)
+    if invest_cents:
+        residuals = np.where(eligible, scaled - cents, -np.inf)
+        rows = np.nonzero(active & (left_cents > 0))[0]
+        cents[rows, np.argmax(residuals[rows], axis=1)] += left_cents[rows]
+        left_cents = np.where(active, 0.0, left_cents)
+
+    orders = cents / 100.0
+    leftover_cash = np.where(active, left_cents / 100.0, round2(budgets))
+    return orders, leftover_cash
+
+
+def calculate_monthly_buys_vectorized(
+    ages,
+    buffett_indices,
+    current_values: np.ndarray,
+    monthly_contributions,
+    min_order_size: float = 5.0,
+    exclude_defensive: bool = False,
+    glide: str = "step",
+) -> Dict[str, Any]:
+    """
+    Vectorized `calculate_monthly_buys` over N scenarios.
+
+    `current_values` is an (N x 9) array in `ASSETS` order; ages, Buffett
+    indices and contributions are scalars or length-N arrays. Returns arrays
+    with the same (rounded) numbers as the scalar function, row by row.
+    `percentage_gaps` and `eligible` are zero/False for empty portfolios.
+    `glide` selects stepped or interpolated lifecycle targets (`targets_array`).
+    """
+
+    current_values = np.asarray(current_values, dtype=float)
+    if current_values.ndim != 2 or current_values.shape[1] != len(ASSETS):
+        raise ValueError(f"current_values must have shape (N, {len(ASSETS)}).")
+
+    n = current_values.shape[0]
+    contributions = np.broadcast_to(np.asarray(monthly_contributions, dtype=float), (n,))
+    ages = np.broadcast_to(np.asarray(ages), (n,))
+    buffett = np.broadcast_to(np.asarray(buffett_indices, dtype=float), (n,))
+
+    targets = targets_array(ages, buffett, exclude_defensive, glide)
+
+    portfolio_value = _row_sum(current_values)
+
+    if (portfolio_value < 0).any():
+        raise ValueError("Portfolio value cannot be negative.")
+
+    if (contributions <= 0).any():
+        raise ValueError("Monthly contribution must be positive.")
+
+    empty = portfolio_value == 0
+    safe_value = np.where(empty, 1.0, portfolio_value)
+
+    # Current weights before contribution
+    current_weights = np.where(empty[:, None], 0.0, current_values / safe_value[:, None] * 100.0)
+
+    new_total_value = portfolio_value + contributions
+
+    # Value and percentage gaps to target
+    target_values = new_total_value[:, None] * targets / 100.0
+    value_gaps = np.maximum(0.0, target_values - current_values)
+    percentage_gaps = np.where(empty[:, None], 0.0, np.maximum(0.0, targets - current_weights))
+
+    # Only eligible if below tolerance band
+    eligible = ~empty[:, None] & (percentage_gaps >= TOLERANCE_ARRAY)
+    eligible_gaps = np.where(eligible, value_gaps, 0.0)
+    total_eligible_gap = _row_sum(eligible_gaps)
+
+    by_gap = total_eligible_gap > 0
+    safe_gap = np.where(by_gap, total_eligible_gap, 1.0)
+    raw_buys = np.where(
+        by_gap[:, None],
+        contributions[:, None] * eligible_gaps / safe_gap[:, None],
+        contributions[:, None] * targets / 100.0,
+    )
+
+    # Whole-euro orders closest to the proportional buys
+    buys, leftover_cash = allocate_orders_vectorized(raw_buys, contributions, min_order_size)
+
+    return {
+        "assets": list(ASSETS),
+        "ages": np.asarray(ages),
+        "buffett_indices": np.asarray(buffett),
+        "portfolio_value_before": round2(portfolio_value),
+        "monthly_contribution": round2(contributions),
+        "portfolio_value_after": round2(new_total_value),
+        "portfolio_targets": targets,
+        "current_weights": round2(current_weights),
+        "percentage_gaps": round2(percentage_gaps),
+        "eligible": eligible,
+        "raw_buys": round2(raw_buys),
+        "buys": round2(buys),
+        "leftover_cash": round2(leftover_cash),
+    }
+
+
+def buys_to_dicts(result: Dict[str, Any], key: str = "buys") -> List[Dict[str, float]]:
+    """Converts an (N x 9) result array back into per-scenario `{ticker: value}` dicts."""
+    assets = result["assets"]
+    return [dict(zip(assets, row.tolist())) for row in result[key]]
+
+
+def calculate_growth_dividends_buys_vectorized(
+    ages,
+    buffett_indices,
+    current_values: np.ndarray,
+    monthly_contributions,
+    min_order_size: float = 5.0,
+    transition_months: int = 4,
+    cap_defensive: bool = False,
+    glide: str = "step",
+) -> Dict[str, Any]:
+    """
+    Vectorized `calculate_growth_dividends_buys` over N scenarios.
+
+    Runs the first month of the EGLN/PRAB transition plan, then allocates the
+    remaining contribution with `calculate_monthly_buys_vectorized` over the
+    non-defensive assets. Like the scalar version it raises ValueError when the
+    defensive buys use up the whole contribution, unless `cap_defensive` scales
+    them down to fit (used by simulations, which must keep running);
+    `infeasible` marks the rows the scalar version would reject.
+    `glide` selects stepped or interpolated lifecycle targets (`targets_array`).
+    """
+
+    current_values = np.asarray(current_values, dtype=float)
+    n = current_values.shape[0]
+    contributions = np.broadcast_to(np.asarray(monthly_contributions, dtype=float), (n,))
+    ages = np.broadcast_to(np.asarray(ages), (n,))
+    buffett = np.broadcast_to(np.asarray(buffett_indices, dtype=float), (n,))
+
+    targets = targets_array(ages, buffett, glide=glide)
+    egln_col = ASSETS.index("EGLN.UK")
+    prab_col = ASSETS.index("YCSH.DE")
+
+    # First month of calculate_egln_prab_transition_plan
+    portfolio_value = _row_sum(current_values)
+    portfolio_after_contribution = portfolio_value + contributions
+
+    egln_gap = np.maximum(0.0, portfolio_after_contribution * targets[:, egln_col] / 100.0 - current_values[:, egln_col])
+    prab_gap = np.maximum(0.0, portfolio_after_contribution * targets[:, prab_col] / 100.0 - current_values[:, prab_col])
+
+    egln_buy = egln_gap / transition_months
+    prab_buy = prab_gap / transition_months
+    egln_buy = np.where(egln_buy < min_order_size, 0.0, egln_buy)
+    prab_buy = np.where(prab_buy < min_order_size, 0.0, prab_buy)
+
+    # Rows where the scalar engine would reject the contribution
+    infeasible = round2(contributions - round2(egln_buy) - round2(prab_buy)) <= 0
+    if not cap_defensive and infeasible.any():
+        raise ValueError("Monthly contribution must be positive.")
+
+    if cap_defensive:
+        defensive = egln_buy + prab_buy
+        scale = np.where(defensive > contributions, contributions / np.where(defensive > 0, defensive, 1.0), 1.0)
+        egln_buy = egln_buy * scale
+        prab_buy = prab_buy * scale
+
+    egln_buy = round2(egln_buy)
+    prab_buy = round2(prab_buy)
+    remaining = round2(contributions - egln_buy - prab_buy)
+
+    buys = np.zeros_like(current_values)
+    raw_buys = np.zeros_like(current_values)
+    leftover_cash = np.zeros(n)
+
+    rows = np.nonzero(remaining > 0)[0]
+    if len(rows):
+        normal = calculate_monthly_buys_vectorized(
+            ages[rows],
+            buffett[rows],
+            current_values[rows],
+            remaining[rows],
+            min_order_size=min_order_size,
+            exclude_defensive=True,
+            glide=glide,
+        )
+        buys[rows] = normal["buys"]
+        raw_buys[rows] = normal["raw_buys"]
+        leftover_cash[rows] = normal["leftover_cash"]
+
+    buys[:, egln_col] = egln_buy
+    buys[:, prab_col] = prab_buy
+    raw_buys[:, egln_col] = egln_buy
+    raw_buys[:, prab_col] = prab_buy
+
+    return {
+        "assets": list(ASSETS),
+        "portfolio_value_before": round2(portfolio_value),
+        "portfolio_value_after": round2(portfolio_after_contribution),
+        "portfolio_targets": targets,
+        "raw_buys": raw_buys,
+        "buys": buys,
+        "leftover_cash": leftover_cash,
+        "infeasible": infeasible,
+    }
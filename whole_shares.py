@@ -0,0 +1,256 @@
+"""
+Whole-share order generation for brokers that do not sell fractions.
+
+Turns a euro allocation into share quantities: every holding gets an integer
+number of shares so the post-trade values land as close as possible (sum of
+squared euro deviations) to the desired post-trade values, without spending
+more than the budget. The integer problem is a bounded knapsack with a
+separable convex cost, searched by depth-first branch-and-bound: positions are
+branched from the most expensive share down, and every node is bounded by the
+continuous (water-filling) relaxation of the positions still open and by its
+Lagrangian counterpart in whole shares.
+
+The search is a heuristic with a time cap: it starts from a greedy allocation
+and returns the best one found when the cap runs out. When the desired values
+fit the budget (the app's case: current values plus a euro allocation of the
+same budget) the root bound usually proves the greedy allocation optimal
+within a few milliseconds, even for 80 holdings. When they exceed the budget
+by far, dozens of holdings can exhaust the cap; the result is then flagged as
+not proven optimal.
+"""
+
+import heapq
+import math
+import time
+from typing import Dict, Any, List, Sequence, Tuple
+
+from allocation_engine import min_order_for
+
+
+def _relaxation(
+    offsets: List[float],
+    capacities: List[float],
+    budget: float,
+) -> Tuple[float, float]:
+    """
+    Continuous lower bound for the open positions.
+
+    Position i can add between 0 and `capacities[i]` euros to its deviation
+    `offsets[i]` (current minus desired value). Minimizing the sum of squared
+    deviations under the budget fills every position up to a common water
+    level. Returns (bound, level).
+    """
+
+    def deviation(offset, capacity, level):
+        return min(max(level, offset), offset + capacity)
+
+    # Spend grows piecewise linearly with the level: one slope change at
+    # each position's offset and at its offset plus capacity
+    events = sorted(
+        [(o, 1) for o, c in zip(offsets, capacities) if c > 0]
+        + [(o + c, -1) for o, c in zip(offsets, capacities) if c > 0]
+    )
+    level = min(events[0][0], 0.0) if events else 0.0
+    spent = 0.0
+    slope = 0
+    for point, delta in events:
+        point = min(point, 0.0)
+        if point > level:
+            segment = slope * (point - level)
+            if spent + segment >= budget:
+                level += (budget - spent) / slope
+                break
+            spent += segment
+            level = point
+        if point >= 0.0:
+            break
+        slope += delta
+    else:
+        level = 0.0
+
+    bound = sum(deviation(o, c, level) ** 2 for o, c in zip(offsets, capacities))
+    return bound, level
+
+
+def allocate_whole_shares(
+    current_values: Dict[str, float],
+    prices: Dict[str, float],
+    target_values: Dict[str, float],
+    budget: float,
+    min_order_size: float = 0.0,
+    time_limit: float = 0.08,
+    max_nodes: int = 200_000,
+) -> Dict[str, Any]:
+    """
+    Chooses whole-share quantities for every priced holding.
+
+    Rules:
+    - Never sell; total cost never exceeds `budget`.
+    - Minimize the squared distance between post-trade and `target_values`.
+    - A position is either not bought or bought for at least
+      `min_order_for(ticker, min_order_size)` (€5 for .PT listings).
+    - Holdings without a positive price cannot be bought and are skipped.
+
+    The whole call, greedy start included, stops at `time_limit` seconds (or
+    `max_nodes` search nodes) and returns the best allocation found;
+    `optimal` tells whether it was proven optimal.
+    `drift` is the summed absolute post-trade deviation in euros.
+    """
+
+    deadline = time.perf_counter() + time_limit
+    tickers = [t for t in target_values if float(prices.get(t, 0.0) or 0.0) > 0]
+    skipped = [t for t in target_values if t not in tickers]
+
+    # Most expensive shares first: they carry the largest rounding error
+    tickers.sort(key=lambda t: -float(prices[t]))
+    price = [float(prices[t]) for t in tickers]
+    offset = [float(current_values.get(t, 0.0)) - float(target_values[t]) for t in tickers]
+    min_qty = [max(1, math.ceil(min_order_for(t, min_order_size) / p - 1e-9)) for t, p in zip(tickers, price)]
+
+    # Never buy more than one share past the desired value, unless the
+    # minimum order alone takes more shares than that
+    upper = [
+        max(0, min(math.floor(budget / p + 1e-9), max(math.ceil(-o / p), m))) if -o > 0 else 0
+        for o, p, m in zip(offset, price, min_qty)
+    ]
+    upper = [u if u >= m else 0 for u, m in zip(upper, min_qty)]
+    n = len(tickers)
+
+    def cost(i: int, q: int) -> float:
+        return (offset[i] + q * price[i]) ** 2
+
+    # Incumbent: greedy by cost reduction per euro
+    qty = [0] * n
+    truncated = False
+    remaining = budget
+    heap = []
+    for i in range(n):
+        step = min_qty[i]
+        if upper[i] >= step:
+            gain = cost(i, 0) - cost(i, step)
+            if gain > 0:
+                heapq.heappush(heap, (-gain / (step * price[i]), i, step))
+    steps = 0
+    while heap:
+        steps += 1
+        if steps % 256 == 0 and time.perf_counter() > deadline:
+            truncated = True
+            break
+        _, i, step = heapq.heappop(heap)
+        if step * price[i] > remaining + 1e-9:
+            continue
+        qty[i] += step
+        remaining -= step * price[i]
+        if qty[i] < upper[i]:
+            gain = cost(i, qty[i]) - cost(i, qty[i] + 1)
+            if gain > 0:
+                heapq.heappush(heap, (-gain / price[i], i, 1))
+
+    def _integer_bound(k: int, budget_left: float, level: float) -> float:
+        """
+        Lagrangian bound of the open positions with whole shares.
+
+        Pricing the budget at the relaxation's multiplier (-2 * level) splits
+        the problem per position, where each one takes its best allowed whole
+        quantity; this adds every position's rounding error to the continuous
+        bound, which it never undercuts.
+        """
+        multiplier = -2.0 * level
+        total = -multiplier * budget_left
+        for i in range(k, n):
+            top = min(upper[i], math.floor(budget_left / price[i] + 1e-9))
+            best = offset[i] ** 2
+            if top >= min_qty[i]:
+                ideal = min(max((level - offset[i]) / price[i], min_qty[i]), top)
+                for q in {math.floor(ideal), math.ceil(ideal)}:
+                    best = min(best, cost(i, q) + multiplier * q * price[i])
+            total += best
+        return total
+
+    best_qty = list(qty)
+    best_cost = sum(cost(i, q) for i, q in enumerate(qty))
+    nodes = 0
+
+    def search(k: int, budget_left: float, fixed_cost: float, chosen: List[int]) -> bool:
+        """Explores position k onwards; returns False when the node was pruned by its bound."""
+        nonlocal best_qty, best_cost, nodes, truncated
+
+        if k == n:
+            if fixed_cost < best_cost - 1e-9:
+                best_cost, best_qty = fixed_cost, list(chosen)
+            return True
+
+        nodes += 1
+        if nodes >= max_nodes or time.perf_counter() > deadline:
+            truncated = True
+        if truncated:
+            return True
+
+        capacities = [min(upper[i], budget_left / price[i]) * price[i] for i in range(k, n)]
+        bound, level = _relaxation(offset[k:], capacities, budget_left)
+        if fixed_cost + bound >= best_cost - 1e-9:
+            return False
+        # Not monotone in the parent's quantity, so this prune does not stop the fan-out
+        if fixed_cost + _integer_bound(k, budget_left, level) >= best_cost - 1e-9:
+            return True
+
+        top = min(upper[k], math.floor(budget_left / price[k] + 1e-9))
+        center = min(max((level - offset[k]) / price[k], 0.0), top)
+        low, high = math.floor(center), math.floor(center) + 1
+
+        def visit(q: int) -> bool:
+            if 0 < q < min_qty[k]:
+                return True
+            chosen.append(q)
+            explored = search(k + 1, budget_left - q * price[k], fixed_cost + cost(k, q), chosen)
+            chosen.pop()
+            return explored
+
+        # Fan out from the relaxed value; each side stops once its bound prunes
+        down, up = low >= 0, high <= top
+        while (down or up) and not truncated:
+            if down:
+                down = visit(low) and low > 0
+                low -= 1
+            if up:
+                up = visit(high) and high < top
+                high += 1
+        return True
+
+    if n and not truncated:
+        search(0, budget, 0.0, [])
+
+    quantities = dict(zip(tickers, best_qty))
+    orders = {t: round(q * p, 2) for t, q, p in zip(tickers, best_qty, price)}
+    spent = sum(q * p for q, p in zip(best_qty, price))
+    drift = sum(abs(o + q * p) for o, q, p in zip(offset, best_qty, price))
+
+    return {
+        "quantities": quantities,
+        "orders": orders,
+        "spent": round(spent, 2),
+        "leftover_cash": round(budget - spent, 2),
+        "drift": round(drift, 2),
+        "skipped": skipped,
+        "optimal": not truncated,
+        "nodes": nodes,
+    }
+
+
+def whole_share_orders(
+    stocks: Sequence[Dict[str, Any]],
+    euro_orders: Dict[str, float],
+    budget: float,
+    min_order_size: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Converts a euro allocation for the app's stock rows into whole shares.
+
+    The desired post-trade value of each row is its current value plus its
+    euro order; prices come from `current_price`.
+    """
+
+    current_values = {s['name']: float(s.get('current_value', 0.0) or 0.0) for s in stocks}
+    prices = {s['name']: float(s.get('current_price', 0.0) or 0.0) for s in stocks}
+    target_values = {t: current_values[t] + float(euro_orders.get(t, 0.0)) for t in current_values}
+    return allocate_whole_shares(current_values, prices, target_values, budget, min_order_size)